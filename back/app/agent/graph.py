@@ -1,45 +1,99 @@
 """
 LangGraph 工作流定义
 管理所有 Agent 的流转
+
+编译后的工作流图和 checkpoint 在进程内只构建一次（见 get_agent_graph），
+每个请求的数据库会话通过运行配置 config["configurable"]["db_session"] 注入。
+所有 Agent 节点均为异步实现，通过 graph.ainvoke 执行，不阻塞事件循环。
+
+多意图查询（如"ORD-2024-001 什么时候到，另外怎么退货？"）的 order 和 rag 节点在同一步并行执行，
+完成后合并进入一次 llm 调用。并行分支不能写同一个字段，因此这两个节点只返回自己修改的字段，
+两个分支都可能写入的 error 和 degradations 字段通过 merge_errors / merge_degradations 合并。
+
+每个请求带有延迟预算（状态中的 'deadline'，见 app.agent.latency_budget），各节点按剩余时间降级，
+采用过的降级随结果的 'degradations' 字段返回。
 """
-from typing import Dict, Any, Literal
-from typing_extensions import TypedDict
+import asyncio
+import inspect
+import time
+from typing import Dict, Any, AsyncIterator, Callable, List, Literal, Optional, Sequence, Union
+from typing_extensions import Annotated, TypedDict
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, END
-from redis import Redis
+from redis.asyncio import Redis
+from app.agent.intent_classifier import get_intent_classifier
 from app.agent.router_agent import RouterAgent
 from app.agent.order_agent import OrderAgent
 from app.agent.rag_agent import RAGAgent
 from app.agent.llm_agent import LLMAgent
+from app.agent.latency_budget import DEGRADE_DEADLINE_EXCEEDED, get_latency_budget_stats, make_deadline
+from app.agent.latency_budget import merge_degradations, remaining_ms, render_fallback_answer, run_within
+from app.agent.single_flight import coalesce_key, get_single_flight
+from app.agent.speculation import SpeculativeRouter
 from app.config import settings
+from app.rag.rag_service import rag_service
 from app.utils.logger import logger
 
 try:
-    from langgraph.checkpoint.redis import RedisSaver  # type: ignore
+    from langgraph.checkpoint.redis import AsyncRedisSaver  # type: ignore
     REDIS_CHECKPOINT_AVAILABLE = True
 except ImportError:
     # 如果 langgraph.checkpoint.redis 不可用，尝试独立包
     try:
-        from langgraph_checkpoint_redis import RedisSaver  # type: ignore
+        from langgraph_checkpoint_redis import AsyncRedisSaver  # type: ignore
         REDIS_CHECKPOINT_AVAILABLE = True
     except ImportError:
         REDIS_CHECKPOINT_AVAILABLE = False
         logger.warning("Redis checkpoint 不可用，将使用内存 checkpoint")
 
 
+def merge_errors(left: Optional[str], right: Optional[str]) -> Optional[str]:
+    """
+    合并 error 字段（并行分支各自的错误信息都保留）
+    
+    写入空值表示清空（每次运行的初始状态），相同的错误信息不重复拼接。
+    
+    Args:
+        left: 当前值
+        right: 新写入的值
+        
+    Returns:
+        Optional[str]: 合并后的错误信息
+    """
+    if not left or not right or right == left:
+        return right
+    if right in left.split("；"):
+        return left
+    return f"{left}；{right}"
+
+
 class AgentState(TypedDict):
     """Agent 状态定义"""
     input: str
     user_input: str
     intent: str
+    intents: List[str]
+    intent_tier: str
+    intent_confidence: Optional[float]
     order: Any
+    order_id: Optional[str]
+    order_email_prompt: bool
+    order_can_send_email: bool
+    order_customer_email: Optional[str]
     documents: list
+    kb_version: Optional[int]
+    semantic_cache_hit: bool
+    rag_fast_answer: Optional[dict]
+    rag_prefetched: bool
     response: str
-    error: str
+    error: Annotated[str, merge_errors]
+    deadline: Optional[float]
+    degradations: Annotated[List[str], merge_degradations]
 
 
-def create_checkpoint():
+async def create_checkpoint():
     """
-    创建 Redis checkpoint 用于状态存储
+    创建 Redis checkpoint 用于状态存储（异步版本，供 graph.ainvoke 使用）
     
     Returns:
         Checkpoint 实例或 None
@@ -58,13 +112,13 @@ def create_checkpoint():
             port=settings.REDIS_PORT,
             decode_responses=True
         )
-        test_client.ping()
-        test_client.close()
+        await test_client.ping()
+        await test_client.aclose()
         
-        # 创建 RedisSaver
-        checkpointer = RedisSaver.from_conn_string(redis_url)
+        # 创建 AsyncRedisSaver（from_conn_string 是上下文管理器，这里需要长期持有实例）
+        checkpointer = AsyncRedisSaver(redis_url=redis_url)
         # 初始化 Redis 索引
-        checkpointer.setup()
+        await checkpointer.asetup()
         
         logger.info("成功创建 Redis checkpoint")
         return checkpointer
@@ -75,7 +129,7 @@ def create_checkpoint():
         return None
 
 
-def route_after_router(state: AgentState) -> Literal["order", "rag", "llm"]:
+def route_after_router(state: AgentState) -> Union[Literal["order", "rag", "llm"], List[str]]:
     """
     路由函数：根据意图选择下一个节点
     
@@ -83,9 +137,12 @@ def route_after_router(state: AgentState) -> Literal["order", "rag", "llm"]:
         state: 当前状态
         
     Returns:
-        Literal: 下一个节点名称
+        Literal: 下一个节点名称；同时包含 order 和 rag 意图时返回 ["order", "rag"]（并行执行）
     """
     intent = state.get("intent", "chat")
+    intents = state.get("intents") or []
+    if "order" in intents and "rag" in intents:
+        return ["order", "rag"]
     
     if intent == "order":
         return "order"
@@ -95,19 +152,71 @@ def route_after_router(state: AgentState) -> Literal["order", "rag", "llm"]:
         return "llm"
 
 
-def create_agent_graph(db_session=None):
+def route_after_order(state: AgentState) -> Literal["llm", "end"]:
     """
-    创建 Agent 工作流图
+    订单节点之后的路由：已按模板渲染回答时直接结束（ORDER_ANSWER_MODE=template）
+    
+    Args:
+        state: 当前状态
+        
+    Returns:
+        Literal: 下一个节点名称
+    """
+    if state.get("response"):
+        return "end"
+    return "llm"
+
+
+def route_after_rag(state: AgentState) -> Literal["llm", "end"]:
+    """
+    RAG 节点之后的路由：语义缓存或快速回答已给出答案时直接结束
+    
+    Args:
+        state: 当前状态
+        
+    Returns:
+        Literal: 下一个节点名称
+    """
+    if state.get("response"):
+        return "end"
+    return "llm"
+
+
+def partial_update(process: Callable) -> Callable:
+    """
+    将返回完整状态的 Agent 节点包装为只返回变化字段的节点（供并行分支使用）
     
     Args:
-        db_session: 数据库会话（用于 OrderAgent）
+        process: Agent 的 process 方法
         
+    Returns:
+        Callable: LangGraph 节点函数
+    """
+    accepts_config = "config" in inspect.signature(process).parameters
+    
+    async def node(state: Dict[str, Any], config: RunnableConfig) -> Dict[str, Any]:
+        result = await (process(state, config) if accepts_config else process(state))
+        return {key: value for key, value in result.items() if key not in state or state[key] != value}
+    
+    return node
+
+
+async def create_agent_graph(speculative: Optional[bool] = None):
+    """
+    创建 Agent 工作流图
+    
+    注意：该函数每次调用都会重新构建所有 Agent、状态图和 checkpoint，
+    请求处理路径应使用 get_agent_graph() 获取进程级缓存的编译结果。
+    
+    Args:
+        speculative: 是否在意图分类的同时推测执行 RAG 检索，默认 AGENT_SPECULATIVE_RAG
+    
     Returns:
         StateGraph: LangGraph 状态图
     """
     # 创建各个 Agent 实例
     router_agent = RouterAgent()
-    order_agent = OrderAgent(db=db_session)
+    order_agent = OrderAgent()
     rag_agent = RAGAgent()
     llm_agent = LLMAgent()
     
@@ -115,9 +224,13 @@ def create_agent_graph(db_session=None):
     workflow = StateGraph(AgentState)
     
     # 添加节点
-    workflow.add_node("router", router_agent.process)
-    workflow.add_node("order", order_agent.process)
-    workflow.add_node("rag", rag_agent.process)
+    speculative = settings.AGENT_SPECULATIVE_RAG if speculative is None else speculative
+    if speculative:
+        workflow.add_node("router", SpeculativeRouter(router_agent, rag_agent).process)
+    else:
+        workflow.add_node("router", router_agent.process)
+    workflow.add_node("order", partial_update(order_agent.process))
+    workflow.add_node("rag", partial_update(rag_agent.process))
     workflow.add_node("llm", llm_agent.process)
     
     # 设置入口点
@@ -134,15 +247,31 @@ def create_agent_graph(db_session=None):
         }
     )
     
-    # order 和 rag 节点完成后都进入 llm 节点
-    workflow.add_edge("order", "llm")
-    workflow.add_edge("rag", "llm")
+    # order 节点完成后进入 llm 节点，已按模板渲染回答时直接结束
+    workflow.add_conditional_edges(
+        "order",
+        route_after_order,
+        {
+            "llm": "llm",
+            "end": END
+        }
+    )
+    
+    # rag 节点完成后进入 llm 节点，语义缓存命中或快速回答时直接结束
+    workflow.add_conditional_edges(
+        "rag",
+        route_after_rag,
+        {
+            "llm": "llm",
+            "end": END
+        }
+    )
     
     # llm 节点完成后结束
     workflow.add_edge("llm", END)
     
     # 创建 checkpoint（如果可用）
-    checkpoint = create_checkpoint()
+    checkpoint = await create_checkpoint()
     
     # 编译图
     if checkpoint:
@@ -154,49 +283,181 @@ def create_agent_graph(db_session=None):
     return app
 
 
-def process_query(
+# 进程级编译图缓存
+_compiled_graph = None
+_compiled_graph_lock = asyncio.Lock()
+
+
+async def get_agent_graph():
+    """
+    获取进程级的编译工作流图（单例模式）
+    
+    首次调用时构建图和 checkpoint，之后所有请求复用同一个实例。
+    
+    Returns:
+        编译后的 LangGraph 工作流图
+    """
+    global _compiled_graph
+    if _compiled_graph is None:
+        async with _compiled_graph_lock:
+            if _compiled_graph is None:
+                _compiled_graph = await create_agent_graph()
+    return _compiled_graph
+
+
+def reset_agent_graph() -> None:
+    """丢弃已缓存的编译图，下次调用 get_agent_graph() 时重新构建"""
+    global _compiled_graph
+    _compiled_graph = None
+
+
+def build_run_config(
+    thread_id: str = "default",
+    db_session=None,
+    stream_tokens: bool = False
+) -> Dict[str, Any]:
+    """
+    构建单次运行的配置
+    
+    Args:
+        thread_id: 线程ID（用于状态管理）
+        db_session: 数据库会话，由 OrderAgent 从配置中读取
+        stream_tokens: 是否让 LLMAgent 通过 custom 流推送回答片段
+        
+    Returns:
+        Dict[str, Any]: LangGraph 运行配置
+    """
+    return {
+        "configurable": {
+            "thread_id": thread_id,
+            "db_session": db_session,
+            "stream_tokens": stream_tokens
+        }
+    }
+
+
+def build_initial_state(query: str, budget_ms: Optional[int] = None) -> Dict[str, Any]:
+    """
+    构建工作流初始状态
+    
+    Args:
+        query: 用户查询文本
+        budget_ms: 延迟预算（毫秒），默认 LATENCY_BUDGET_MS，不大于 0 表示不限制
+        
+    Returns:
+        Dict[str, Any]: 初始状态
+    """
+    return {
+        "input": query,
+        "user_input": query,
+        "intent": "",
+        "intents": [],
+        "intent_tier": "",
+        "intent_confidence": None,
+        "order": None,
+        "order_id": None,
+        "order_email_prompt": False,
+        "order_can_send_email": False,
+        "order_customer_email": None,
+        "documents": [],
+        "kb_version": None,
+        "semantic_cache_hit": False,
+        "rag_fast_answer": None,
+        "rag_prefetched": False,
+        "response": "",
+        "error": "",
+        "deadline": make_deadline(budget_ms),
+        "degradations": []
+    }
+
+
+def format_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    将工作流最终状态转换为对外返回的结果
+    
+    Args:
+        result: 工作流最终状态
+        
+    Returns:
+        Dict[str, Any]: 处理结果，包含 'response' 键
+    """
+    return {
+        "response": result.get("response", "抱歉，无法生成回答。"),
+        "intent": result.get("intent", "chat"),
+        "intents": result.get("intents") or [result.get("intent", "chat")],
+        "intent_tier": result.get("intent_tier"),
+        "order": result.get("order"),
+        "documents": result.get("documents", []),
+        "semantic_cache_hit": result.get("semantic_cache_hit", False),
+        "fast_answer": result.get("rag_fast_answer"),
+        "degradations": result.get("degradations") or [],
+        "error": result.get("error")
+    }
+
+
+async def process_query(
     query: str,
     db_session=None,
-    thread_id: str = "default"
+    thread_id: str = "default",
+    budget_ms: Optional[int] = None
 ) -> Dict[str, Any]:
     """
     处理用户查询（主入口函数）
     
+    与用户无关的重复查询同时到达时只执行一次工作流（见 app.agent.single_flight）。
+    工作流受延迟预算限制：各节点按剩余时间降级，超出预算 LATENCY_BUDGET_GRACE_MS 仍未完成时
+    取消工作流，直接返回兜底回答。
+    
     Args:
         query: 用户查询文本
         db_session: 数据库会话
         thread_id: 线程ID（用于状态管理）
+        budget_ms: 延迟预算（毫秒），默认 LATENCY_BUDGET_MS；指定时不参与查询合并
         
     Returns:
-        Dict[str, Any]: 处理结果，包含 'response' 键
+        Dict[str, Any]: 处理结果，包含 'response' 和 'degradations' 键
     """
-    try:
-        # 创建图
-        graph = create_agent_graph(db_session=db_session)
-        
-        # 初始状态
-        initial_state = {
-            "input": query,
-            "user_input": query,
-            "intent": "",
-            "order": None,
-            "documents": [],
-            "response": "",
-            "error": ""
-        }
+    async def run() -> Dict[str, Any]:
+        # 获取进程级编译图
+        graph = await get_agent_graph()
         
         # 运行图
-        config = {"configurable": {"thread_id": thread_id}}
-        result = graph.invoke(initial_state, config=config)
+        config = build_run_config(thread_id=thread_id, db_session=db_session)
+        state = build_initial_state(query, budget_ms)
+        budget = remaining_ms(state)
+        started = time.perf_counter()
+        try:
+            result = await run_within(
+                graph.ainvoke(state, config=config), state, reserve_ms=-settings.LATENCY_BUDGET_GRACE_MS
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"查询超出延迟预算，返回兜底回答: {query[:50]}...")
+            result = {
+                **state,
+                "intent": "chat",
+                "response": render_fallback_answer(state),
+                "degradations": [DEGRADE_DEADLINE_EXCEEDED]
+            }
         
         # 返回最终结果
-        return {
-            "response": result.get("response", "抱歉，无法生成回答。"),
-            "intent": result.get("intent", "chat"),
-            "order": result.get("order"),
-            "documents": result.get("documents", []),
-            "error": result.get("error")
-        }
+        formatted = format_result(result)
+        get_latency_budget_stats().record(formatted["degradations"], (time.perf_counter() - started) * 1000, budget)
+        return formatted
+    
+    try:
+        single_flight = get_single_flight()
+        kb_version = await rag_service.aget_kb_version()
+        key = None if budget_ms is not None else coalesce_key(query, thread_id, kb_version)
+        if key is None:
+            single_flight.record_bypass()
+            return await run()
+        
+        result, shared = await single_flight.do(key, run)
+        if shared and "order" in (result.get("intents") or [result.get("intent")]):
+            # LLM 分类后才确定为订单意图，不使用其他请求的结果
+            single_flight.record_reexecution()
+            return await run()
+        return dict(result)
         
     except Exception as e:
         logger.error(f"处理查询失败: {str(e)}")
@@ -205,3 +466,161 @@ def process_query(
             "error": str(e)
         }
 
+
+async def process_queries(
+    queries: Sequence[str],
+    session_factory: Optional[Callable[[], Any]] = None,
+    concurrency: Optional[int] = None,
+    budget_ms: Optional[int] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    批量处理查询（离线评估、缓存预热），每条查询完成后立即产出结果
+    
+    批内共享的工作：
+    - 相同的查询（去除首尾和多余空白后）只执行一次工作流，结果分发给所有相同的查询
+    - 执行前把可能需要检索的查询（规则未判定为订单或寒暄的）合并为批量嵌入请求写入嵌入缓存，
+      之后各条查询的检索和语义缓存查询直接命中
+    - 意图分类的 LLM 结果和知识库回答分别由响应缓存和语义缓存在批内复用
+    
+    Args:
+        queries: 查询文本列表
+        session_factory: 数据库会话工厂（如 SessionLocal），每条查询使用独立的会话，执行完关闭
+        concurrency: 最大并发数，默认 QUERY_BATCH_CONCURRENCY
+        budget_ms: 每条查询的延迟预算（毫秒），默认 LATENCY_BUDGET_MS
+        
+    Yields:
+        Dict[str, Any]: {"index": 查询在输入中的位置, "query": 查询文本, **process_query 的结果}，按完成顺序产出
+    """
+    started = time.perf_counter()
+    groups: Dict[str, List[int]] = {}
+    for index, query in enumerate(queries):
+        groups.setdefault(" ".join(query.split()), []).append(index)
+    
+    classifier = get_intent_classifier()
+    retrieval_queries = []
+    for indexes in groups.values():
+        result = classifier.classify_rules(queries[indexes[0]])
+        if result is None or result["intent"] == "rag":
+            retrieval_queries.append(queries[indexes[0]])
+    warmed = await rag_service.awarm_query_embeddings(retrieval_queries)
+    
+    semaphore = asyncio.Semaphore(concurrency or settings.QUERY_BATCH_CONCURRENCY)
+    
+    async def run(indexes: List[int]):
+        async with semaphore:
+            session = session_factory() if session_factory else None
+            try:
+                return indexes, await process_query(queries[indexes[0]], db_session=session, budget_ms=budget_ms)
+            finally:
+                if session is not None:
+                    session.close()
+    
+    tasks = [asyncio.ensure_future(run(indexes)) for indexes in groups.values()]
+    try:
+        for future in asyncio.as_completed(tasks):
+            indexes, result = await future
+            for index in indexes:
+                yield {"index": index, "query": queries[index], **result}
+    finally:
+        for task in tasks:
+            task.cancel()
+    
+    logger.info(
+        f"批量查询完成: {len(queries)} 条，去重后执行 {len(groups)} 条，"
+        f"预热嵌入 {warmed} 条，耗时 {time.perf_counter() - started:.1f}s"
+    )
+
+
+async def stream_query(
+    query: str,
+    db_session=None,
+    thread_id: str = "default",
+    budget_ms: Optional[int] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    流式处理用户查询
+    
+    随工作流推进依次产出事件：
+    - intent: 路由完成后的意图 {"intent", "intents", "intent_tier"}
+    - order: 订单节点结果 {"order", "error"}
+    - documents: RAG 检索结果 {"documents"}（推测检索的结果在路由完成后推送）
+    - token: LLMAgent 生成的回答片段（字符串）；语义缓存命中、快速回答或订单模板回答时为整段答案
+    - done: 最终结果（与 process_query 返回值相同）
+    - error: 处理失败时的错误信息
+    
+    各节点同样按延迟预算降级（已推送的片段无法撤回，因此不设整体超时）。
+    
+    Args:
+        query: 用户查询文本
+        db_session: 数据库会话
+        thread_id: 线程ID（用于状态管理）
+        budget_ms: 延迟预算（毫秒），默认 LATENCY_BUDGET_MS
+        
+    Yields:
+        Dict[str, Any]: {"event": 事件名, "data": 事件数据}
+    """
+    try:
+        graph = await get_agent_graph()
+        config = build_run_config(
+            thread_id=thread_id,
+            db_session=db_session,
+            stream_tokens=True
+        )
+        
+        final_state = build_initial_state(query, budget_ms)
+        budget = remaining_ms(final_state)
+        started = time.perf_counter()
+        async for mode, chunk in graph.astream(
+            final_state,
+            config=config,
+            stream_mode=["updates", "custom"]
+        ):
+            if mode == "custom":
+                yield chunk
+                continue
+            
+            for node, update in chunk.items():
+                if not update:
+                    continue
+                merged = {**final_state, **update}
+                if "error" in update:
+                    merged["error"] = merge_errors(final_state.get("error"), update["error"])
+                if "degradations" in update:
+                    merged["degradations"] = merge_degradations(final_state.get("degradations"), update["degradations"])
+                final_state = merged
+                if node == "router":
+                    yield {
+                        "event": "intent",
+                        "data": {
+                            "intent": update.get("intent"),
+                            "intents": update.get("intents"),
+                            "intent_tier": update.get("intent_tier")
+                        }
+                    }
+                    if update.get("rag_prefetched"):
+                        yield {"event": "documents", "data": {"documents": update.get("documents", [])}}
+                elif node == "order":
+                    yield {
+                        "event": "order",
+                        "data": {"order": final_state.get("order"), "error": update.get("error")}
+                    }
+                elif node == "rag":
+                    yield {"event": "documents", "data": {"documents": final_state.get("documents", [])}}
+                
+                if node in ("router", "order", "rag") and update.get("response"):
+                    # 订单模板回答、语义缓存命中或快速回答时不经过 LLM 节点，整段答案作为一个片段推送
+                    yield {"event": "token", "data": update["response"]}
+        
+        result = format_result(final_state)
+        get_latency_budget_stats().record(result["degradations"], (time.perf_counter() - started) * 1000, budget)
+        yield {"event": "done", "data": result}
+        
+    except Exception as e:
+        logger.error(f"流式处理查询失败: {str(e)}")
+        yield {
+            "event": "error",
+            "data": {
+                "response": "抱歉，处理您的请求时出现错误，请稍后再试。",
+                "error": str(e)
+            }
+        }
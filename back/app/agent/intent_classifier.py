@@ -0,0 +1,457 @@
+"""
+分层意图分类模块
+在调用 LLM 之前先用本地规则和轻量模型判断意图，只有低置信度的输入才交给 Gemini
+
+分类层级：
+1. rules: 确定性规则（订单ID正则、问候语词典、订单关键词）
+2. model: 字符 n-gram 逻辑回归（纯 NumPy 实现，CPU 上微秒级）
+3. llm: LLMClient.aclassify_intent 兜底
+"""
+import json
+import re
+import statistics
+import threading
+import time
+import unicodedata
+import zlib
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+import numpy as np
+from app.agent.order_agent import match_order_id, match_structured_order_id
+from app.config import settings
+from app.utils.logger import logger
+
+INTENTS = ("order", "rag", "chat")
+
+# 问候/寒暄词典（整句匹配）
+GREETING_LEXICON = {
+    "你好", "您好", "你好呀", "你好啊", "嗨", "哈喽", "在吗", "在不在", "有人吗",
+    "早上好", "中午好", "下午好", "晚上好", "早安", "晚安",
+    "谢谢", "谢谢你", "多谢", "感谢", "好的", "好的谢谢", "收到", "没问题",
+    "再见", "拜拜", "ok", "okay", "hi", "hello", "hey", "thanks", "thank you", "bye",
+}
+
+# 明确指向具体订单的短语（出现即判定为订单意图）
+ORDER_PHRASES = (
+    "我的订单", "查订单", "查询订单", "查一下订单", "订单状态", "订单进度",
+    "我的快递", "我的包裹", "物流信息", "物流进度", "快递到哪", "包裹到哪",
+    "工单进度", "查工单",
+)
+
+# 不带前缀的编号（ORDER123、12345678）需要同时出现这些关键词才判定为订单
+ORDER_ID_KEYWORDS = ("订单", "单号", "order", "物流", "快递", "包裹", "工单")
+
+# 模型训练种子语料
+SEED_EXAMPLES: List[Tuple[str, str]] = [
+    # order
+    ("我的订单到哪了", "order"),
+    ("帮我查一下订单", "order"),
+    ("查询订单状态", "order"),
+    ("我的快递什么时候到", "order"),
+    ("包裹还没收到", "order"),
+    ("我买的东西发货了吗", "order"),
+    ("物流信息怎么一直不更新", "order"),
+    ("快递单号是多少", "order"),
+    ("订单一直显示待发货", "order"),
+    ("我想取消刚下的订单", "order"),
+    ("订单能改收货地址吗", "order"),
+    ("帮我看看工单处理到哪一步了", "order"),
+    ("昨天下的单还没发", "order"),
+    ("我的货到哪里了", "order"),
+    ("where is my order", "order"),
+    ("track my package", "order"),
+    ("order status", "order"),
+    # rag
+    ("怎么退货", "rag"),
+    ("退货流程是什么", "rag"),
+    ("发货要多久", "rag"),
+    ("多久发货", "rag"),
+    ("什么时候发货", "rag"),
+    ("运费怎么算", "rag"),
+    ("保修政策是什么", "rag"),
+    ("产品怎么使用", "rag"),
+    ("如何安装", "rag"),
+    ("支持哪些支付方式", "rag"),
+    ("退款多久到账", "rag"),
+    ("发票怎么开", "rag"),
+    ("会员有什么权益", "rag"),
+    ("售后服务怎么联系", "rag"),
+    ("这个产品有什么功能", "rag"),
+    ("使用说明在哪里看", "rag"),
+    ("如何重置密码", "rag"),
+    ("七天无理由退货怎么操作", "rag"),
+    ("产品参数是多少", "rag"),
+    ("how to return an item", "rag"),
+    ("what is the warranty policy", "rag"),
+    ("how do i reset my password", "rag"),
+    # chat
+    ("你好", "chat"),
+    ("谢谢你的帮助", "chat"),
+    ("再见", "chat"),
+    ("你是谁", "chat"),
+    ("你叫什么名字", "chat"),
+    ("今天天气怎么样", "chat"),
+    ("讲个笑话吧", "chat"),
+    ("哈哈哈", "chat"),
+    ("你真棒", "chat"),
+    ("好的没问题", "chat"),
+    ("在吗", "chat"),
+    ("你是机器人吗", "chat"),
+    ("陪我聊聊天", "chat"),
+    ("早上好呀", "chat"),
+    ("hello there", "chat"),
+    ("who are you", "chat"),
+    ("thank you so much", "chat"),
+]
+
+_PUNCT_RE = re.compile(r"[\s\W_]+", re.UNICODE)
+
+# 多意图检测时的分句符号和连接词
+_CLAUSE_SPLIT_RE = re.compile(r"[，,。！？!?；;\n]+|另外|还有|以及|顺便问一下|顺便|再问一下")
+
+
+def normalize_text(text: str) -> str:
+    """统一全半角、大小写并去除标点空白"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return _PUNCT_RE.sub("", text)
+
+
+class CharNgramIntentModel:
+    """
+    字符 n-gram 逻辑回归意图模型
+
+    特征通过 crc32 哈希到固定维度（跨进程稳定），使用多分类 softmax 回归全批量训练。
+    """
+
+    def __init__(self, ngram_range: Tuple[int, int] = (1, 3), n_features: int = 4096):
+        """
+        初始化模型
+
+        Args:
+            ngram_range: 字符 n-gram 长度范围
+            n_features: 哈希特征维度
+        """
+        self.ngram_range = ngram_range
+        self.n_features = n_features
+        self.labels: List[str] = list(INTENTS)
+        self.weights: Optional[np.ndarray] = None
+        self.bias: Optional[np.ndarray] = None
+
+    def _featurize(self, text: str) -> np.ndarray:
+        """将文本转换为 L2 归一化的哈希 n-gram 特征向量"""
+        vec = np.zeros(self.n_features, dtype=np.float32)
+        padded = f"^{text}$"
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            for i in range(len(padded) - n + 1):
+                gram = padded[i:i + n]
+                vec[zlib.crc32(gram.encode("utf-8")) % self.n_features] += 1.0
+        np.log1p(vec, out=vec)
+        norm = np.linalg.norm(vec)
+        if norm > 0:
+            vec /= norm
+        return vec
+
+    def fit(
+        self,
+        texts: List[str],
+        labels: List[str],
+        epochs: int = 300,
+        learning_rate: float = 1.0,
+        l2: float = 1e-4
+    ) -> "CharNgramIntentModel":
+        """
+        训练模型
+
+        Args:
+            texts: 已归一化的训练文本
+            labels: 对应的意图标签
+            epochs: 训练轮数
+            learning_rate: 学习率
+            l2: L2 正则系数
+
+        Returns:
+            CharNgramIntentModel: 训练后的模型
+        """
+        x = np.stack([self._featurize(t) for t in texts])
+        label_index = {label: i for i, label in enumerate(self.labels)}
+        y = np.zeros((len(labels), len(self.labels)), dtype=np.float32)
+        y[np.arange(len(labels)), [label_index[label] for label in labels]] = 1.0
+
+        self.weights = np.zeros((self.n_features, len(self.labels)), dtype=np.float32)
+        self.bias = np.zeros(len(self.labels), dtype=np.float32)
+
+        for _ in range(epochs):
+            probs = self._softmax(x @ self.weights + self.bias)
+            grad = (probs - y) / len(texts)
+            self.weights -= learning_rate * (x.T @ grad + l2 * self.weights)
+            self.bias -= learning_rate * grad.sum(axis=0)
+        return self
+
+    @staticmethod
+    def _softmax(logits: np.ndarray) -> np.ndarray:
+        """数值稳定的 softmax"""
+        logits = logits - logits.max(axis=-1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=-1, keepdims=True)
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """
+        预测意图
+
+        Args:
+            text: 已归一化的文本
+
+        Returns:
+            Tuple[str, float]: (意图, 置信度)
+        """
+        if self.weights is None:
+            raise RuntimeError("意图模型尚未训练")
+        probs = self._softmax(self._featurize(text) @ self.weights + self.bias)
+        best = int(np.argmax(probs))
+        return self.labels[best], float(probs[best])
+
+
+class TieredIntentClassifier:
+    """分层意图分类器（规则 → 本地模型 → LLM）"""
+
+    TIERS = ("rules", "model", "llm")
+
+    def __init__(
+        self,
+        threshold: Optional[float] = None,
+        training_data: Optional[str] = None,
+        enabled: Optional[bool] = None,
+        latency_window: int = 1000
+    ):
+        """
+        初始化分类器
+
+        Args:
+            threshold: 本地模型置信度阈值，低于该值交给 LLM
+            training_data: 额外训练语料路径（JSONL，每行 {"text": ..., "intent": ...}）
+            enabled: 是否启用快速通道，关闭时所有请求直接走 LLM
+            latency_window: 每层保留的延迟样本数（用于计算 p50）
+        """
+        self.threshold = settings.INTENT_MODEL_THRESHOLD if threshold is None else threshold
+        self.training_data = settings.INTENT_TRAINING_DATA if training_data is None else training_data
+        self.enabled = settings.INTENT_FAST_PATH_ENABLED if enabled is None else enabled
+        self._model: Optional[CharNgramIntentModel] = None
+        self._model_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._counts: Dict[str, int] = {tier: 0 for tier in self.TIERS}
+        self._latencies: Dict[str, Deque[float]] = {
+            tier: deque(maxlen=latency_window) for tier in self.TIERS
+        }
+
+    def _load_training_examples(self) -> List[Tuple[str, str]]:
+        """加载种子语料和可选的额外训练语料"""
+        examples = list(SEED_EXAMPLES)
+        if self.training_data:
+            path = Path(self.training_data)
+            if path.exists():
+                with open(path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        item = json.loads(line)
+                        if item.get("intent") in INTENTS and item.get("text"):
+                            examples.append((item["text"], item["intent"]))
+            else:
+                logger.warning(f"意图训练语料不存在: {self.training_data}")
+        return examples
+
+    @property
+    def model(self) -> CharNgramIntentModel:
+        """延迟训练本地意图模型"""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    start = time.perf_counter()
+                    examples = self._load_training_examples()
+                    self._model = CharNgramIntentModel().fit(
+                        [normalize_text(text) for text, _ in examples],
+                        [intent for _, intent in examples]
+                    )
+                    logger.info(
+                        f"意图模型训练完成，样本数: {len(examples)}，"
+                        f"耗时: {(time.perf_counter() - start) * 1000:.1f} ms"
+                    )
+        return self._model
+
+    def warm(self) -> None:
+        """预先训练模型，避免首个请求承担训练开销"""
+        if self.enabled:
+            _ = self.model
+
+    def classify_rules(self, text: str) -> Optional[Dict[str, Any]]:
+        """
+        规则层分类
+
+        Args:
+            text: 用户输入
+
+        Returns:
+            Optional[Dict[str, Any]]: 命中时返回分类结果，否则返回 None
+        """
+        if match_structured_order_id(text):
+            return {"intent": "order", "tier": "rules", "confidence": 1.0}
+
+        normalized = normalize_text(text)
+        if not normalized:
+            return {"intent": "chat", "tier": "rules", "confidence": 1.0}
+        if normalized in GREETING_LEXICON:
+            return {"intent": "chat", "tier": "rules", "confidence": 1.0}
+        if any(phrase in normalized for phrase in ORDER_PHRASES):
+            return {"intent": "order", "tier": "rules", "confidence": 0.95}
+        # 裸编号也可能是商品型号、SKU 或电话号码，只有出现订单关键词时才判定为订单，否则交给模型层
+        if match_order_id(text) and any(keyword in normalized for keyword in ORDER_ID_KEYWORDS):
+            return {"intent": "order", "tier": "rules", "confidence": 0.95}
+        return None
+
+    def classify_model(self, text: str) -> Dict[str, Any]:
+        """
+        模型层分类（不做阈值判断）
+
+        Args:
+            text: 用户输入
+
+        Returns:
+            Dict[str, Any]: 分类结果
+        """
+        intent, confidence = self.model.predict(normalize_text(text))
+        return {"intent": intent, "tier": "model", "confidence": confidence}
+
+    def classify_fast(self, text: str, record: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        本地快速分类（规则 + 模型），不调用 LLM
+
+        Args:
+            text: 用户输入
+            record: 是否计入各层分类统计（随后还会正式分类的预判传 False）
+
+        Returns:
+            Optional[Dict[str, Any]]: 置信度足够时返回分类结果，否则返回 None
+        """
+        if not self.enabled:
+            return None
+
+        start = time.perf_counter()
+        result = self.classify_rules(text)
+        if result is None:
+            result = self.classify_model(text)
+            if result["confidence"] < self.threshold:
+                return None
+        if record:
+            self._record(result["tier"], (time.perf_counter() - start) * 1000)
+        return result
+
+    def detect_intents(self, text: str, primary: str) -> List[str]:
+        """
+        检测一句话中的多个意图（如同时查询订单和咨询退货政策）
+
+        按标点和连接词分句，每个分句只用规则和本地模型分类（不调用 LLM），
+        低于置信度阈值的分句忽略；存在 order / rag 时不再保留 chat。
+
+        Args:
+            text: 用户输入
+            primary: 整句的分类结果
+
+        Returns:
+            List[str]: 意图列表（整句意图在前）
+        """
+        intents = [primary]
+        if not self.enabled:
+            return intents
+        clauses = [clause for clause in _CLAUSE_SPLIT_RE.split(text) if normalize_text(clause)]
+        if len(clauses) < 2:
+            return intents
+        for clause in clauses:
+            result = self.classify_rules(clause)
+            if result is None:
+                result = self.classify_model(clause)
+                if result["confidence"] < self.threshold:
+                    continue
+            if result["intent"] != "chat" and result["intent"] not in intents:
+                intents.append(result["intent"])
+        if len(intents) > 1 and "chat" in intents:
+            intents.remove("chat")
+        return intents
+
+    async def aclassify(self, text: str, llm_client: Any) -> Dict[str, Any]:
+        """
+        分层分类：先走本地快速通道，低置信度时调用 LLM
+
+        Args:
+            text: 用户输入
+            llm_client: 提供 aclassify_intent 的 LLM 客户端
+
+        Returns:
+            Dict[str, Any]: 分类结果，包含 intent、tier、confidence
+        """
+        start = time.perf_counter()
+        result = self.classify_fast(text)
+        if result is not None:
+            return result
+
+        intent = await llm_client.aclassify_intent(text)
+        self._record("llm", (time.perf_counter() - start) * 1000)
+        return {"intent": intent, "tier": "llm", "confidence": None}
+
+    def _record(self, tier: str, latency_ms: float) -> None:
+        """记录分类层命中和延迟"""
+        with self._stats_lock:
+            self._counts[tier] += 1
+            self._latencies[tier].append(latency_ms)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取分层命中率和延迟统计
+
+        Returns:
+            Dict[str, Any]: 各层命中次数、命中率、p50 延迟，以及估算的 p50 延迟节省
+        """
+        with self._stats_lock:
+            counts = dict(self._counts)
+            p50 = {
+                tier: statistics.median(samples) if samples else None
+                for tier, samples in self._latencies.items()
+            }
+            fast_samples = list(self._latencies["rules"]) + list(self._latencies["model"])
+        total = sum(counts.values())
+        tiers = {
+            tier: {
+                "count": counts[tier],
+                "hit_rate": counts[tier] / total if total else 0.0,
+                "p50_ms": p50[tier],
+            }
+            for tier in self.TIERS
+        }
+
+        # 快速通道每次命中相对 LLM 分类节省的 p50 延迟
+        saved_p50_ms = None
+        if p50["llm"] is not None and fast_samples:
+            saved_p50_ms = p50["llm"] - statistics.median(fast_samples)
+
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "total": total,
+            "fast_path_hit_rate": (counts["rules"] + counts["model"]) / total if total else 0.0,
+            "tiers": tiers,
+            "saved_p50_ms_per_fast_hit": saved_p50_ms,
+        }
+
+
+# 全局分类器实例（延迟初始化）
+intent_classifier = None
+
+
+def get_intent_classifier() -> TieredIntentClassifier:
+    """获取意图分类器实例（单例模式）"""
+    global intent_classifier
+    if intent_classifier is None:
+        intent_classifier = TieredIntentClassifier()
+    return intent_classifier
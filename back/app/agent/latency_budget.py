@@ -0,0 +1,201 @@
+"""
+请求延迟预算模块
+每个请求进入工作流时得到一个截止时间（状态中的 'deadline'），各节点按剩余时间依次降级：
+
+- router: 等不及 LLM 分类时使用规则 / 本地模型的分类结果
+- order: 提取订单ID或查询订单超时时返回模板提示
+- rag: 剩余时间低于 LATENCY_SKIP_RETRIEVAL_MS 时跳过检索，检索超时时放弃检索结果
+- llm: 剩余时间低于 LATENCY_CHEAP_MODEL_MS 时改用 LLM_FALLBACK_MODEL；
+  低于 LATENCY_MIN_GENERATION_MS 或生成超时时返回模板 / 兜底回答
+
+采用过的降级写入状态的 'degradations' 字段并随查询结果返回。
+截止时间基于 time.monotonic()，只在当前进程内有效。
+"""
+import asyncio
+import threading
+import time
+from typing import Any, Awaitable, Dict, List, Optional, TypeVar
+from app.agent.order_templates import get_order_answer_renderer
+from app.config import settings
+from app.rag.fast_answer import FastAnswerSelector
+from app.utils.logger import logger
+
+T = TypeVar("T")
+
+# 降级类型
+DEGRADE_INTENT_LOCAL = "intent_local"
+DEGRADE_ORDER_TIMEOUT = "order_timeout"
+DEGRADE_SKIP_RETRIEVAL = "skip_retrieval"
+DEGRADE_RETRIEVAL_TIMEOUT = "retrieval_timeout"
+DEGRADE_CHEAP_MODEL = "cheap_model"
+DEGRADE_TRUNCATED_ANSWER = "truncated_answer"
+DEGRADE_FALLBACK_ANSWER = "fallback_answer"
+DEGRADE_DEADLINE_EXCEEDED = "deadline_exceeded"
+
+FALLBACK_ANSWER = "抱歉，当前服务繁忙，暂时无法完整回答您的问题，请稍后再试。"
+
+FALLBACK_DOCUMENT_PREFIX = "以下是知识库中与您的问题最相关的内容："
+
+
+def make_deadline(budget_ms: Optional[int] = None) -> Optional[float]:
+    """
+    计算请求的截止时间
+
+    Args:
+        budget_ms: 延迟预算（毫秒），默认 LATENCY_BUDGET_MS；不大于 0 表示不限制
+
+    Returns:
+        Optional[float]: time.monotonic() 时间轴上的截止时间，不限制时返回 None
+    """
+    budget_ms = settings.LATENCY_BUDGET_MS if budget_ms is None else budget_ms
+    if budget_ms <= 0:
+        return None
+    return time.monotonic() + budget_ms / 1000
+
+
+def remaining_ms(state: Dict[str, Any]) -> Optional[float]:
+    """
+    读取状态中剩余的延迟预算
+
+    Args:
+        state: 工作流状态
+
+    Returns:
+        Optional[float]: 剩余毫秒数（不小于 0），未设置截止时间时返回 None
+    """
+    deadline = state.get("deadline")
+    if deadline is None:
+        return None
+    return max((deadline - time.monotonic()) * 1000, 0.0)
+
+
+async def run_within(awaitable: Awaitable[T], state: Dict[str, Any], reserve_ms: float = 0.0) -> T:
+    """
+    在剩余预算内等待异步调用，超时时取消调用并抛出 asyncio.TimeoutError
+
+    Args:
+        awaitable: 异步调用
+        state: 工作流状态（读取 'deadline'）
+        reserve_ms: 为后续节点保留的时间（毫秒）
+
+    Returns:
+        调用结果
+    """
+    remaining = remaining_ms(state)
+    if remaining is None:
+        return await awaitable
+    return await asyncio.wait_for(awaitable, timeout=max(remaining - reserve_ms, 0.0) / 1000)
+
+
+def merge_degradations(left: Optional[List[str]], right: Optional[List[str]]) -> List[str]:
+    """
+    合并 degradations 字段（并行分支各自的降级都保留）
+
+    写入空列表表示清空（每次运行的初始状态），重复的降级只保留一次。
+
+    Args:
+        left: 当前值
+        right: 新写入的值
+
+    Returns:
+        List[str]: 合并后的降级列表
+    """
+    if not left or not right:
+        return list(right or [])
+    return list(left) + [item for item in right if item not in left]
+
+
+def add_degradation(state: Dict[str, Any], degradation: str) -> List[str]:
+    """
+    在状态的降级列表中追加一项
+
+    Args:
+        state: 工作流状态
+        degradation: 降级类型
+
+    Returns:
+        List[str]: 新的降级列表
+    """
+    return merge_degradations(state.get("degradations"), [degradation])
+
+
+def render_fallback_answer(state: Dict[str, Any]) -> str:
+    """
+    不调用 LLM 的兜底回答：订单按模板渲染，检索结果给出最相关的分块原文
+
+    Args:
+        state: 工作流状态
+
+    Returns:
+        str: 回答文本
+    """
+    parts = []
+    if state.get("order"):
+        parts.append(get_order_answer_renderer().render(
+            state["order"],
+            email_prompt=state.get("order_email_prompt", False),
+            email_address=state.get("order_customer_email")
+        ))
+    documents = state.get("documents") or []
+    if documents:
+        parts.append(f"{FALLBACK_DOCUMENT_PREFIX}\n\n{FastAnswerSelector.render({'document': documents[0]})}")
+    return "\n\n".join(parts) or FALLBACK_ANSWER
+
+
+class LatencyBudgetStats:
+    """延迟预算统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "degraded": 0, "over_budget": 0}
+        self._degradations: Dict[str, int] = {}
+
+    def record(self, degradations: List[str], elapsed_ms: float, budget_ms: Optional[float] = None) -> None:
+        """
+        记录一次请求
+
+        Args:
+            degradations: 请求采用的降级
+            elapsed_ms: 请求耗时
+            budget_ms: 请求的延迟预算（不限制时为 None）
+        """
+        with self._lock:
+            self._stats["requests"] += 1
+            if degradations:
+                self._stats["degraded"] += 1
+            if budget_ms is not None and elapsed_ms > budget_ms:
+                self._stats["over_budget"] += 1
+            for degradation in degradations:
+                self._degradations[degradation] = self._degradations.get(degradation, 0) + 1
+        if degradations:
+            logger.info(f"请求降级: {degradations}，耗时 {elapsed_ms:.0f}ms")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取延迟预算统计
+
+        Returns:
+            Dict[str, Any]: 预算配置、降级请求数和比例、超出预算的请求数以及各类降级次数
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            degradations = dict(self._degradations)
+        return {
+            "budget_ms": settings.LATENCY_BUDGET_MS,
+            "fallback_model": settings.LLM_FALLBACK_MODEL,
+            **stats,
+            "degraded_rate": stats["degraded"] / stats["requests"] if stats["requests"] else 0.0,
+            "degradations": degradations,
+        }
+
+
+# 全局延迟预算统计（延迟初始化）
+latency_budget_stats = None
+
+
+def get_latency_budget_stats() -> LatencyBudgetStats:
+    """获取延迟预算统计实例（单例模式）"""
+    global latency_budget_stats
+    if latency_budget_stats is None:
+        latency_budget_stats = LatencyBudgetStats()
+    return latency_budget_stats
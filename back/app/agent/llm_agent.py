@@ -2,8 +2,17 @@
 LLM Agent
 负责生成最终的自然语言回答
 """
-from typing import Dict, Any
+import asyncio
+import time
+from typing import Dict, Any, Optional
+from langchain_core.runnables import RunnableConfig
+from langgraph.config import get_stream_writer
+from app.agent.latency_budget import DEGRADE_CHEAP_MODEL, DEGRADE_FALLBACK_ANSWER, DEGRADE_TRUNCATED_ANSWER
+from app.agent.latency_budget import add_degradation, merge_degradations, remaining_ms, render_fallback_answer, run_within
 from app.clients.llm_client import get_llm_client
+from app.config import settings
+from app.rag.fast_answer import get_fast_answer_selector
+from app.rag.semantic_cache import get_semantic_cache
 from app.utils.logger import logger
 
 
@@ -21,15 +30,28 @@ class LLMAgent:
             self._llm_client = get_llm_client()
         return self._llm_client
     
-    def process(self, state: Dict[str, Any]) -> Dict[str, Any]:
+    async def process(
+        self,
+        state: Dict[str, Any],
+        config: Optional[RunnableConfig] = None
+    ) -> Dict[str, Any]:
         """
         生成最终回答
         
+        当运行配置中 config["configurable"]["stream_tokens"] 为 True 时，
+        使用 Gemini 流式接口，并通过 LangGraph 的 custom 流把每个片段
+        以 {"event": "token", "data": 片段} 的形式实时推送给调用方。
+        
+        按剩余延迟预算（'deadline'）降级：低于 LATENCY_CHEAP_MODEL_MS 时改用 LLM_FALLBACK_MODEL，
+        低于 LATENCY_MIN_GENERATION_MS 或生成超时时返回模板 / 兜底回答（流式已推送部分片段时保留已生成的内容）。
+        
         Args:
             state: 当前状态字典，包含：
                 - 'input' 或 'user_input': 用户输入
                 - 'order': 订单信息（如果有）
                 - 'documents': RAG 检索结果（如果有）
+                - 'kb_version': 检索时的知识库版本（RAG 回答会写入语义缓存）
+            config: LangGraph 运行配置
                 
         Returns:
             Dict[str, Any]: 更新后的状态，包含 'response' 键
@@ -59,23 +81,93 @@ class LLMAgent:
                 context["order_customer_email"] = state.get("order_customer_email")
             
             # 生成回答
-            response = self.llm_client.generate_response(
-                user_input=user_input,
-                context=context if context else None,
-                email_confirmation_required=state.get("order_email_prompt", False),
-                email_address=state.get("order_customer_email")
-            )
+            generate_kwargs = {
+                "user_input": user_input,
+                "context": context if context else None,
+                "email_confirmation_required": state.get("order_email_prompt", False),
+                "email_address": state.get("order_customer_email")
+            }
+            stream_tokens = ((config or {}).get("configurable") or {}).get("stream_tokens", False)
+            writer = get_stream_writer() if stream_tokens else None
+            
+            # 按剩余延迟预算选择模型，来不及生成时直接返回兜底回答
+            remaining = remaining_ms(state)
+            degradations = state.get("degradations") or []
+            if remaining is not None and remaining < settings.LATENCY_MIN_GENERATION_MS:
+                logger.warning(f"剩余延迟预算 {remaining:.0f}ms 不足，返回兜底回答")
+                return self._fallback(state, writer)
+            if remaining is not None and remaining < settings.LATENCY_CHEAP_MODEL_MS:
+                logger.info(f"剩余延迟预算 {remaining:.0f}ms，改用 {settings.LLM_FALLBACK_MODEL} 生成回答")
+                generate_kwargs["model"] = settings.LLM_FALLBACK_MODEL
+                degradations = add_degradation(state, DEGRADE_CHEAP_MODEL)
+            
+            started = time.perf_counter()
+            chunks = []
+            try:
+                if stream_tokens:
+                    stream = await run_within(self.llm_client.agenerate_response_stream(**generate_kwargs), state)
+                    iterator = stream.__aiter__()
+                    while True:
+                        try:
+                            chunk = await run_within(iterator.__anext__(), state)
+                        except StopAsyncIteration:
+                            break
+                        chunks.append(chunk)
+                        writer({"event": "token", "data": chunk})
+                    response = "".join(chunks).strip()
+                else:
+                    response = await run_within(self.llm_client.agenerate_response(**generate_kwargs), state)
+            except asyncio.TimeoutError:
+                if not chunks:
+                    logger.warning("回答生成超出延迟预算，返回兜底回答")
+                    return self._fallback({**state, "degradations": degradations}, writer)
+                logger.warning(f"回答生成超出延迟预算，保留已推送的 {len(chunks)} 个片段")
+                return {
+                    **state,
+                    "response": "".join(chunks).strip(),
+                    "degradations": merge_degradations(degradations, [DEGRADE_TRUNCATED_ANSWER])
+                }
             
             logger.info(f"成功生成回答，长度: {len(response)} 字符")
             
+            # 记录 RAG 回答的生成延迟，用于估算快速回答节省的时间
+            if state.get("intent") == "rag" and state.get("documents"):
+                get_fast_answer_selector().record_generation((time.perf_counter() - started) * 1000)
+            
+            # 基于知识库的回答写入语义缓存，供同义问题复用（多意图回答可能包含订单信息，降级模型的回答也不写入）
+            single_intent = len(state.get("intents") or []) <= 1
+            if (
+                single_intent and "model" not in generate_kwargs and state.get("intent") == "rag"
+                and state.get("documents") and state.get("kb_version") is not None
+            ):
+                await get_semantic_cache().astore(
+                    user_input,
+                    response,
+                    kb_version=state["kb_version"],
+                    documents=state["documents"]
+                )
+            
             return {
                 **state,
                 "response": response,
-                "final_response": response
+                "final_response": response,
+                "degradations": degradations
             }
             
         except Exception as e:
             logger.error(f"LLM Agent 处理失败: {str(e)}")
             error_msg = "抱歉，生成回答时出现错误，请稍后再试。"
             return {**state, "response": error_msg, "error": str(e)}
+    
+    @staticmethod
+    def _fallback(state: Dict[str, Any], writer: Optional[Any] = None) -> Dict[str, Any]:
+        """不调用 LLM，返回模板 / 兜底回答（流式请求时作为一个片段推送）"""
+        response = render_fallback_answer(state)
+        if writer:
+            writer({"event": "token", "data": response})
+        return {
+            **state,
+            "response": response,
+            "degradations": add_degradation(state, DEGRADE_FALLBACK_ANSWER)
+        }
 
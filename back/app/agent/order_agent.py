@@ -2,27 +2,134 @@
 订单 Agent
 负责查询订单信息并触发 n8n 邮件通知
 """
+import asyncio
 import re
-from typing import Dict, Any, Optional
-from sqlalchemy.orm import Session
+from typing import Dict, Any, List, Optional
+from langchain_core.runnables import RunnableConfig
+from sqlalchemy import exc, text
+from app.agent.latency_budget import DEGRADE_ORDER_TIMEOUT, add_degradation, remaining_ms, run_within
+from app.agent.order_templates import get_order_answer_renderer
 from app.db.crud import get_order_by_id
+from app.db.session import SessionLocal
 from app.clients.n8n_client import send_order_email_sync
+from app.config import settings
 from app.utils.logger import logger
 
 
-class OrderAgent:
-    """订单 Agent 类"""
+# 常见的订单ID格式（按优先级排列）
+ORDER_ID_PATTERNS = [
+    # 带连字符的格式：ORD-2024-001, ORDER-123456
+    r'(?:订单|订单号|order)[：:\s]*([A-Z]{2,}[-_]?\d{4}[-_]?\d{3,})',
+    r'([A-Z]{2,}[-_]?\d{4}[-_]?\d{3,})',  # ORD-2024-001, ORD_2024_001
+    # 带冒号或空格的格式
+    r'订单[：:]\s*([A-Z0-9\-_]+)',  # 订单：ORDER123, 订单: ORD-2024-001
+    r'订单号[：:]\s*([A-Z0-9\-_]+)',  # 订单号：ORDER123
+    r'order[：:]\s*([A-Z0-9\-_]+)',  # order: ORDER123
+    # 纯字母+数字格式（不含连字符）
+    r'([A-Z]{2,}\d{3,})',  # ORDER123, ORD123456
+    # 纯数字格式（8位以上）
+    r'(\d{8,})',  # 12345678
+]
+
+# 可以确定是订单号的格式：带“订单 / 订单号 / order”前缀，或 ORD-2024-001 这样带分隔符的编号
+# （不带前缀的 ORDER123、12345678 也可能是商品型号、SKU 或电话号码）
+STRUCTURED_ORDER_ID_PATTERNS = [
+    r'(?:订单|订单号|order)[：:\s]*([A-Z]{2,}[-_]?\d{4}[-_]?\d{3,})',
+    r'([A-Z]{2,}[-_]\d{4}[-_]\d{3,})',  # ORD-2024-001, ORD_2024_001
+    r'订单[：:]\s*([A-Z0-9\-_]+)',
+    r'订单号[：:]\s*([A-Z0-9\-_]+)',
+    r'order[：:]\s*([A-Z0-9\-_]+)',
+]
+
+# Postgres 语句超时被取消时的错误码（query_canceled）
+QUERY_CANCELED_PGCODE = "57014"
+
+_COMPILED_ORDER_ID_PATTERNS = [re.compile(p, re.IGNORECASE) for p in ORDER_ID_PATTERNS]
+_COMPILED_STRUCTURED_ORDER_ID_PATTERNS = [re.compile(p, re.IGNORECASE) for p in STRUCTURED_ORDER_ID_PATTERNS]
+
+
+def _match_patterns(patterns: List[re.Pattern], text: str) -> Optional[str]:
+    """按顺序匹配订单ID格式，返回第一个长度合格的匹配"""
+    for pattern in patterns:
+        for match in pattern.finditer(text):
+            order_id = match.group(1).strip()
+            # 验证订单ID格式（至少包含字母和数字）
+            if len(order_id) >= 5:  # 最小长度检查
+                return order_id
+    return None
+
+
+def match_order_id(text: str) -> Optional[str]:
+    """
+    仅使用正则表达式从文本中匹配订单ID（不调用 LLM）
     
-    def __init__(self, db: Optional[Session] = None):
-        """
-        初始化订单 Agent
+    包含不带前缀的宽松格式，用于已确定为订单意图后的提取；判断意图请使用 match_structured_order_id。
+    
+    Args:
+        text: 输入文本
         
-        Args:
-            db: 数据库会话，如果不提供则需要在 process 中处理
-        """
-        self.db = db
+    Returns:
+        Optional[str]: 匹配到的订单ID，如果未找到返回 None
+    """
+    return _match_patterns(_COMPILED_ORDER_ID_PATTERNS, text)
+
+
+def match_structured_order_id(text: str) -> Optional[str]:
+    """
+    只匹配可以确定是订单号的格式（带订单前缀或 ORD-2024-001 形式）
+    
+    Args:
+        text: 输入文本
+        
+    Returns:
+        Optional[str]: 匹配到的订单ID，如果未找到返回 None
+    """
+    return _match_patterns(_COMPILED_STRUCTURED_ORDER_ID_PATTERNS, text)
+
+
+def query_order(bind: Any, order_id: str, timeout_ms: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """
+    在当前线程自己的会话中查询订单（由调用方放到线程池执行）
+    
+    请求的数据库会话不跨线程使用：延迟预算用完时调用方只是不再等待，
+    查询本身由 statement_timeout 终止，会话在本线程内关闭，不会与请求结束时关闭会话的 get_db 并发。
+    
+    Args:
+        bind: 数据库引擎（取自请求会话）
+        order_id: 订单ID
+        timeout_ms: 语句超时（毫秒），None 表示不限制
+        
+    Returns:
+        Optional[Dict[str, Any]]: 订单字典，如果不存在返回 None
+        
+    Raises:
+        asyncio.TimeoutError: 查询超出 timeout_ms 被数据库取消
+    """
+    with SessionLocal(bind=bind) as session:
+        if timeout_ms is not None and bind.dialect.name == "postgresql":
+            # 只对本事务生效（等同于 SET LOCAL），会话关闭时回滚
+            session.execute(
+                text("SELECT set_config('statement_timeout', :timeout, true);"),
+                {"timeout": f"{max(int(timeout_ms), 1)}ms"}
+            )
+        try:
+            order = get_order_by_id(session, order_id)
+        except exc.DBAPIError as e:
+            if getattr(e.orig, "pgcode", None) == QUERY_CANCELED_PGCODE:
+                raise asyncio.TimeoutError() from e
+            raise
+        return order.to_dict() if order else None
+
+
+class OrderAgent:
+    """
+    订单 Agent 类
     
-    def extract_order_id(self, text: str) -> Optional[str]:
+    Agent 实例在进程内复用，不持有数据库会话；
+    每个请求的会话通过运行配置 config["configurable"]["db_session"] 传入。
+    """
+    
+    async def extract_order_id(self, text: str) -> Optional[str]:
         """
         从文本中提取订单ID
         使用多种方法：正则表达式 + LLM 备用方案
@@ -34,28 +141,10 @@ class OrderAgent:
             Optional[str]: 提取到的订单ID，如果未找到返回 None
         """
         # 方法 1: 使用正则表达式匹配常见的订单ID格式
-        patterns = [
-            # 带连字符的格式：ORD-2024-001, ORDER-123456
-            r'(?:订单|订单号|order)[：:\s]*([A-Z]{2,}[-_]?\d{4}[-_]?\d{3,})',
-            r'([A-Z]{2,}[-_]?\d{4}[-_]?\d{3,})',  # ORD-2024-001, ORD_2024_001
-            # 带冒号或空格的格式
-            r'订单[：:]\s*([A-Z0-9\-_]+)',  # 订单：ORDER123, 订单: ORD-2024-001
-            r'订单号[：:]\s*([A-Z0-9\-_]+)',  # 订单号：ORDER123
-            r'order[：:]\s*([A-Z0-9\-_]+)',  # order: ORDER123
-            # 纯字母+数字格式（不含连字符）
-            r'([A-Z]{2,}\d{3,})',  # ORDER123, ORD123456
-            # 纯数字格式（8位以上）
-            r'(\d{8,})',  # 12345678
-        ]
-        
-        for pattern in patterns:
-            matches = re.finditer(pattern, text, re.IGNORECASE)
-            for match in matches:
-                order_id = match.group(1).strip()
-                # 验证订单ID格式（至少包含字母和数字）
-                if len(order_id) >= 5:  # 最小长度检查
-                    logger.info(f"通过正则表达式提取到订单ID: {order_id}")
-                    return order_id
+        order_id = match_order_id(text)
+        if order_id:
+            logger.info(f"通过正则表达式提取到订单ID: {order_id}")
+            return order_id
         
         # 方法 2: 如果正则表达式失败，使用 LLM 提取
         logger.info("正则表达式未匹配到订单ID，尝试使用 LLM 提取")
@@ -71,7 +160,7 @@ class OrderAgent:
 
 订单ID："""
             
-            response = llm_client.generate_text(
+            response = await llm_client.agenerate_text(
                 prompt=extract_prompt,
                 temperature=0.1,
                 max_tokens=50
@@ -96,20 +185,50 @@ class OrderAgent:
         
         return None
     
-    def process(self, state: Dict[str, Any], db: Optional[Session] = None) -> Dict[str, Any]:
+    async def process(
+        self,
+        state: Dict[str, Any],
+        config: Optional[RunnableConfig] = None
+    ) -> Dict[str, Any]:
         """
         处理订单查询
         
+        ORDER_ANSWER_MODE 为 template 时直接按模板渲染回答（写入 'response'），
+        工作流在 order 节点结束，不再调用 LLM 生成回答；
+        多意图查询（'intents' 多于一个）时由 LLM 统一回答，不使用模板。
+        提取订单ID和查询订单受延迟预算（'deadline'）限制，超时时返回查询失败的提示。
+        
         Args:
             state: 当前状态字典，包含 'user_input' 或 'input'
-            db: 数据库会话（如果未在初始化时提供）
+            config: LangGraph 运行配置，数据库会话位于 config["configurable"]["db_session"]
             
         Returns:
             Dict[str, Any]: 更新后的状态，包含 'order' 键
         """
+        result = await self._lookup(state, config)
+        if settings.ORDER_ANSWER_MODE != "template" or len(state.get("intents") or []) > 1:
+            return result
+        
+        renderer = get_order_answer_renderer()
+        if result.get("order"):
+            response = renderer.render(
+                result["order"],
+                email_prompt=result.get("order_email_prompt", False),
+                email_address=result.get("order_customer_email")
+            )
+        else:
+            response = renderer.render_error(result.get("error"), result.get("order_id"))
+        return {**result, "response": response}
+    
+    async def _lookup(
+        self,
+        state: Dict[str, Any],
+        config: Optional[RunnableConfig] = None
+    ) -> Dict[str, Any]:
+        """提取订单ID并查询订单"""
         try:
-            # 获取数据库会话
-            session = db or self.db
+            # 从运行配置中获取数据库会话
+            session = ((config or {}).get("configurable") or {}).get("db_session")
             if not session:
                 logger.error("数据库会话未提供")
                 return {**state, "order": None, "error": "数据库连接失败"}
@@ -117,8 +236,11 @@ class OrderAgent:
             # 获取用户输入
             user_input = state.get("user_input") or state.get("input", "")
             
-            # 提取订单ID
-            order_id = self.extract_order_id(user_input)
+            # 提取订单ID（正则未命中时调用 LLM，为回答生成保留 LATENCY_MIN_GENERATION_MS）
+            reserve_ms = settings.LATENCY_MIN_GENERATION_MS
+            order_id = match_order_id(user_input) or await run_within(
+                self.extract_order_id(user_input), state, reserve_ms=reserve_ms
+            )
             
             if not order_id:
                 logger.warning(f"未能从输入中提取订单ID: {user_input}")
@@ -128,14 +250,22 @@ class OrderAgent:
                     "error": "未能识别订单ID，请提供订单号"
                 }
             
-            # 查询订单
-            order = get_order_by_id(session, order_id)
+            # 查询订单（同步 SQLAlchemy 查询放到线程池，避免阻塞事件循环；
+            # 线程使用自己的会话，语句超时取剩余预算，超时后不会留下仍在使用请求会话的线程）
+            remaining = remaining_ms(state)
+            timeout_ms = None if remaining is None else max(remaining - reserve_ms, 0.0)
+            order = await run_within(
+                asyncio.to_thread(query_order, session.get_bind(), order_id, timeout_ms),
+                state,
+                reserve_ms=reserve_ms
+            )
             
             if not order:
                 logger.warning(f"订单不存在: {order_id}")
                 return {
                     **state,
                     "order": None,
+                    "order_id": order_id,
                     "error": f"未找到订单 {order_id}"
                 }
             
@@ -143,19 +273,21 @@ class OrderAgent:
             
             return {
                 **state,
-                "order": order.to_dict() if hasattr(order, 'to_dict') else {
-                    "order_id": order.order_id,
-                    "customer_name": order.customer_name,
-                    "product": order.product,
-                    "status": order.status,
-                    "amount": order.amount
-                },
+                "order": order,
                 "order_id": order_id,
                 "order_email_prompt": True,
                 "order_can_send_email": True,
-                "order_customer_email": order.customer_email
+                "order_customer_email": order.get("customer_email")
             }
             
+        except asyncio.TimeoutError:
+            logger.warning("订单查询超出延迟预算")
+            return {
+                **state,
+                "order": None,
+                "error": "订单查询超时",
+                "degradations": add_degradation(state, DEGRADE_ORDER_TIMEOUT)
+            }
         except Exception as e:
             logger.error(f"订单 Agent 处理失败: {str(e)}")
             return {**state, "order": None, "error": str(e)}
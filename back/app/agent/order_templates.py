@@ -0,0 +1,158 @@
+"""
+订单回答模板
+订单查询已经拿到完整的结构化订单，直接按模板渲染回答，不再调用 LLM
+
+ORDER_ANSWER_MODE=template（默认）时由 OrderAgent 渲染回答，工作流在 order 节点结束；
+ORDER_ANSWER_MODE=llm 时保持原有流程，由 LLMAgent 生成回答。
+"""
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+# 订单状态的中文描述（未列出的状态原样展示）
+ORDER_STATUS_TEXT = {
+    "pending": "待处理，我们会尽快为您处理",
+    "paid": "已付款，正在等待发货",
+    "processing": "处理中，商品正在准备发货",
+    "shipped": "已发货，正在配送途中",
+    "in_transit": "运输中，请留意物流信息",
+    "delivered": "已送达，请注意查收",
+    "completed": "已完成",
+    "cancelled": "已取消",
+    "canceled": "已取消",
+    "refunding": "退款处理中",
+    "refunded": "已退款，款项将原路返回",
+    "returned": "已退货",
+    "failed": "处理失败，请联系人工客服",
+}
+
+# 订单字段的展示名称和顺序
+ORDER_FIELD_LABELS = {
+    "product": "商品",
+    "amount": "金额",
+    "customer_name": "收件人",
+    "created_at": "下单时间",
+    "updated_at": "最近更新",
+}
+
+ORDER_ANSWER_TEMPLATE = "您的订单 {order_id} 当前状态：{status_text}。"
+
+EMAIL_PROMPT_TEMPLATE = "需要将订单信息发送到您的邮箱{email}吗？请回复“发送”确认，确认之前我们不会发送。"
+
+NOT_FOUND_TEMPLATE = "抱歉，没有找到订单 {order_id}，请核对订单号后重试。"
+
+MISSING_ID_TEMPLATE = "请提供您的订单号（例如 ORD-2024-001），我来帮您查询订单状态。"
+
+ERROR_TEMPLATE = "抱歉，查询订单时出现错误，请稍后再试。"
+
+
+def _format_value(field: str, value: Any) -> str:
+    """格式化字段值（金额保留两位小数，时间精确到分钟）"""
+    if field == "amount" and isinstance(value, (int, float)):
+        return f"¥{value:.2f}"
+    if field in ("created_at", "updated_at") and isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value).strftime("%Y-%m-%d %H:%M")
+        except ValueError:
+            return value
+    return str(value)
+
+
+class OrderAnswerRenderer:
+    """订单回答渲染器（模板和状态描述可在构造时替换）"""
+
+    def __init__(
+        self,
+        status_text: Optional[Dict[str, str]] = None,
+        field_labels: Optional[Dict[str, str]] = None,
+        answer_template: str = ORDER_ANSWER_TEMPLATE,
+        email_prompt_template: str = EMAIL_PROMPT_TEMPLATE
+    ):
+        """
+        初始化渲染器
+
+        Args:
+            status_text: 订单状态到中文描述的映射，默认 ORDER_STATUS_TEXT
+            field_labels: 展示的订单字段及名称，默认 ORDER_FIELD_LABELS
+            answer_template: 回答首句模板（可用 order_id / status / status_text）
+            email_prompt_template: 邮件确认提示模板（可用 email）
+        """
+        self.status_text = status_text or ORDER_STATUS_TEXT
+        self.field_labels = field_labels or ORDER_FIELD_LABELS
+        self.answer_template = answer_template
+        self.email_prompt_template = email_prompt_template
+
+    def describe_status(self, status: Optional[str]) -> str:
+        """
+        将订单状态转换为中文描述
+
+        Args:
+            status: 订单状态
+
+        Returns:
+            str: 状态描述
+        """
+        if not status:
+            return "未知"
+        return self.status_text.get(status.strip().lower(), status)
+
+    def render(
+        self,
+        order: Dict[str, Any],
+        email_prompt: bool = False,
+        email_address: Optional[str] = None
+    ) -> str:
+        """
+        渲染订单回答
+
+        Args:
+            order: 订单字典（OrderAgent 的查询结果）
+            email_prompt: 是否询问用户是否发送订单邮件
+            email_address: 客户邮箱
+
+        Returns:
+            str: 回答文本
+        """
+        lines = [self.answer_template.format(
+            order_id=order.get("order_id", ""),
+            status=order.get("status", ""),
+            status_text=self.describe_status(order.get("status"))
+        )]
+        for field, label in self.field_labels.items():
+            value = order.get(field)
+            if value not in (None, ""):
+                lines.append(f"{label}：{_format_value(field, value)}")
+        answer = "\n".join(lines)
+        if email_prompt:
+            email = f" {email_address} " if email_address else ""
+            answer += "\n\n" + self.email_prompt_template.format(email=email)
+        return answer
+
+    @staticmethod
+    def render_error(error: Optional[str], order_id: Optional[str] = None) -> str:
+        """
+        渲染订单查询失败时的回答
+
+        Args:
+            error: OrderAgent 返回的错误信息
+            order_id: 已识别的订单ID（订单不存在时）
+
+        Returns:
+            str: 回答文本
+        """
+        if order_id:
+            return NOT_FOUND_TEMPLATE.format(order_id=order_id)
+        if error and "订单ID" in error:
+            return MISSING_ID_TEMPLATE
+        return ERROR_TEMPLATE
+
+
+# 全局渲染器实例（延迟初始化）
+order_answer_renderer = None
+
+
+def get_order_answer_renderer() -> OrderAnswerRenderer:
+    """获取订单回答渲染器实例（单例模式）"""
+    global order_answer_renderer
+    if order_answer_renderer is None:
+        order_answer_renderer = OrderAnswerRenderer()
+    return order_answer_renderer
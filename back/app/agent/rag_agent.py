@@ -2,8 +2,13 @@
 RAG Agent
 负责从知识库检索相关信息
 """
+import asyncio
 from typing import Dict, Any, List
-from app.rag.rag_service import retrieve_documents
+from app.agent.latency_budget import DEGRADE_RETRIEVAL_TIMEOUT, DEGRADE_SKIP_RETRIEVAL, add_degradation, remaining_ms, run_within
+from app.config import settings
+from app.rag.fast_answer import get_fast_answer_selector
+from app.rag.rag_service import aretrieve_documents, rag_service
+from app.rag.semantic_cache import get_semantic_cache
 from app.utils.logger import logger
 
 
@@ -18,17 +23,29 @@ class RAGAgent:
             top_k: 返回前 k 个最相关的文档
         """
         self.top_k = top_k
+        self.semantic_cache = get_semantic_cache()
     
-    def process(self, state: Dict[str, Any]) -> Dict[str, Any]:
+    async def process(self, state: Dict[str, Any]) -> Dict[str, Any]:
         """
         处理 RAG 检索
         
+        检索前先查询语义缓存：命中时直接写入 'response'，工作流跳过 LLM 节点。
+        启用快速回答（RAG_FAST_ANSWER_ENABLED）且最佳分块的相似度和领先幅度达到阈值时，
+        直接返回该分块原文和来源，同样跳过 LLM 节点。
+        路由节点已推测执行过检索时（rag_prefetched）直接复用结果。
+        多意图查询（'intents' 多于一个）时只检索，由 LLM 统一回答。
+        剩余延迟预算低于 LATENCY_SKIP_RETRIEVAL_MS 时跳过检索；语义缓存查询和检索超时时放弃结果，
+        为回答生成保留 LATENCY_MIN_GENERATION_MS。
+        
         Args:
             state: 当前状态字典，包含 'user_input' 或 'input'
             
         Returns:
-            Dict[str, Any]: 更新后的状态，包含 'documents' 键
+            Dict[str, Any]: 更新后的状态，包含 'documents' 和 'kb_version' 键
         """
+        if state.get("rag_prefetched"):
+            return state
+        
         try:
             # 获取用户输入
             user_input = state.get("user_input") or state.get("input", "")
@@ -37,19 +54,69 @@ class RAGAgent:
                 logger.warning("用户输入为空，无法进行 RAG 检索")
                 return {**state, "documents": []}
             
-            # 检索相关文档
-            documents = retrieve_documents(user_input, top_k=self.top_k)
+            kb_version = await rag_service.aget_kb_version()
+            remaining = remaining_ms(state)
+            if remaining is not None and remaining < settings.LATENCY_SKIP_RETRIEVAL_MS:
+                logger.warning(f"剩余延迟预算 {remaining:.0f}ms 不足，跳过检索")
+                return {
+                    **state,
+                    "documents": [],
+                    "kb_version": kb_version,
+                    "degradations": add_degradation(state, DEGRADE_SKIP_RETRIEVAL)
+                }
+            
+            multi_intent = len(state.get("intents") or []) > 1
+            reserve_ms = settings.LATENCY_MIN_GENERATION_MS
+            try:
+                # 先查语义缓存（知识库版本变化后旧答案不会命中）
+                cached = None if multi_intent else await run_within(
+                    self.semantic_cache.alookup(user_input, kb_version), state, reserve_ms=reserve_ms
+                )
+                if cached:
+                    return {
+                        **state,
+                        "documents": cached["documents"],
+                        "response": cached["response"],
+                        "semantic_cache_hit": True,
+                        "kb_version": kb_version
+                    }
+                
+                # 检索相关文档
+                documents = await run_within(
+                    aretrieve_documents(user_input, top_k=self.top_k), state, reserve_ms=reserve_ms
+                )
+            except asyncio.TimeoutError:
+                logger.warning(f"检索超出延迟预算，放弃检索结果: {user_input[:50]}...")
+                return {
+                    **state,
+                    "documents": [],
+                    "kb_version": kb_version,
+                    "degradations": add_degradation(state, DEGRADE_RETRIEVAL_TIMEOUT)
+                }
             
             if not documents:
                 logger.warning(f"未检索到相关文档: {user_input[:50]}...")
-                return {**state, "documents": []}
+                return {**state, "documents": [], "kb_version": kb_version}
             
             logger.info(f"成功检索到 {len(documents)} 个相关文档")
             
+            if settings.RAG_FAST_ANSWER_ENABLED and not multi_intent:
+                selector = get_fast_answer_selector()
+                selection = selector.select(documents)
+                if selection:
+                    return {
+                        **state,
+                        "documents": documents,
+                        "response": selector.render(selection),
+                        "rag_fast_answer": selector.source(selection),
+                        "kb_version": kb_version
+                    }
+            
             return {
                 **state,
                 "documents": documents,
-                "rag_query": user_input
+                "rag_query": user_input,
+                "kb_version": kb_version
             }
             
         except Exception as e:
@@ -2,8 +2,12 @@
 路由 Agent
 负责判断用户意图并路由到相应的处理流程
 """
+import asyncio
 from typing import Dict, Any
+from app.agent.intent_classifier import get_intent_classifier
+from app.agent.latency_budget import DEGRADE_INTENT_LOCAL, add_degradation, run_within
 from app.clients.llm_client import get_llm_client
+from app.config import settings
 from app.utils.logger import logger
 
 
@@ -13,6 +17,7 @@ class RouterAgent:
     def __init__(self):
         """初始化路由 Agent"""
         self._llm_client = None
+        self.classifier = get_intent_classifier()
     
     @property
     def llm_client(self):
@@ -21,36 +26,60 @@ class RouterAgent:
             self._llm_client = get_llm_client()
         return self._llm_client
     
-    def process(self, state: Dict[str, Any]) -> Dict[str, Any]:
+    async def process(self, state: Dict[str, Any]) -> Dict[str, Any]:
         """
         处理状态，判断用户意图
         
+        启用多意图（AGENT_MULTI_INTENT）时，按分句检测其他意图写入 'intents'，
+        同时包含 order 和 rag 时工作流并行执行两个分支。
+        延迟预算（'deadline'）不足以等待 LLM 分类时，使用规则 / 本地模型的分类结果。
+        
         Args:
             state: 当前状态字典，包含 'input' 键（用户输入）
             
         Returns:
-            Dict[str, Any]: 更新后的状态，包含 'intent' 键
+            Dict[str, Any]: 更新后的状态，包含 'intent'、'intents' 和 'intent_tier' 键
         """
         try:
             user_input = state.get("input", "")
             
             if not user_input:
                 logger.warning("用户输入为空，默认返回 chat 意图")
-                return {**state, "intent": "chat"}
+                return {**state, "intent": "chat", "intents": ["chat"], "intent_tier": "rules"}
             
-            # 调用 LLM 分类意图
-            intent = self.llm_client.classify_intent(user_input)
+            # 分层分类：规则 → 本地模型 → LLM（为回答生成保留 LATENCY_MIN_GENERATION_MS）
+            degradations = state.get("degradations") or []
+            try:
+                result = await run_within(
+                    self.classifier.aclassify(user_input, self.llm_client),
+                    state,
+                    reserve_ms=settings.LATENCY_MIN_GENERATION_MS
+                )
+            except asyncio.TimeoutError:
+                logger.warning("延迟预算不足，使用本地模型的意图分类结果")
+                result = self.classifier.classify_rules(user_input) or self.classifier.classify_model(user_input)
+                degradations = add_degradation(state, DEGRADE_INTENT_LOCAL)
+            intents = [result["intent"]]
+            if settings.AGENT_MULTI_INTENT:
+                intents = self.classifier.detect_intents(user_input, result["intent"])
             
-            logger.info(f"用户意图分类结果: {intent}, 输入: {user_input[:50]}...")
+            logger.info(
+                f"用户意图分类结果: {intents}, 分类层: {result['tier']}, "
+                f"置信度: {result['confidence']}, 输入: {user_input[:50]}..."
+            )
             
             return {
                 **state,
-                "intent": intent,
-                "user_input": user_input
+                "intent": intents[0],
+                "intents": intents,
+                "intent_tier": result["tier"],
+                "intent_confidence": result["confidence"],
+                "user_input": user_input,
+                "degradations": degradations
             }
             
         except Exception as e:
             logger.error(f"路由 Agent 处理失败: {str(e)}")
             # 出错时默认返回 chat
-            return {**state, "intent": "chat"}
+            return {**state, "intent": "chat", "intents": ["chat"]}
 
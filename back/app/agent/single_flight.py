@@ -0,0 +1,118 @@
+"""
+查询合并模块（single-flight）
+同一时刻重复的查询只执行一次工作流，其余请求等待同一个执行结果
+
+合并键为归一化后的查询文本 + 知识库版本号，只合并与用户无关的查询：
+- 只合并默认线程的查询，指定 thread_id 的会话由各自的 checkpoint 记录，不合并
+- 包含订单ID或本地分类为订单意图的查询不合并
+- 需要 LLM 分类、执行后才发现是订单意图的查询，等待方不使用该结果，各自重新执行
+
+执行放在独立任务中，发起请求的客户端断开不会影响其他等待方。
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from app.agent.intent_classifier import get_intent_classifier, normalize_text
+from app.agent.order_agent import match_order_id
+from app.config import settings
+from app.utils.logger import logger
+
+
+def coalesce_key(query: str, thread_id: str, kb_version: int) -> Optional[str]:
+    """
+    计算查询的合并键
+
+    Args:
+        query: 用户查询文本
+        thread_id: 线程ID
+        kb_version: 当前知识库版本号
+
+    Returns:
+        Optional[str]: 合并键，不应合并时返回 None
+    """
+    if not settings.QUERY_COALESCING_ENABLED or thread_id != "default":
+        return None
+    normalized = normalize_text(query)
+    if not normalized or match_order_id(query):
+        return None
+    classifier = get_intent_classifier()
+    result = classifier.classify_rules(query) or classifier.classify_model(query)
+    if result["intent"] == "order":
+        return None
+    return f"{kb_version}:{normalized}"
+
+
+class SingleFlight:
+    """进程内的查询合并器"""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "executions": 0, "coalesced": 0, "bypassed": 0, "reexecuted": 0}
+
+    def _release(self, key: str, task: asyncio.Task) -> None:
+        """执行结束后移除合并键（只移除对应的任务）"""
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    def record_bypass(self) -> None:
+        """记录一次不参与合并的查询"""
+        with self._lock:
+            self._stats["bypassed"] += 1
+
+    def record_reexecution(self) -> None:
+        """记录一次等待方放弃共享结果、重新执行的查询"""
+        with self._lock:
+            self._stats["reexecuted"] += 1
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        执行或等待同一合并键的查询
+
+        Args:
+            key: 合并键
+            fn: 执行查询的协程函数
+
+        Returns:
+            Tuple[Any, bool]: (查询结果, 是否为等待方共享的结果)
+        """
+        task = self._inflight.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._release(key, done))
+        else:
+            logger.debug(f"合并重复查询: {key[:50]}")
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["coalesced" if shared else "executions"] += 1
+        return await asyncio.shield(task), shared
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取合并统计
+
+        Returns:
+            Dict[str, Any]: 参与合并的请求数、实际执行次数、合并次数和合并比例
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        return {
+            "enabled": settings.QUERY_COALESCING_ENABLED,
+            "inflight": len(self._inflight),
+            **stats,
+            "coalescing_ratio": stats["coalesced"] / stats["requests"] if stats["requests"] else 0.0,
+        }
+
+
+# 全局查询合并器实例（延迟初始化）
+single_flight = None
+
+
+def get_single_flight() -> SingleFlight:
+    """获取查询合并器实例（单例模式）"""
+    global single_flight
+    if single_flight is None:
+        single_flight = SingleFlight()
+    return single_flight
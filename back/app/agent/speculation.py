@@ -0,0 +1,187 @@
+"""
+推测执行模块
+意图分类与 RAG 检索并发执行，知识类问题的关键路径上省去检索耗时
+
+SpeculativeRouter 替代工作流中的 router 节点：
+- 先同步执行本地快速分类（规则 / 模型）：确定不含 rag 意图时（问候、带订单号的查询等）不创建检索任务
+- 否则先创建 RAG 检索任务，再执行意图分类
+- 需要调用 LLM 分类时，检索与 LLM 调用重叠执行
+- 意图包含 rag 时检索结果写入状态（rag_prefetched=True），rag 节点直接复用；否则取消或丢弃检索结果
+- 多意图查询只复用检索到的分块，不使用语义缓存或快速回答给出的答案（由 LLM 统一回答）
+"""
+import asyncio
+import threading
+import time
+from typing import Any, Dict, Optional
+from app.agent.intent_classifier import get_intent_classifier
+from app.agent.latency_budget import merge_degradations
+from app.config import settings
+from app.utils.logger import logger
+
+# 检索结果中写入状态的键（与 RAGAgent 的返回值一致）
+RAG_RESULT_KEYS = ("documents", "kb_version", "response", "semantic_cache_hit", "rag_fast_answer", "rag_query", "error")
+
+# 检索结果中属于最终答案的键（多意图查询时不复用）
+RAG_ANSWER_KEYS = ("response", "semantic_cache_hit", "rag_fast_answer")
+
+
+class SpeculationStats:
+    """推测执行统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {
+            "speculations": 0,
+            "skipped": 0,
+            "used": 0,
+            "cancelled_before_start": 0,
+            "discarded": 0,
+            "overlap_ms_sum": 0.0,
+            "wasted_ms_sum": 0.0,
+        }
+
+    def record(self, outcome: str, overlap_ms: float = 0.0, wasted_ms: float = 0.0) -> None:
+        """
+        记录一次推测执行结果
+
+        Args:
+            outcome: skipped（本地分类确定不含 rag，未创建检索任务）/ used（结果被使用）/
+                cancelled_before_start（检索尚未开始即取消）/ discarded（已执行的检索被丢弃）
+            overlap_ms: 检索与分类重叠的时间（即关键路径上节省的时间）
+            wasted_ms: 被丢弃的检索已经执行的时间
+        """
+        with self._lock:
+            self._stats["speculations"] += 1
+            self._stats[outcome] += 1
+            self._stats["overlap_ms_sum"] += overlap_ms
+            self._stats["wasted_ms_sum"] += wasted_ms
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取推测执行统计
+
+        Returns:
+            Dict[str, Any]: 使用 / 丢弃次数、平均节省时间和浪费的检索时间
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        total = stats["speculations"]
+        return {
+            **stats,
+            "used_rate": stats["used"] / total if total else 0.0,
+            "avg_saved_ms": stats["overlap_ms_sum"] / stats["used"] if stats["used"] else 0.0,
+            "avg_wasted_ms": stats["wasted_ms_sum"] / stats["discarded"] if stats["discarded"] else 0.0,
+        }
+
+
+class SpeculativeRouter:
+    """意图分类与 RAG 检索并发执行的路由节点"""
+
+    def __init__(
+        self,
+        router_agent: Any,
+        rag_agent: Any,
+        stats: Optional[SpeculationStats] = None,
+        classifier: Any = None
+    ):
+        """
+        初始化推测路由
+
+        Args:
+            router_agent: RouterAgent 实例
+            rag_agent: RAGAgent 实例
+            stats: 统计对象，默认使用全局统计
+            classifier: 预判是否需要检索的意图分类器，默认使用全局分类器
+        """
+        self.router_agent = router_agent
+        self.rag_agent = rag_agent
+        self.stats = stats or get_speculation_stats()
+        self.classifier = classifier or get_intent_classifier()
+
+    def _may_need_rag(self, text: str) -> bool:
+        """
+        本地快速分类预判是否可能需要检索（不让出事件循环）
+
+        Args:
+            text: 用户输入
+
+        Returns:
+            bool: 本地分类无法确定，或确定的意图包含 rag 时返回 True
+        """
+        result = self.classifier.classify_fast(text, record=False)
+        if result is None:
+            return True
+        intents = [result["intent"]]
+        if settings.AGENT_MULTI_INTENT:
+            intents = self.classifier.detect_intents(text, result["intent"])
+        return "rag" in intents
+
+    async def process(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        并发执行意图分类和 RAG 检索
+
+        Args:
+            state: 当前状态字典，包含 'input' 键（用户输入）
+
+        Returns:
+            Dict[str, Any]: 路由结果；意图包含 rag 时附带检索结果和 rag_prefetched=True
+        """
+        if not state.get("input"):
+            return await self.router_agent.process(state)
+        if not self._may_need_rag(state["input"]):
+            # 不能先创建任务再取消：路由节点在 run_within 中等待分类时会让出事件循环，检索任务会真正开始执行
+            self.stats.record("skipped")
+            return await self.router_agent.process(state)
+
+        timing: Dict[str, float] = {}
+
+        async def retrieve() -> Dict[str, Any]:
+            timing["started"] = time.perf_counter()
+            try:
+                return await self.rag_agent.process({**state, "user_input": state["input"]})
+            finally:
+                timing["finished"] = time.perf_counter()
+
+        rag_task = asyncio.create_task(retrieve())
+        try:
+            routed = await self.router_agent.process(state)
+        except BaseException:
+            rag_task.cancel()
+            raise
+        classified_at = time.perf_counter()
+
+        intents = routed.get("intents") or [routed.get("intent")]
+        if "rag" not in intents:
+            rag_task.cancel()
+            if "started" not in timing:
+                self.stats.record("cancelled_before_start")
+            else:
+                wasted = (timing.get("finished") or classified_at) - timing["started"]
+                self.stats.record("discarded", wasted_ms=wasted * 1000)
+                logger.debug(f"丢弃推测检索结果，意图: {routed.get('intent')}")
+            return routed
+
+        retrieved = await rag_task
+        overlap = 0.0
+        if "started" in timing:
+            overlap = max(min(timing["finished"], classified_at) - timing["started"], 0.0)
+        self.stats.record("used", overlap_ms=overlap * 1000)
+        keys = [key for key in RAG_RESULT_KEYS if len(intents) == 1 or key not in RAG_ANSWER_KEYS]
+        return {
+            **routed,
+            **{key: retrieved[key] for key in keys if key in retrieved},
+            "degradations": merge_degradations(routed.get("degradations"), retrieved.get("degradations")),
+            "rag_prefetched": True
+        }
+
+
+# 全局推测执行统计（延迟初始化）
+speculation_stats = None
+
+
+def get_speculation_stats() -> SpeculationStats:
+    """获取推测执行统计实例（单例模式）"""
+    global speculation_stats
+    if speculation_stats is None:
+        speculation_stats = SpeculationStats()
+    return speculation_stats
@@ -32,7 +32,7 @@ async def send_order_email(order: Order) -> bool:
         }
         
         # 发送 POST 请求到 n8n webhook
-        async with httpx.AsyncClient(timeout=30.0) as client:
+        async with httpx.AsyncClient(timeout=settings.N8N_TIMEOUT) as client:
             response = await client.post(
                 settings.N8N_WEBHOOK_URL,
                 json=payload,
@@ -79,7 +79,7 @@ def send_order_email_sync(order: Order) -> bool:
         }
         
         # 使用同步客户端发送请求
-        with httpx.Client(timeout=30.0) as client:
+        with httpx.Client(timeout=settings.N8N_TIMEOUT) as client:
             response = client.post(
                 settings.N8N_WEBHOOK_URL,
                 json=payload,
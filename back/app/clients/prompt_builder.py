@@ -0,0 +1,275 @@
+"""
+回答提示构建模块
+按 token 预算组装回答提示，保证每次回答的输入长度有上限
+
+预算分配顺序（PROMPT_TOKEN_BUDGET 为用户提示的总预算，不含系统提示）：
+1. 用户问题和指令：始终完整保留
+2. 订单信息：排在检索结果之前，超出剩余预算时按句截断
+3. 知识库检索结果：按分数从高到低依次放入，放不下的分块按句截断，
+   剩余预算不足 PROMPT_MIN_CHUNK_TOKENS 时丢弃其余分块
+
+token 数用本地规则估算（中日韩字符按 1 个 token，其余字符按 4 个字符 1 个 token），
+不调用接口，估算值略高于 Gemini 实际计数。
+"""
+import math
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from app.config import settings
+from app.utils.logger import logger
+
+# 中日韩文字及全角标点（按 1 字 1 token 估算）
+_CJK_RE = re.compile(r"[　-〿぀-ヿ㐀-䶿一-鿿가-힯豈-﫿＀-￯]")
+
+# 句子边界：中文句末标点、换行，或英文句号 / 问号 / 叹号后跟空白
+_SENTENCE_END_RE = re.compile(r"(?<=[。！？；\n])|(?<=[.!?;]\s)")
+
+# 截断标记
+ELLIPSIS = "……"
+
+
+def estimate_tokens(content: str) -> int:
+    """
+    估算文本的 token 数
+
+    Args:
+        content: 文本
+
+    Returns:
+        int: 估算的 token 数
+    """
+    if not content:
+        return 0
+    cjk = len(_CJK_RE.findall(content))
+    return cjk + math.ceil((len(content) - cjk) / 4)
+
+
+def truncate_to_tokens(content: str, max_tokens: int) -> Tuple[str, bool]:
+    """
+    按句截断文本到 token 上限以内
+
+    第一句就超出上限时按字符截断。
+
+    Args:
+        content: 文本
+        max_tokens: token 上限（含截断标记）
+
+    Returns:
+        Tuple[str, bool]: (截断后的文本, 是否发生截断)
+    """
+    if estimate_tokens(content) <= max_tokens:
+        return content, False
+    budget = max_tokens - estimate_tokens(ELLIPSIS)
+    if budget <= 0:
+        return "", True
+
+    kept: List[str] = []
+    used = 0
+    for sentence in _SENTENCE_END_RE.split(content):
+        cost = estimate_tokens(sentence)
+        if used + cost > budget:
+            break
+        kept.append(sentence)
+        used += cost
+    if not kept:
+        # 按字符截断（估算是单调的，逐字累加即可）
+        end = 0
+        while end < len(content) and estimate_tokens(content[:end + 1]) <= budget:
+            end += 1
+        kept = [content[:end]]
+    return "".join(kept).rstrip() + ELLIPSIS, True
+
+
+def format_order(order: Any) -> str:
+    """
+    将订单信息格式化为"字段: 值"行（省略空字段）
+
+    Args:
+        order: 订单字典或带 to_dict() 的对象
+
+    Returns:
+        str: 格式化后的订单信息
+    """
+    if not isinstance(order, dict):
+        order = order.to_dict() if hasattr(order, "to_dict") else str(order)
+    if not isinstance(order, dict):
+        return str(order)
+    return "\n".join(f"{key}: {value}" for key, value in order.items() if value not in (None, ""))
+
+
+def _document_text(doc: Any) -> str:
+    if isinstance(doc, dict):
+        return doc.get("text", doc.get("content", str(doc)))
+    return str(doc)
+
+
+def _rank_documents(documents: List[Any]) -> List[Any]:
+    """按分数从高到低排序（缺少分数时保持检索顺序）"""
+    scores = [doc.get("score") if isinstance(doc, dict) else None for doc in documents]
+    if any(score is None for score in scores):
+        return list(documents)
+    order = sorted(range(len(documents)), key=lambda i: scores[i], reverse=True)
+    return [documents[i] for i in order]
+
+
+class PromptBuilder:
+    """按 token 预算组装回答提示"""
+
+    def __init__(self, token_budget: Optional[int] = None, min_chunk_tokens: Optional[int] = None):
+        """
+        初始化提示构建器
+
+        Args:
+            token_budget: 用户提示的 token 预算，默认 PROMPT_TOKEN_BUDGET
+            min_chunk_tokens: 截断后的分块至少保留的 token 数，默认 PROMPT_MIN_CHUNK_TOKENS
+        """
+        self.token_budget = token_budget or settings.PROMPT_TOKEN_BUDGET
+        self.min_chunk_tokens = min_chunk_tokens or settings.PROMPT_MIN_CHUNK_TOKENS
+        self._lock = threading.Lock()
+        self._stats = {
+            "builds": 0,
+            "truncated_builds": 0,
+            "over_budget_builds": 0,
+            "total_tokens_sum": 0,
+            "max_tokens": 0,
+            "documents_dropped": 0,
+        }
+
+    @staticmethod
+    def _instructions(email_confirmation_required: bool, email_address: Optional[str]) -> str:
+        """邮件确认指令（需要时追加在问题之后）"""
+        if not email_confirmation_required:
+            return ""
+        instruction = (
+            "\n\n重要指令：用户刚刚查询了订单信息，请在回答中先介绍订单详情，"
+            "然后询问用户是否需要将订单信息发送到客户邮箱"
+        )
+        if email_address:
+            instruction += f"{email_address}"
+        instruction += (
+            "。在用户明确表示需要发送之前不要发送，也不要声称已经发送；"
+            "如果用户拒绝或未确认，请说明不会发送。"
+        )
+        return instruction
+
+    def build(
+        self,
+        user_input: str,
+        context: Optional[Dict[str, Any]] = None,
+        email_confirmation_required: bool = False,
+        email_address: Optional[str] = None
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        组装回答提示
+
+        Args:
+            user_input: 用户输入
+            context: 上下文信息（订单信息、RAG 检索结果等）
+            email_confirmation_required: 是否追加邮件确认指令
+            email_address: 客户邮箱
+
+        Returns:
+            Tuple[str, Dict[str, Any]]: (提示文本, 各部分 token 用量报告)
+        """
+        instructions = self._instructions(email_confirmation_required, email_address)
+        sections = {"question": 0, "instructions": estimate_tokens(instructions), "order": 0, "documents": 0}
+        report: Dict[str, Any] = {
+            "budget": self.token_budget,
+            "sections": sections,
+            "documents_used": 0,
+            "documents_truncated": 0,
+            "documents_dropped": 0,
+            "order_truncated": False,
+        }
+
+        if not context or ("order" not in context and "documents" not in context):
+            prompt = user_input + instructions
+            sections["question"] = estimate_tokens(user_input)
+            return self._finish(prompt, report)
+
+        question = "\n\n用户问题：" + user_input
+        header = "\n\n上下文信息：\n"
+        sections["question"] = estimate_tokens(header) + estimate_tokens(question)
+        remaining = self.token_budget - sections["question"] - sections["instructions"]
+
+        context_str = header
+        if "order" in context:
+            label = "订单信息：\n"
+            order_text, truncated = truncate_to_tokens(
+                format_order(context["order"]), max(remaining - estimate_tokens(label), 0)
+            )
+            report["order_truncated"] = truncated
+            if order_text:
+                context_str += f"{label}{order_text}\n"
+                sections["order"] = estimate_tokens(label) + estimate_tokens(order_text) + 1
+                remaining -= sections["order"]
+
+        if "documents" in context:
+            label = "知识库检索结果：\n"
+            remaining -= estimate_tokens(label)
+            lines: List[str] = []
+            ranked = _rank_documents(context["documents"] or [])
+            for doc in ranked:
+                prefix = f"{len(lines) + 1}. "
+                available = remaining - estimate_tokens(prefix) - 1
+                content = _document_text(doc)
+                # 放不下且剩余预算太少时跳过，后面更短的分块仍可能放得下
+                if estimate_tokens(content) > available and available < self.min_chunk_tokens:
+                    continue
+                text, truncated = truncate_to_tokens(content, available)
+                if not text:
+                    continue
+                line = f"{prefix}{text}\n"
+                lines.append(line)
+                remaining -= estimate_tokens(prefix) + estimate_tokens(text) + 1
+                report["documents_truncated"] += int(truncated)
+            report["documents_used"] = len(lines)
+            report["documents_dropped"] = len(ranked) - len(lines)
+            context_str += label + "".join(lines)
+            sections["documents"] = estimate_tokens(label) + sum(estimate_tokens(line) for line in lines)
+
+        return self._finish(context_str + question + instructions, report)
+
+    def _finish(self, prompt: str, report: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """汇总 token 用量并记录统计"""
+        report["total_tokens"] = estimate_tokens(prompt)
+        truncated = bool(report["order_truncated"] or report["documents_truncated"] or report["documents_dropped"])
+        with self._lock:
+            self._stats["builds"] += 1
+            self._stats["truncated_builds"] += int(truncated)
+            self._stats["over_budget_builds"] += int(report["total_tokens"] > self.token_budget)
+            self._stats["total_tokens_sum"] += report["total_tokens"]
+            self._stats["max_tokens"] = max(self._stats["max_tokens"], report["total_tokens"])
+            self._stats["documents_dropped"] += report["documents_dropped"]
+        logger.debug(f"回答提示 token 用量: {report}")
+        return prompt, report
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取提示构建统计
+
+        Returns:
+            Dict[str, Any]: 构建次数、截断次数、平均 / 最大 token 数等
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        builds = stats.pop("builds")
+        total = stats.pop("total_tokens_sum")
+        return {
+            "token_budget": self.token_budget,
+            "builds": builds,
+            "avg_tokens": total / builds if builds else 0.0,
+            **stats,
+        }
+
+
+# 全局提示构建器实例（延迟初始化）
+prompt_builder = None
+
+
+def get_prompt_builder() -> PromptBuilder:
+    """获取提示构建器实例（单例模式）"""
+    global prompt_builder
+    if prompt_builder is None:
+        prompt_builder = PromptBuilder()
+    return prompt_builder
@@ -0,0 +1,355 @@
+"""
+LLM 响应缓存模块
+对 generate_text / generate_json / classify_intent 的结果做精确匹配缓存
+
+缓存键由调用类型、模型、系统提示、用户提示、温度和最大 token 数哈希得到。
+缓存分两层：
+1. 进程内 LRU（带 TTL）
+2. 可选的 Redis 层（多 worker 共享）
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+from app.config import settings
+from app.utils.logger import logger
+
+# 依赖知识库内容的调用类型，知识库变化时需要失效
+KNOWLEDGE_DEPENDENT_KINDS = ("text", "json")
+
+REDIS_KEY_PREFIX = "llm_cache"
+
+
+class ResponseCache:
+    """LLM 响应缓存（进程内 LRU + 可选 Redis）"""
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        ttls: Optional[Dict[str, int]] = None,
+        redis_enabled: Optional[bool] = None,
+        enabled: Optional[bool] = None
+    ):
+        """
+        初始化响应缓存
+
+        Args:
+            max_entries: 进程内 LRU 最大条目数
+            ttls: 各调用类型的 TTL（秒），0 表示不缓存
+            redis_enabled: 是否启用 Redis 层
+            enabled: 是否启用缓存
+        """
+        self.enabled = settings.LLM_CACHE_ENABLED if enabled is None else enabled
+        self.max_entries = settings.LLM_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.ttls = ttls or {
+            "text": settings.LLM_CACHE_TTL_TEXT,
+            "json": settings.LLM_CACHE_TTL_JSON,
+            "intent": settings.LLM_CACHE_TTL_INTENT,
+        }
+        self.redis_enabled = (
+            settings.LLM_CACHE_REDIS_ENABLED if redis_enabled is None else redis_enabled
+        )
+
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+        self._async_redis = None
+        self._stats: Dict[str, int] = {
+            "memory_hits": 0,
+            "redis_hits": 0,
+            "misses": 0,
+            "sets": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+            "redis_errors": 0,
+        }
+        self._kind_stats: Dict[str, Dict[str, int]] = {}
+
+    @staticmethod
+    def make_key(
+        kind: str,
+        model: str,
+        system_prompt: Optional[str],
+        prompt: str,
+        temperature: float,
+        max_tokens: Optional[int]
+    ) -> str:
+        """
+        构建缓存键
+
+        Args:
+            kind: 调用类型（text / json / intent）
+            model: 模型名称
+            system_prompt: 系统提示
+            prompt: 用户提示
+            temperature: 温度参数
+            max_tokens: 最大 token 数
+
+        Returns:
+            str: 缓存键
+        """
+        raw = json.dumps(
+            [model, system_prompt or "", prompt, temperature, max_tokens],
+            ensure_ascii=False
+        )
+        return f"{kind}:{hashlib.sha256(raw.encode('utf-8')).hexdigest()}"
+
+    def is_cacheable(self, kind: Optional[str]) -> bool:
+        """判断该调用类型是否需要缓存"""
+        return self.enabled and kind is not None and self.ttls.get(kind, 0) > 0
+
+    # ========== 进程内 LRU ==========
+
+    def _memory_get(self, key: str) -> Optional[str]:
+        """从进程内 LRU 读取（过期条目会被删除）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                self._stats["expirations"] += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _memory_set(self, key: str, value: str, ttl: int) -> None:
+        """写入进程内 LRU，超出容量时淘汰最久未使用的条目"""
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    # ========== Redis 层 ==========
+
+    @staticmethod
+    def _redis_key(key: str) -> str:
+        return f"{REDIS_KEY_PREFIX}:{key}"
+
+    def _get_redis(self):
+        """延迟创建同步 Redis 客户端"""
+        if self._redis is None:
+            from redis import Redis
+            self._redis = Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                decode_responses=True
+            )
+        return self._redis
+
+    def _get_async_redis(self):
+        """延迟创建异步 Redis 客户端"""
+        if self._async_redis is None:
+            from redis.asyncio import Redis
+            self._async_redis = Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                decode_responses=True
+            )
+        return self._async_redis
+
+    def _record(self, kind: str, hit: bool, tier: Optional[str] = None) -> None:
+        """记录命中/未命中统计"""
+        with self._lock:
+            kind_stats = self._kind_stats.setdefault(kind, {"hits": 0, "misses": 0})
+            if hit:
+                self._stats[f"{tier}_hits"] += 1
+                kind_stats["hits"] += 1
+            else:
+                self._stats["misses"] += 1
+                kind_stats["misses"] += 1
+
+    def _record_redis_error(self, e: Exception) -> None:
+        with self._lock:
+            self._stats["redis_errors"] += 1
+        logger.warning(f"LLM 缓存 Redis 访问失败: {str(e)}")
+
+    # ========== 对外接口 ==========
+
+    def get(self, kind: str, key: str) -> Optional[str]:
+        """
+        同步读取缓存
+
+        Args:
+            kind: 调用类型
+            key: 缓存键
+
+        Returns:
+            Optional[str]: 命中时返回缓存内容
+        """
+        value = self._memory_get(key)
+        if value is not None:
+            self._record(kind, True, "memory")
+            return value
+
+        if self.redis_enabled:
+            try:
+                value = self._get_redis().get(self._redis_key(key))
+            except Exception as e:
+                self._record_redis_error(e)
+                value = None
+            if value is not None:
+                self._memory_set(key, value, self.ttls[kind])
+                self._record(kind, True, "redis")
+                return value
+
+        self._record(kind, False)
+        return None
+
+    async def aget(self, kind: str, key: str) -> Optional[str]:
+        """
+        异步读取缓存
+
+        Args:
+            kind: 调用类型
+            key: 缓存键
+
+        Returns:
+            Optional[str]: 命中时返回缓存内容
+        """
+        value = self._memory_get(key)
+        if value is not None:
+            self._record(kind, True, "memory")
+            return value
+
+        if self.redis_enabled:
+            try:
+                value = await self._get_async_redis().get(self._redis_key(key))
+            except Exception as e:
+                self._record_redis_error(e)
+                value = None
+            if value is not None:
+                self._memory_set(key, value, self.ttls[kind])
+                self._record(kind, True, "redis")
+                return value
+
+        self._record(kind, False)
+        return None
+
+    def set(self, kind: str, key: str, value: str) -> None:
+        """
+        同步写入缓存
+
+        Args:
+            kind: 调用类型
+            key: 缓存键
+            value: 缓存内容
+        """
+        ttl = self.ttls[kind]
+        self._memory_set(key, value, ttl)
+        with self._lock:
+            self._stats["sets"] += 1
+        if self.redis_enabled:
+            try:
+                self._get_redis().set(self._redis_key(key), value, ex=ttl)
+            except Exception as e:
+                self._record_redis_error(e)
+
+    async def aset(self, kind: str, key: str, value: str) -> None:
+        """
+        异步写入缓存
+
+        Args:
+            kind: 调用类型
+            key: 缓存键
+            value: 缓存内容
+        """
+        ttl = self.ttls[kind]
+        self._memory_set(key, value, ttl)
+        with self._lock:
+            self._stats["sets"] += 1
+        if self.redis_enabled:
+            try:
+                await self._get_async_redis().set(self._redis_key(key), value, ex=ttl)
+            except Exception as e:
+                self._record_redis_error(e)
+
+    def invalidate(self, kinds: Iterable[str] = KNOWLEDGE_DEPENDENT_KINDS, shared: bool = True) -> int:
+        """
+        失效指定调用类型的缓存（知识库变化时调用）
+
+        清除 Redis 需要同步扫描共享键空间，只应由写入知识库的一方在工作线程中执行一次；
+        其他 worker 发现版本号变化时只清除进程内缓存。
+
+        Args:
+            kinds: 需要失效的调用类型
+            shared: 是否同时清除 Redis 中的共享缓存
+
+        Returns:
+            int: 删除的条目数（进程内 + Redis）
+        """
+        kinds = tuple(kinds)
+        prefixes = tuple(f"{kind}:" for kind in kinds)
+        with self._lock:
+            stale = [key for key in self._entries if key.startswith(prefixes)]
+            for key in stale:
+                del self._entries[key]
+            self._stats["invalidations"] += 1
+        removed = len(stale)
+
+        if shared and self.redis_enabled:
+            try:
+                client = self._get_redis()
+                for kind in kinds:
+                    batch = []
+                    for redis_key in client.scan_iter(match=f"{REDIS_KEY_PREFIX}:{kind}:*", count=500):
+                        batch.append(redis_key)
+                        if len(batch) >= 500:
+                            removed += client.unlink(*batch)
+                            batch = []
+                    if batch:
+                        removed += client.unlink(*batch)
+            except Exception as e:
+                self._record_redis_error(e)
+
+        logger.info(f"LLM 响应缓存已失效: {', '.join(kinds)}，删除 {removed} 条")
+        return removed
+
+    def clear(self) -> None:
+        """清空进程内缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取缓存统计
+
+        Returns:
+            Dict[str, Any]: 命中/未命中计数、命中率、当前条目数等
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            kinds = {kind: dict(values) for kind, values in self._kind_stats.items()}
+            size = len(self._entries)
+        hits = stats["memory_hits"] + stats["redis_hits"]
+        lookups = hits + stats["misses"]
+        for values in kinds.values():
+            total = values["hits"] + values["misses"]
+            values["hit_rate"] = values["hits"] / total if total else 0.0
+        return {
+            "enabled": self.enabled,
+            "redis_enabled": self.redis_enabled,
+            "size": size,
+            "max_entries": self.max_entries,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            **stats,
+            "kinds": kinds,
+        }
+
+
+# 全局响应缓存实例（延迟初始化）
+response_cache = None
+
+
+def get_response_cache() -> ResponseCache:
+    """获取响应缓存实例（单例模式）"""
+    global response_cache
+    if response_cache is None:
+        response_cache = ResponseCache()
+    return response_cache
@@ -32,6 +32,114 @@ try:
         
         # n8n Webhook 配置
         N8N_WEBHOOK_URL: str = "https://your-n8n-instance/webhook/order_email"
+        N8N_TIMEOUT: float = 10.0
+        
+        # 意图分类快速通道配置（规则 + 本地模型，低置信度时才调用 LLM）
+        INTENT_FAST_PATH_ENABLED: bool = True
+        INTENT_MODEL_THRESHOLD: float = 0.75
+        INTENT_TRAINING_DATA: str = ""
+        
+        # LLM 响应缓存配置（精确匹配，TTL 单位：秒，0 表示不缓存该类调用）
+        LLM_CACHE_ENABLED: bool = True
+        LLM_CACHE_MAX_ENTRIES: int = 2048
+        LLM_CACHE_REDIS_ENABLED: bool = False
+        LLM_CACHE_TTL_TEXT: int = 3600
+        LLM_CACHE_TTL_JSON: int = 3600
+        LLM_CACHE_TTL_INTENT: int = 86400
+        
+        # 语义答案缓存配置
+        SEMANTIC_CACHE_ENABLED: bool = True
+        SEMANTIC_CACHE_THRESHOLD: float = 0.92
+        SEMANTIC_CACHE_MAX_ENTRIES: int = 1024
+        SEMANTIC_CACHE_TTL: int = 86400
+        
+        # 嵌入向量缓存配置
+        EMBEDDING_CACHE_ENABLED: bool = True
+        EMBEDDING_CACHE_DIR: str = ".cache/embeddings"
+        EMBEDDING_CACHE_DTYPE: str = "float16"
+        
+        # 批量嵌入配置
+        EMBEDDING_BATCH_SIZE: int = 100
+        EMBEDDING_MAX_CONCURRENCY: int = 4
+        EMBEDDING_MAX_RETRIES: int = 2
+        
+        # RAG 检索连接池配置
+        RAG_ASYNC_POOL_SIZE: int = 5
+        RAG_ASYNC_MAX_OVERFLOW: int = 10
+        
+        # 向量近似索引配置（hnsw / ivfflat / none）
+        RAG_ANN_INDEX_TYPE: str = "hnsw"
+        RAG_HNSW_M: int = 16
+        RAG_HNSW_EF_CONSTRUCTION: int = 64
+        RAG_HNSW_EF_SEARCH: int = 40
+        RAG_IVFFLAT_LISTS: int = 0
+        RAG_IVFFLAT_PROBES: int = 10
+        RAG_ANN_MAINTENANCE_WORK_MEM: str = "512MB"
+        
+        # 嵌入维度和存储精度（维度小于 3072 时截断并重新归一化；halfvec 为半精度存储）
+        RAG_EMBED_DIM: int = 3072
+        RAG_USE_HALFVEC: bool = False
+        
+        # 混合检索配置（向量 + 词法，RRF 融合）
+        RAG_HYBRID_ENABLED: bool = True
+        RAG_HYBRID_CANDIDATES: int = 20
+        RAG_RRF_K: int = 60
+        
+        # 本地向量索引配置（进程内 NumPy 检索，适合小中型知识库）
+        RAG_LOCAL_INDEX_ENABLED: bool = False
+        RAG_LOCAL_INDEX_DIR: str = ".cache/local_index"
+        RAG_LOCAL_INDEX_DTYPE: str = "float32"
+        
+        # 检索结果后处理（去重 / MMR / 合并相邻分块）
+        RAG_RERANK_ENABLED: bool = True
+        RAG_MMR_LAMBDA: float = 0.7
+        RAG_DEDUP_THRESHOLD: float = 0.95
+        RAG_MERGE_ADJACENT: bool = True
+        
+        # 回答提示 token 预算（不含系统提示）
+        PROMPT_TOKEN_BUDGET: int = 3000
+        PROMPT_MIN_CHUNK_TOKENS: int = 60
+        
+        # 订单回答模式（template: 按模板渲染，不调用 LLM；llm: 由 LLM 生成）
+        ORDER_ANSWER_MODE: str = "template"
+        
+        # RAG 快速回答（最佳分块相似度和领先幅度达到阈值时直接返回原文）
+        RAG_FAST_ANSWER_ENABLED: bool = False
+        RAG_FAST_ANSWER_MIN_SCORE: float = 0.85
+        RAG_FAST_ANSWER_MIN_MARGIN: float = 0.1
+        
+        # 推测执行（意图分类的同时执行 RAG 检索，意图不是 rag 时丢弃）
+        AGENT_SPECULATIVE_RAG: bool = True
+        
+        # 多意图查询（同时包含订单和知识库问题时并行执行两个分支）
+        AGENT_MULTI_INTENT: bool = True
+        
+        # 重复查询合并（single-flight，只合并与用户无关的查询）
+        QUERY_COALESCING_ENABLED: bool = True
+        
+        # 请求延迟预算（剩余时间不足时依次降级：跳过检索 → 改用更便宜的模型 → 模板 / 兜底回答；0 为不限制）
+        LATENCY_BUDGET_MS: int = 8000
+        LATENCY_BUDGET_GRACE_MS: int = 500
+        LATENCY_SKIP_RETRIEVAL_MS: int = 2500
+        LATENCY_CHEAP_MODEL_MS: int = 4000
+        LATENCY_MIN_GENERATION_MS: int = 1000
+        LLM_FALLBACK_MODEL: str = "gemini-2.5-flash-lite"
+        
+        # 批量查询（/query/batch，并发上限和单次最大查询数）
+        QUERY_BATCH_CONCURRENCY: int = 8
+        QUERY_BATCH_MAX_SIZE: int = 1000
+        
+        # LLM 跨请求微批（并发的查询嵌入和意图分类在时间窗口内合并为一次请求）
+        LLM_MICROBATCH_ENABLED: bool = True
+        LLM_MICROBATCH_WINDOW_MS: float = 5.0
+        LLM_MICROBATCH_MAX_EMBEDDINGS: int = 64
+        LLM_MICROBATCH_MAX_INTENTS: int = 16
+        
+        # 知识库版本号配置（多个 worker 共享，进程内缓存秒数）
+        RAG_KB_VERSION_TTL: float = 1.0
+        
+        # 查询嵌入内存缓存配置（查询嵌入不写入磁盘，按最久未使用淘汰）
+        EMBEDDING_CACHE_QUERY_MAX_ENTRIES: int = 2048
         
         # 应用配置
         DEBUG: bool = False
@@ -68,6 +176,114 @@ except ImportError:
             "N8N_WEBHOOK_URL",
             "https://your-n8n-instance/webhook/order_email"
         )
+        N8N_TIMEOUT: float = float(os.getenv("N8N_TIMEOUT", "10.0"))
+        
+        # 意图分类快速通道配置（规则 + 本地模型，低置信度时才调用 LLM）
+        INTENT_FAST_PATH_ENABLED: bool = os.getenv("INTENT_FAST_PATH_ENABLED", "True").lower() == "true"
+        INTENT_MODEL_THRESHOLD: float = float(os.getenv("INTENT_MODEL_THRESHOLD", "0.75"))
+        INTENT_TRAINING_DATA: str = os.getenv("INTENT_TRAINING_DATA", "")
+        
+        # LLM 响应缓存配置（精确匹配，TTL 单位：秒，0 表示不缓存该类调用）
+        LLM_CACHE_ENABLED: bool = os.getenv("LLM_CACHE_ENABLED", "True").lower() == "true"
+        LLM_CACHE_MAX_ENTRIES: int = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2048"))
+        LLM_CACHE_REDIS_ENABLED: bool = os.getenv("LLM_CACHE_REDIS_ENABLED", "False").lower() == "true"
+        LLM_CACHE_TTL_TEXT: int = int(os.getenv("LLM_CACHE_TTL_TEXT", "3600"))
+        LLM_CACHE_TTL_JSON: int = int(os.getenv("LLM_CACHE_TTL_JSON", "3600"))
+        LLM_CACHE_TTL_INTENT: int = int(os.getenv("LLM_CACHE_TTL_INTENT", "86400"))
+        
+        # 语义答案缓存配置
+        SEMANTIC_CACHE_ENABLED: bool = os.getenv("SEMANTIC_CACHE_ENABLED", "True").lower() == "true"
+        SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+        SEMANTIC_CACHE_MAX_ENTRIES: int = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1024"))
+        SEMANTIC_CACHE_TTL: int = int(os.getenv("SEMANTIC_CACHE_TTL", "86400"))
+        
+        # 嵌入向量缓存配置
+        EMBEDDING_CACHE_ENABLED: bool = os.getenv("EMBEDDING_CACHE_ENABLED", "True").lower() == "true"
+        EMBEDDING_CACHE_DIR: str = os.getenv("EMBEDDING_CACHE_DIR", ".cache/embeddings")
+        EMBEDDING_CACHE_DTYPE: str = os.getenv("EMBEDDING_CACHE_DTYPE", "float16")
+        
+        # 批量嵌入配置
+        EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "100"))
+        EMBEDDING_MAX_CONCURRENCY: int = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+        EMBEDDING_MAX_RETRIES: int = int(os.getenv("EMBEDDING_MAX_RETRIES", "2"))
+        
+        # RAG 检索连接池配置
+        RAG_ASYNC_POOL_SIZE: int = int(os.getenv("RAG_ASYNC_POOL_SIZE", "5"))
+        RAG_ASYNC_MAX_OVERFLOW: int = int(os.getenv("RAG_ASYNC_MAX_OVERFLOW", "10"))
+        
+        # 向量近似索引配置（hnsw / ivfflat / none）
+        RAG_ANN_INDEX_TYPE: str = os.getenv("RAG_ANN_INDEX_TYPE", "hnsw")
+        RAG_HNSW_M: int = int(os.getenv("RAG_HNSW_M", "16"))
+        RAG_HNSW_EF_CONSTRUCTION: int = int(os.getenv("RAG_HNSW_EF_CONSTRUCTION", "64"))
+        RAG_HNSW_EF_SEARCH: int = int(os.getenv("RAG_HNSW_EF_SEARCH", "40"))
+        RAG_IVFFLAT_LISTS: int = int(os.getenv("RAG_IVFFLAT_LISTS", "0"))
+        RAG_IVFFLAT_PROBES: int = int(os.getenv("RAG_IVFFLAT_PROBES", "10"))
+        RAG_ANN_MAINTENANCE_WORK_MEM: str = os.getenv("RAG_ANN_MAINTENANCE_WORK_MEM", "512MB")
+        
+        # 嵌入维度和存储精度（维度小于 3072 时截断并重新归一化；halfvec 为半精度存储）
+        RAG_EMBED_DIM: int = int(os.getenv("RAG_EMBED_DIM", "3072"))
+        RAG_USE_HALFVEC: bool = os.getenv("RAG_USE_HALFVEC", "False").lower() == "true"
+        
+        # 混合检索配置（向量 + 词法，RRF 融合）
+        RAG_HYBRID_ENABLED: bool = os.getenv("RAG_HYBRID_ENABLED", "True").lower() == "true"
+        RAG_HYBRID_CANDIDATES: int = int(os.getenv("RAG_HYBRID_CANDIDATES", "20"))
+        RAG_RRF_K: int = int(os.getenv("RAG_RRF_K", "60"))
+        
+        # 本地向量索引配置（进程内 NumPy 检索，适合小中型知识库）
+        RAG_LOCAL_INDEX_ENABLED: bool = os.getenv("RAG_LOCAL_INDEX_ENABLED", "False").lower() == "true"
+        RAG_LOCAL_INDEX_DIR: str = os.getenv("RAG_LOCAL_INDEX_DIR", ".cache/local_index")
+        RAG_LOCAL_INDEX_DTYPE: str = os.getenv("RAG_LOCAL_INDEX_DTYPE", "float32")
+        
+        # 检索结果后处理（去重 / MMR / 合并相邻分块）
+        RAG_RERANK_ENABLED: bool = os.getenv("RAG_RERANK_ENABLED", "True").lower() == "true"
+        RAG_MMR_LAMBDA: float = float(os.getenv("RAG_MMR_LAMBDA", "0.7"))
+        RAG_DEDUP_THRESHOLD: float = float(os.getenv("RAG_DEDUP_THRESHOLD", "0.95"))
+        RAG_MERGE_ADJACENT: bool = os.getenv("RAG_MERGE_ADJACENT", "True").lower() == "true"
+        
+        # 回答提示 token 预算（不含系统提示）
+        PROMPT_TOKEN_BUDGET: int = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000"))
+        PROMPT_MIN_CHUNK_TOKENS: int = int(os.getenv("PROMPT_MIN_CHUNK_TOKENS", "60"))
+        
+        # 订单回答模式（template: 按模板渲染，不调用 LLM；llm: 由 LLM 生成）
+        ORDER_ANSWER_MODE: str = os.getenv("ORDER_ANSWER_MODE", "template")
+        
+        # RAG 快速回答（最佳分块相似度和领先幅度达到阈值时直接返回原文）
+        RAG_FAST_ANSWER_ENABLED: bool = os.getenv("RAG_FAST_ANSWER_ENABLED", "False").lower() == "true"
+        RAG_FAST_ANSWER_MIN_SCORE: float = float(os.getenv("RAG_FAST_ANSWER_MIN_SCORE", "0.85"))
+        RAG_FAST_ANSWER_MIN_MARGIN: float = float(os.getenv("RAG_FAST_ANSWER_MIN_MARGIN", "0.1"))
+        
+        # 推测执行（意图分类的同时执行 RAG 检索，意图不是 rag 时丢弃）
+        AGENT_SPECULATIVE_RAG: bool = os.getenv("AGENT_SPECULATIVE_RAG", "True").lower() == "true"
+        
+        # 多意图查询（同时包含订单和知识库问题时并行执行两个分支）
+        AGENT_MULTI_INTENT: bool = os.getenv("AGENT_MULTI_INTENT", "True").lower() == "true"
+        
+        # 重复查询合并（single-flight，只合并与用户无关的查询）
+        QUERY_COALESCING_ENABLED: bool = os.getenv("QUERY_COALESCING_ENABLED", "True").lower() == "true"
+        
+        # 请求延迟预算（剩余时间不足时依次降级：跳过检索 → 改用更便宜的模型 → 模板 / 兜底回答；0 为不限制）
+        LATENCY_BUDGET_MS: int = int(os.getenv("LATENCY_BUDGET_MS", "8000"))
+        LATENCY_BUDGET_GRACE_MS: int = int(os.getenv("LATENCY_BUDGET_GRACE_MS", "500"))
+        LATENCY_SKIP_RETRIEVAL_MS: int = int(os.getenv("LATENCY_SKIP_RETRIEVAL_MS", "2500"))
+        LATENCY_CHEAP_MODEL_MS: int = int(os.getenv("LATENCY_CHEAP_MODEL_MS", "4000"))
+        LATENCY_MIN_GENERATION_MS: int = int(os.getenv("LATENCY_MIN_GENERATION_MS", "1000"))
+        LLM_FALLBACK_MODEL: str = os.getenv("LLM_FALLBACK_MODEL", "gemini-2.5-flash-lite")
+        
+        # 批量查询（/query/batch，并发上限和单次最大查询数）
+        QUERY_BATCH_CONCURRENCY: int = int(os.getenv("QUERY_BATCH_CONCURRENCY", "8"))
+        QUERY_BATCH_MAX_SIZE: int = int(os.getenv("QUERY_BATCH_MAX_SIZE", "1000"))
+        
+        # LLM 跨请求微批（并发的查询嵌入和意图分类在时间窗口内合并为一次请求）
+        LLM_MICROBATCH_ENABLED: bool = os.getenv("LLM_MICROBATCH_ENABLED", "True").lower() == "true"
+        LLM_MICROBATCH_WINDOW_MS: float = float(os.getenv("LLM_MICROBATCH_WINDOW_MS", "5.0"))
+        LLM_MICROBATCH_MAX_EMBEDDINGS: int = int(os.getenv("LLM_MICROBATCH_MAX_EMBEDDINGS", "64"))
+        LLM_MICROBATCH_MAX_INTENTS: int = int(os.getenv("LLM_MICROBATCH_MAX_INTENTS", "16"))
+        
+        # 知识库版本号配置（多个 worker 共享，进程内缓存秒数）
+        RAG_KB_VERSION_TTL: float = float(os.getenv("RAG_KB_VERSION_TTL", "1.0"))
+        
+        # 查询嵌入内存缓存配置（查询嵌入不写入磁盘，按最久未使用淘汰）
+        EMBEDDING_CACHE_QUERY_MAX_ENTRIES: int = int(os.getenv("EMBEDDING_CACHE_QUERY_MAX_ENTRIES", "2048"))
         
         # 应用配置
         DEBUG: bool = os.getenv("DEBUG", "False").lower() == "true"
@@ -1,7 +1,7 @@
 """
 数据库模型定义
 """
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, func
+from sqlalchemy import Column, Integer, BigInteger, Float, String, Boolean, DateTime, func
 from passlib.context import CryptContext
 from app.db.base import Base
 
@@ -88,3 +88,54 @@ class Order(Base):
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
         }
 
+
+class KnowledgeFile(Base):
+    """
+    知识库文件清单模型
+    
+    记录已导入知识库的每个文件的大小、修改时间和内容哈希，
+    用于增量导入时判断文件是否新增、变化或已删除。
+    """
+    __tablename__ = "knowledge_files"
+    
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    file_path = Column(String, unique=True, index=True, nullable=False, comment="相对 data 目录的文件路径")
+    size = Column(BigInteger, nullable=False, comment="文件大小（字节）")
+    mtime = Column(Float, nullable=False, comment="文件修改时间")
+    content_hash = Column(String, nullable=False, comment="文件内容 SHA-256")
+    chunk_count = Column(Integer, nullable=False, default=0, comment="向量表中的分块数")
+    created_at = Column(DateTime, server_default=func.now(), comment="创建时间")
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), comment="更新时间")
+    
+    def __repr__(self):
+        return f"<KnowledgeFile(file_path='{self.file_path}', chunks={self.chunk_count})>"
+    
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            "id": self.id,
+            "file_path": self.file_path,
+            "size": self.size,
+            "mtime": self.mtime,
+            "content_hash": self.content_hash,
+            "chunk_count": self.chunk_count,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+
+class KnowledgeBaseVersion(Base):
+    """
+    知识库版本号模型
+    
+    只有一行（id = 1）的计数器，知识库内容每次变化时在写入事务中递增，
+    所有 worker 进程据此失效语义缓存和相同查询合并。
+    """
+    __tablename__ = "knowledge_base_version"
+    
+    id = Column(Integer, primary_key=True, comment="固定为 1")
+    version = Column(BigInteger, nullable=False, default=0, comment="知识库版本号")
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), comment="更新时间")
+    
+    def __repr__(self):
+        return f"<KnowledgeBaseVersion(version={self.version})>"
@@ -1,9 +1,15 @@
 """
 FastAPI 应用主入口
 """
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.router import query_router, order_router, rag_router, auth_router
+from app.agent.graph import get_agent_graph
+from app.agent.intent_classifier import get_intent_classifier
+from app.rag.local_index import get_local_index
+from app.rag.rag_service import rag_service
+from app.rag.resources import get_rag_resources
 from app.utils.logger import setup_logger, logger
 from app.config import settings
 
@@ -76,12 +82,28 @@ async def startup_event():
     logger.info(f"PostgreSQL: {settings.POSTGRES_HOST}:{settings.POSTGRES_PORT}")
     logger.info(f"Redis: {settings.REDIS_HOST}:{settings.REDIS_PORT}")
     logger.info("=" * 50)
+    
+    # 预先编译 Agent 工作流图、训练本地意图模型，避免首个请求承担构建开销
+    await get_agent_graph()
+    get_intent_classifier().warm()
+    
+    # 预热 RAG 资源（向量存储、索引和检索连接），数据库不可用时首个检索请求会重试
+    if await get_rag_resources().warm():
+        logger.info("RAG 资源预热完成")
+    else:
+        logger.warning("RAG 资源预热失败，将在首次检索时重试")
+    
+    # 启用本地向量索引但还没有快照时，从 pgvector 导出一份（多个 worker 共享同一快照）
+    local_index = get_local_index()
+    if local_index is not None and not local_index.is_ready():
+        await asyncio.to_thread(rag_service.rebuild_local_index)
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """应用关闭事件"""
     logger.info("Smart Support Agent Backend 正在关闭...")
+    await get_rag_resources().dispose()
 
 
 if __name__ == "__main__":
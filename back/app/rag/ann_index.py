@@ -0,0 +1,369 @@
+"""
+向量近似索引（ANN）管理模块
+为 pgvector 向量表创建和维护 HNSW / IVFFlat 索引，避免检索退化为全表顺序扫描
+
+- HNSW：召回率高、支持增量写入，构建较慢、占用内存较多（默认）
+- IVFFlat：构建快、占用小，但需要在已有数据上构建，数据量大幅增长后需要重建
+- 索引使用 CREATE INDEX CONCURRENTLY 构建，不阻塞写入；重建时先建新索引再替换旧索引
+- 查询时的 hnsw.ef_search / ivfflat.probes 通过 RAGService.retrieve_documents 传入
+
+注意：pgvector 的 vector 类型最多支持 2000 维索引，halfvec 最多 4000 维。
+Gemini 嵌入完整维度为 3072，需要设置 RAG_USE_HALFVEC 或降低 RAG_EMBED_DIM 后才能建立索引
+（已有数据使用 migrate_embeddings.py 迁移）。
+"""
+import math
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import text
+from app.config import settings
+from app.utils.logger import logger
+
+# 支持的索引类型
+ANN_INDEX_TYPES = ("hnsw", "ivfflat")
+
+# 各向量类型可建立索引的最大维度
+MAX_INDEX_DIMS = {"vector": 2000, "halfvec": 4000}
+
+
+def recommended_lists(row_count: int) -> int:
+    """
+    计算 IVFFlat 的推荐 lists 数（pgvector 建议：100 万行以内为 行数/1000，以上为 sqrt(行数)）
+
+    Args:
+        row_count: 向量表行数
+
+    Returns:
+        int: 推荐的 lists 数
+    """
+    if row_count <= 1_000_000:
+        return max(row_count // 1000, 1)
+    return int(math.sqrt(row_count))
+
+
+def build_index_sql(
+    table_name: str,
+    index_name: str,
+    index_type: str,
+    column_type: str,
+    params: Dict[str, int],
+    concurrently: bool = True
+) -> str:
+    """
+    生成创建 ANN 索引的 SQL（使用余弦距离，与 PGVectorStore 的查询一致）
+
+    Args:
+        table_name: 向量表名（含 data_ 前缀）
+        index_name: 索引名
+        index_type: hnsw 或 ivfflat
+        column_type: 向量列类型（vector 或 halfvec）
+        params: 构建参数（hnsw: m、ef_construction；ivfflat: lists）
+        concurrently: 是否使用 CONCURRENTLY（不阻塞写入）
+
+    Returns:
+        str: CREATE INDEX 语句
+    """
+    if index_type not in ANN_INDEX_TYPES:
+        raise ValueError(f"不支持的索引类型: {index_type}")
+    if column_type not in MAX_INDEX_DIMS:
+        raise ValueError(f"不支持的向量类型: {column_type}")
+    options = ", ".join(f"{key} = {int(value)}" for key, value in params.items())
+    return (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {index_name} "
+        f"ON {table_name} USING {index_type} (embedding {column_type}_cosine_ops) "
+        f"WITH ({options})"
+    )
+
+
+def _parse_reloptions(reloptions: Optional[List[str]]) -> Dict[str, int]:
+    """解析 pg_class.reloptions（如 ['m=16', 'ef_construction=64']）"""
+    params = {}
+    for option in reloptions or []:
+        key, _, value = option.partition("=")
+        try:
+            params[key] = int(value)
+        except ValueError:
+            continue
+    return params
+
+
+class ANNIndexManager:
+    """向量近似索引管理器"""
+
+    def __init__(self, resources: Any = None):
+        """
+        初始化索引管理器
+
+        Args:
+            resources: RAG 资源管理器，默认使用进程级实例
+        """
+        self._resources = resources
+        self._build_lock = threading.Lock()
+        self._build_thread: Optional[threading.Thread] = None
+        self._last_build: Optional[Dict[str, Any]] = None
+
+    @property
+    def resources(self):
+        if self._resources is None:
+            from app.rag.resources import get_rag_resources
+            self._resources = get_rag_resources()
+        return self._resources
+
+    @property
+    def index_type(self) -> str:
+        """配置的索引类型（hnsw / ivfflat / none）"""
+        return settings.RAG_ANN_INDEX_TYPE.lower()
+
+    @property
+    def table_name(self) -> str:
+        return f"data_{self.resources.table_name}"
+
+    @property
+    def index_name(self) -> str:
+        # 与 PGVectorStore 自带的 HNSW 索引同名，避免重复建索引
+        return f"{self.table_name}_embedding_idx"
+
+    def search_kwargs(
+        self,
+        top_k: int,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None
+    ) -> Dict[str, int]:
+        """
+        生成传给 PGVectorStore 查询的索引参数
+
+        每次查询都显式设置参数，避免连接池中的连接残留上一次查询的设置。
+
+        Args:
+            top_k: 返回结果数（HNSW 最多返回 ef_search 个结果，因此 ef_search 不小于 top_k）
+            ef_search: HNSW 搜索宽度，默认 RAG_HNSW_EF_SEARCH
+            probes: IVFFlat 探测的列表数，默认 RAG_IVFFLAT_PROBES
+
+        Returns:
+            Dict[str, int]: vector_store_kwargs
+        """
+        if self.index_type == "hnsw":
+            return {"hnsw_ef_search": max(int(ef_search or settings.RAG_HNSW_EF_SEARCH), top_k)}
+        if self.index_type == "ivfflat":
+            return {"ivfflat_probes": int(probes or settings.RAG_IVFFLAT_PROBES)}
+        return {}
+
+    def column_info(self, conn) -> Optional[Tuple[str, int]]:
+        """读取向量列的类型和维度，如 ("vector", 3072)；表不存在返回 None"""
+        row = conn.execute(text("""
+            SELECT format_type(a.atttypid, a.atttypmod)
+            FROM pg_attribute a
+            WHERE a.attrelid = to_regclass(:table_name) AND a.attname = 'embedding'
+        """), {"table_name": self.table_name}).fetchone()
+        if row is None:
+            return None
+        column_type, _, dim = row[0].partition("(")
+        return column_type, int(dim.rstrip(")") or 0)
+
+    def _existing_index(self, conn) -> Optional[Dict[str, Any]]:
+        """读取已有索引的类型、参数和有效状态"""
+        row = conn.execute(text("""
+            SELECT am.amname, c.reloptions, i.indisvalid
+            FROM pg_class c
+            JOIN pg_index i ON i.indexrelid = c.oid
+            JOIN pg_am am ON am.oid = c.relam
+            WHERE c.relname = :index_name
+        """), {"index_name": self.index_name}).fetchone()
+        if row is None:
+            return None
+        return {"type": row[0], "params": _parse_reloptions(row[1]), "valid": row[2]}
+
+    @staticmethod
+    def _row_count(conn, table_name: str) -> int:
+        """估算表行数（使用统计信息，未 ANALYZE 时退化为精确计数）"""
+        estimate = conn.execute(text(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table_name)"
+        ), {"table_name": table_name}).scalar()
+        if estimate is None or estimate < 0:
+            return conn.execute(text(f"SELECT count(*) FROM {table_name}")).scalar() or 0
+        return int(estimate)
+
+    def _unsupported_reason(self, column: Optional[Tuple[str, int]]) -> Optional[str]:
+        """检查当前配置能否建立索引，不能时返回原因"""
+        if self.index_type not in ANN_INDEX_TYPES:
+            return f"未启用近似索引（RAG_ANN_INDEX_TYPE={self.index_type}）"
+        if column is None:
+            return f"向量表 {self.table_name} 不存在"
+        column_type, dim = column
+        limit = MAX_INDEX_DIMS.get(column_type)
+        if limit is None:
+            return f"不支持的向量类型: {column_type}"
+        if dim > limit:
+            return (
+                f"{column_type} 类型最多支持 {limit} 维索引，当前为 {dim} 维，"
+                f"请设置 RAG_USE_HALFVEC 或降低 RAG_EMBED_DIM 后运行 migrate_embeddings.py"
+            )
+        return None
+
+    def _build_params(self, row_count: int) -> Dict[str, int]:
+        """当前配置下的构建参数"""
+        if self.index_type == "hnsw":
+            return {"m": settings.RAG_HNSW_M, "ef_construction": settings.RAG_HNSW_EF_CONSTRUCTION}
+        return {"lists": settings.RAG_IVFFLAT_LISTS or recommended_lists(row_count)}
+
+    def _needs_rebuild(self, existing: Dict[str, Any], row_count: int) -> bool:
+        """已有索引是否需要重建（类型变化、构建失败，或 IVFFlat 的 lists 远小于数据量所需）"""
+        if not existing["valid"] or existing["type"] != self.index_type:
+            return True
+        if self.index_type == "ivfflat" and not settings.RAG_IVFFLAT_LISTS:
+            return existing["params"].get("lists", 0) * 2 < recommended_lists(row_count)
+        return False
+
+    def ensure_index(self, rebuild: bool = False) -> Dict[str, Any]:
+        """
+        确保向量表上存在符合配置的 ANN 索引（阻塞执行，供后台线程调用）
+
+        Args:
+            rebuild: 是否强制重建（修改构建参数后使用）
+
+        Returns:
+            Dict[str, Any]: 执行结果 {"action": created / rebuilt / unchanged / skipped, ...}
+        """
+        if not self._build_lock.acquire(blocking=False):
+            return {"action": "skipped", "reason": "索引正在构建"}
+        try:
+            result = self._ensure_index(rebuild)
+        except Exception as e:
+            logger.error(f"构建向量索引失败: {str(e)}")
+            result = {"action": "failed", "error": str(e)}
+        finally:
+            self._build_lock.release()
+        self._last_build = result
+        return result
+
+    def _ensure_index(self, rebuild: bool) -> Dict[str, Any]:
+        engine = self.resources.engine
+        with engine.connect() as conn:
+            column = self.column_info(conn)
+            reason = self._unsupported_reason(column)
+            if reason:
+                logger.warning(f"跳过向量索引构建: {reason}")
+                return {"action": "skipped", "reason": reason}
+            existing = self._existing_index(conn)
+            row_count = self._row_count(conn, self.table_name)
+
+        if existing and not rebuild and not self._needs_rebuild(existing, row_count):
+            return {"action": "unchanged", "type": existing["type"], "params": existing["params"]}
+        if self.index_type == "ivfflat" and row_count == 0:
+            reason = "向量表为空，IVFFlat 需要在导入数据后构建"
+            logger.warning(f"跳过向量索引构建: {reason}")
+            return {"action": "skipped", "reason": reason}
+
+        params = self._build_params(row_count)
+        # 重建时先以临时名称构建新索引，完成后再替换旧索引，构建期间检索仍可使用旧索引
+        target = f"{self.index_name}_new" if existing else self.index_name
+        sql = build_index_sql(self.table_name, target, self.index_type, column[0], params)
+        logger.info(f"开始构建向量索引: {sql}")
+
+        # CONCURRENTLY 不能在事务中执行
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text(f"SET maintenance_work_mem = '{settings.RAG_ANN_MAINTENANCE_WORK_MEM}'"))
+            try:
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {self.index_name}_new"))
+                conn.execute(text(sql))
+            except Exception:
+                # 构建失败会留下无效索引，清理后再抛出
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {target}"))
+                raise
+            finally:
+                conn.execute(text("RESET maintenance_work_mem"))
+
+        if existing:
+            with engine.begin() as conn:
+                conn.execute(text(f"DROP INDEX IF EXISTS {self.index_name}"))
+                conn.execute(text(f"ALTER INDEX {target} RENAME TO {self.index_name}"))
+
+        # 重新加载资源，让向量存储使用新的索引类型对应的查询参数
+        self.resources.reload()
+        action = "rebuilt" if existing else "created"
+        logger.info(f"向量索引构建完成（{action}）: {self.index_type} {params}")
+        return {"action": action, "type": self.index_type, "params": params}
+
+    def start_build(self, rebuild: bool = False) -> bool:
+        """
+        在后台线程中构建索引
+
+        Args:
+            rebuild: 是否强制重建
+
+        Returns:
+            bool: 是否已启动（已有构建在进行时返回 False）
+        """
+        if self._build_lock.locked() or (self._build_thread and self._build_thread.is_alive()):
+            return False
+        self._build_thread = threading.Thread(
+            target=self.ensure_index,
+            kwargs={"rebuild": rebuild},
+            name="rag-ann-index",
+            daemon=True
+        )
+        self._build_thread.start()
+        return True
+
+    def get_status(self) -> Dict[str, Any]:
+        """
+        获取索引状态（大小、参数和构建进度）
+
+        Returns:
+            Dict[str, Any]: 索引状态
+        """
+        status: Dict[str, Any] = {
+            "configured_type": self.index_type,
+            "index_name": self.index_name,
+            "search_params": self.search_kwargs(top_k=1),
+            "building": self._build_lock.locked(),
+            "last_build": self._last_build,
+        }
+        with self.resources.engine.connect() as conn:
+            column = self.column_info(conn)
+            status["column"] = {"type": column[0], "dim": column[1]} if column else None
+            status["unsupported_reason"] = self._unsupported_reason(column)
+            if column is None:
+                return status
+
+            status["row_count"] = self._row_count(conn, self.table_name)
+            status["table_size_bytes"] = conn.execute(text(
+                "SELECT pg_total_relation_size(to_regclass(:name))"
+            ), {"name": self.table_name}).scalar()
+            existing = self._existing_index(conn)
+            if existing:
+                existing["size_bytes"] = conn.execute(text(
+                    "SELECT pg_relation_size(to_regclass(:name))"
+                ), {"name": self.index_name}).scalar()
+            status["index"] = existing
+
+            progress = conn.execute(text("""
+                SELECT phase, blocks_done, blocks_total, tuples_done, tuples_total
+                FROM pg_stat_progress_create_index
+                WHERE relid = to_regclass(:table_name)
+            """), {"table_name": self.table_name}).fetchone()
+            if progress:
+                phase, blocks_done, blocks_total, tuples_done, tuples_total = progress
+                done, total = (tuples_done, tuples_total) if tuples_total else (blocks_done, blocks_total)
+                status["progress"] = {
+                    "phase": phase,
+                    "blocks_done": blocks_done,
+                    "blocks_total": blocks_total,
+                    "tuples_done": tuples_done,
+                    "tuples_total": tuples_total,
+                    "percent": round(done / total * 100, 1) if total else None,
+                }
+            else:
+                status["progress"] = None
+        return status
+
+
+# 全局索引管理器实例（延迟初始化）
+ann_index_manager = None
+
+
+def get_ann_index_manager() -> ANNIndexManager:
+    """获取向量索引管理器实例（单例模式）"""
+    global ann_index_manager
+    if ann_index_manager is None:
+        ann_index_manager = ANNIndexManager()
+    return ann_index_manager
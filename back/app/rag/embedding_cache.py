@@ -0,0 +1,529 @@
+"""
+嵌入向量缓存模块
+按内容寻址的本地磁盘嵌入缓存，知识库导入和查询检索共用
+
+缓存键为 blake2b(命名空间 + 文本) 的 16 字节摘要，命名空间由嵌入模型名和任务类型组成。
+每个（命名空间维度, 精度）对应一组文件：
+- {name}.idx: 按行顺序追加的 16 字节摘要
+- {name}.bin: 按行顺序追加的向量矩阵（float16 / float32，可直接 memmap）
+
+追加写入在文件锁内进行，多个 worker 进程可以共享同一个缓存目录；
+进程内的摘要索引在未命中时会增量读取其他进程追加的条目。
+
+只有知识库分块的嵌入写入磁盘（条目数随知识库大小增长）；用户查询的嵌入只保存在进程内的 LRU 中
+（EMBEDDING_CACHE_QUERY_MAX_ENTRIES），否则磁盘文件和摘要索引会随线上流量无限增长。
+
+缓存始终保存模型输出的完整维度向量，降维（见 project_embedding）在读取后进行，
+因此修改 RAG_EMBED_DIM 不需要重新调用嵌入接口。
+"""
+import asyncio
+import fcntl
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from app.config import settings
+from app.utils.logger import logger
+
+# 摘要长度（字节）
+DIGEST_SIZE = 16
+
+SUPPORTED_DTYPES = ("float16", "float32")
+
+
+def make_digest(namespace: str, text: str) -> bytes:
+    """
+    计算缓存键摘要
+
+    Args:
+        namespace: 命名空间（模型名 + 任务类型）
+        text: 文本内容
+
+    Returns:
+        bytes: 16 字节摘要
+    """
+    hasher = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    hasher.update(namespace.encode("utf-8"))
+    hasher.update(b"\x00")
+    hasher.update(text.encode("utf-8"))
+    return hasher.digest()
+
+
+def project_embedding(vector: Sequence[float], dim: Optional[int]) -> List[float]:
+    """
+    将嵌入向量降到指定维度
+
+    gemini-embedding-001 使用 Matryoshka 训练，output_dimensionality 等价于取完整向量的前 dim 维；
+    截断后的向量不再是单位长度，需要重新归一化（余弦距离和内积才一致）。
+
+    Args:
+        vector: 完整维度的嵌入向量
+        dim: 目标维度，None 或不小于原维度时原样返回
+
+    Returns:
+        List[float]: 降维并归一化后的向量
+    """
+    if not dim or dim >= len(vector):
+        return list(vector)
+    head = np.asarray(vector[:dim], dtype=np.float32)
+    norm = float(np.linalg.norm(head))
+    if norm > 0:
+        head /= norm
+    return head.tolist()
+
+
+class _VectorFile:
+    """单一维度的向量存储（摘要索引 + memmap 矩阵）"""
+
+    def __init__(self, directory: Path, dim: int, dtype: str):
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.row_bytes = dim * self.dtype.itemsize
+        stem = f"embeddings_{dim}_{dtype}"
+        self.idx_path = directory / f"{stem}.idx"
+        self.bin_path = directory / f"{stem}.bin"
+        self.lock_path = directory / f"{stem}.lock"
+        for path in (self.idx_path, self.bin_path, self.lock_path):
+            path.touch(exist_ok=True)
+
+        self.rows: Dict[bytes, int] = {}
+        self._idx_offset = 0
+        self._matrix: Optional[np.memmap] = None
+        self.refresh()
+
+    def refresh(self) -> None:
+        """增量读取其他进程追加的摘要"""
+        size = self.idx_path.stat().st_size
+        # 只认可向量已完整写入的行
+        complete_rows = min(size // DIGEST_SIZE, self.bin_path.stat().st_size // self.row_bytes)
+        end = complete_rows * DIGEST_SIZE
+        if end <= self._idx_offset:
+            return
+        with open(self.idx_path, "rb") as f:
+            f.seek(self._idx_offset)
+            data = f.read(end - self._idx_offset)
+        start_row = self._idx_offset // DIGEST_SIZE
+        for i in range(len(data) // DIGEST_SIZE):
+            self.rows.setdefault(data[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE], start_row + i)
+        self._idx_offset = end
+        self._matrix = None
+
+    def matrix(self) -> Optional[np.memmap]:
+        """获取只读 memmap 矩阵（行数变化后重新映射）"""
+        if self._matrix is None and self._idx_offset:
+            self._matrix = np.memmap(
+                self.bin_path,
+                dtype=self.dtype,
+                mode="r",
+                shape=(self._idx_offset // DIGEST_SIZE, self.dim)
+            )
+        return self._matrix
+
+    def append(self, items: Sequence[tuple]) -> int:
+        """
+        在文件锁内追加向量
+
+        Args:
+            items: [(摘要, 向量)] 列表
+
+        Returns:
+            int: 实际写入的条目数
+        """
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self.refresh()
+                new_items = []
+                seen = set()
+                for digest, vector in items:
+                    if digest in self.rows or digest in seen:
+                        continue
+                    seen.add(digest)
+                    new_items.append((digest, vector))
+                if not new_items:
+                    return 0
+
+                row = self._idx_offset // DIGEST_SIZE
+                matrix = np.asarray([vector for _, vector in new_items], dtype=self.dtype)
+                # 先写向量再写摘要，中途崩溃时未完成的行不会被读到
+                fd = os.open(self.bin_path, os.O_WRONLY)
+                try:
+                    os.pwrite(fd, matrix.tobytes(), row * self.row_bytes)
+                finally:
+                    os.close(fd)
+                fd = os.open(self.idx_path, os.O_WRONLY)
+                try:
+                    os.pwrite(fd, b"".join(d for d, _ in new_items), row * DIGEST_SIZE)
+                finally:
+                    os.close(fd)
+                self.refresh()
+                return len(new_items)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class EmbeddingCache:
+    """按内容寻址的磁盘嵌入缓存"""
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        dtype: Optional[str] = None,
+        enabled: Optional[bool] = None,
+        max_query_entries: Optional[int] = None
+    ):
+        """
+        初始化嵌入缓存
+
+        Args:
+            cache_dir: 缓存目录
+            dtype: 存储精度（float16 / float32）
+            enabled: 是否启用
+            max_query_entries: 进程内查询嵌入 LRU 的容量，默认 EMBEDDING_CACHE_QUERY_MAX_ENTRIES
+        """
+        self.enabled = settings.EMBEDDING_CACHE_ENABLED if enabled is None else enabled
+        self.cache_dir = Path(cache_dir or settings.EMBEDDING_CACHE_DIR)
+        self.dtype = dtype or settings.EMBEDDING_CACHE_DTYPE
+        if self.dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"不支持的嵌入缓存精度: {self.dtype}")
+
+        self._lock = threading.Lock()
+        self._files: Dict[int, _VectorFile] = {}
+        self.max_query_entries = (
+            settings.EMBEDDING_CACHE_QUERY_MAX_ENTRIES if max_query_entries is None else max_query_entries
+        )
+        self._queries: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._stats: Dict[str, int] = {"hits": 0, "misses": 0, "writes": 0, "query_evictions": 0, "errors": 0}
+
+    def _load_files(self) -> None:
+        """加载缓存目录中已有的向量文件"""
+        if self._files or not self.cache_dir.exists():
+            return
+        suffix = f"_{self.dtype}.idx"
+        for idx_path in self.cache_dir.glob(f"embeddings_*{suffix}"):
+            dim = int(idx_path.name[len("embeddings_"):-len(suffix)])
+            self._files[dim] = _VectorFile(self.cache_dir, dim, self.dtype)
+
+    def _file_for(self, dim: int) -> _VectorFile:
+        if dim not in self._files:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._files[dim] = _VectorFile(self.cache_dir, dim, self.dtype)
+        return self._files[dim]
+
+    def _lookup(self, digest: bytes, refresh: bool) -> Optional[List[float]]:
+        vector = self._queries.get(digest)
+        if vector is not None:
+            self._queries.move_to_end(digest)
+            return vector.tolist()
+        for vector_file in self._files.values():
+            if refresh and digest not in vector_file.rows:
+                vector_file.refresh()
+            row = vector_file.rows.get(digest)
+            if row is not None:
+                return vector_file.matrix()[row].astype(np.float32).tolist()
+        return None
+
+    def get_many(self, namespace: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """
+        批量读取缓存
+
+        Args:
+            namespace: 命名空间（模型名 + 任务类型）
+            texts: 文本列表
+
+        Returns:
+            List[Optional[List[float]]]: 与输入对应的向量，未命中为 None
+        """
+        if not self.enabled:
+            return [None] * len(texts)
+        results: List[Optional[List[float]]] = []
+        try:
+            with self._lock:
+                self._load_files()
+                for text in texts:
+                    digest = make_digest(namespace, text)
+                    vector = self._lookup(digest, refresh=False)
+                    if vector is None:
+                        # 其他进程可能已写入，增量刷新后再查一次
+                        vector = self._lookup(digest, refresh=True)
+                    results.append(vector)
+                hits = sum(1 for vector in results if vector is not None)
+                self._stats["hits"] += hits
+                self._stats["misses"] += len(texts) - hits
+        except Exception as e:
+            logger.warning(f"读取嵌入缓存失败: {str(e)}")
+            with self._lock:
+                self._stats["errors"] += 1
+            return [None] * len(texts)
+        return results
+
+    def get(self, namespace: str, text: str) -> Optional[List[float]]:
+        """读取单条缓存"""
+        return self.get_many(namespace, [text])[0]
+
+    def put_many(
+        self,
+        namespace: str,
+        texts: Sequence[str],
+        vectors: Sequence[List[float]],
+        persist: bool = True
+    ) -> int:
+        """
+        批量写入缓存
+
+        Args:
+            namespace: 命名空间（模型名 + 任务类型）
+            texts: 文本列表
+            vectors: 与文本对应的向量
+            persist: 是否写入磁盘；False 时（用户查询）只写入进程内 LRU
+
+        Returns:
+            int: 新写入的条目数
+        """
+        if not self.enabled or not texts:
+            return 0
+        if not persist:
+            return self._remember_queries(namespace, texts, vectors)
+        try:
+            by_dim: Dict[int, List[tuple]] = {}
+            for text, vector in zip(texts, vectors):
+                by_dim.setdefault(len(vector), []).append((make_digest(namespace, text), vector))
+            written = 0
+            with self._lock:
+                self._load_files()
+                for dim, items in by_dim.items():
+                    written += self._file_for(dim).append(items)
+                self._stats["writes"] += written
+            return written
+        except Exception as e:
+            logger.warning(f"写入嵌入缓存失败: {str(e)}")
+            with self._lock:
+                self._stats["errors"] += 1
+            return 0
+
+    def put(self, namespace: str, text: str, vector: List[float], persist: bool = True) -> int:
+        """写入单条缓存"""
+        return self.put_many(namespace, [text], [vector], persist=persist)
+
+    def _remember_queries(self, namespace: str, texts: Sequence[str], vectors: Sequence[List[float]]) -> int:
+        """写入进程内查询嵌入 LRU，超出容量时淘汰最久未使用的条目"""
+        if self.max_query_entries <= 0:
+            return 0
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                digest = make_digest(namespace, text)
+                self._queries[digest] = np.asarray(vector, dtype=np.float32)
+                self._queries.move_to_end(digest)
+            while len(self._queries) > self.max_query_entries:
+                self._queries.popitem(last=False)
+                self._stats["query_evictions"] += 1
+        return len(texts)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取缓存统计
+
+        Returns:
+            Dict[str, Any]: 命中/未命中/写入计数、命中率、各维度磁盘条目数和进程内查询条目数
+        """
+        with self._lock:
+            self._load_files()
+            stats = dict(self._stats)
+            sizes = {str(dim): len(f.rows) for dim, f in self._files.items()}
+            query_entries = len(self._queries)
+        lookups = stats["hits"] + stats["misses"]
+        return {
+            "enabled": self.enabled,
+            "dtype": self.dtype,
+            "cache_dir": str(self.cache_dir),
+            "entries": sizes,
+            "query_entries": query_entries,
+            "max_query_entries": self.max_query_entries,
+            "hit_rate": stats["hits"] / lookups if lookups else 0.0,
+            **stats,
+        }
+
+
+# 全局嵌入缓存实例（延迟初始化）
+embedding_cache = None
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """获取嵌入缓存实例（单例模式）"""
+    global embedding_cache
+    if embedding_cache is None:
+        embedding_cache = EmbeddingCache()
+    return embedding_cache
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    带磁盘缓存的嵌入模型包装
+
+    包装任意 LlamaIndex 嵌入模型，查询和文本嵌入先查缓存，
+    只对未命中的文本调用底层模型，结果写回缓存（文本嵌入写入磁盘，查询嵌入只写入进程内 LRU）。
+    提供批量嵌入函数时，批量文本嵌入（包括 embed_documents）改用该函数；
+    提供异步查询嵌入函数时（如跨请求微批的 LLMClient.aembed_query），异步查询嵌入改用该函数。
+    设置 output_dim 时，返回的向量截断到该维度并重新归一化（缓存中仍保存完整向量）。
+    """
+
+    _inner: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+    _namespace: str = PrivateAttr()
+    _batch_embed_fn: Optional[Callable[[List[str]], List[List[float]]]] = PrivateAttr()
+    _abatch_embed_fn: Optional[Callable[[List[str]], Awaitable[List[List[float]]]]] = PrivateAttr()
+    _aquery_embed_fn: Optional[Callable[[str], Awaitable[List[float]]]] = PrivateAttr()
+    _output_dim: Optional[int] = PrivateAttr()
+
+    def __init__(
+        self,
+        inner: BaseEmbedding,
+        cache: Optional[EmbeddingCache] = None,
+        batch_embed_fn: Optional[Callable[[List[str]], List[List[float]]]] = None,
+        abatch_embed_fn: Optional[Callable[[List[str]], Awaitable[List[List[float]]]]] = None,
+        aquery_embed_fn: Optional[Callable[[str], Awaitable[List[float]]]] = None,
+        output_dim: Optional[int] = None,
+        **kwargs: Any
+    ):
+        """
+        初始化缓存包装
+
+        Args:
+            inner: 底层嵌入模型
+            cache: 嵌入缓存，默认使用全局实例
+            batch_embed_fn: 批量嵌入函数（一次请求打包多条文本），默认使用底层模型
+            abatch_embed_fn: 异步批量嵌入函数
+            aquery_embed_fn: 异步查询嵌入函数，默认使用底层模型
+            output_dim: 输出维度，默认使用模型的完整维度
+        """
+        super().__init__(
+            model_name=inner.model_name,
+            embed_batch_size=inner.embed_batch_size,
+            callback_manager=inner.callback_manager,
+            **kwargs
+        )
+        self._inner = inner
+        self._cache = cache or get_embedding_cache()
+        self._batch_embed_fn = batch_embed_fn
+        self._abatch_embed_fn = abatch_embed_fn
+        self._aquery_embed_fn = aquery_embed_fn
+        self._output_dim = output_dim
+        # GeminiEmbedding 的查询和文本嵌入使用同一任务类型，因此共享缓存
+        self._namespace = f"{inner.model_name}:{getattr(inner, 'task_type', None) or ''}"
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def inner(self) -> BaseEmbedding:
+        """底层嵌入模型"""
+        return self._inner
+
+    @property
+    def namespace(self) -> str:
+        """缓存命名空间"""
+        return self._namespace
+
+    @property
+    def output_dim(self) -> Optional[int]:
+        """输出维度（None 表示完整维度）"""
+        return self._output_dim
+
+    def _embed_with_cache(self, texts: List[str], embed_missing, persist: bool = True) -> List[List[float]]:
+        cached = self._cache.get_many(self._namespace, texts)
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        if missing:
+            vectors = embed_missing([texts[i] for i in missing])
+            self._cache.put_many(self._namespace, [texts[i] for i in missing], vectors, persist=persist)
+            for i, vector in zip(missing, vectors):
+                cached[i] = vector
+        return [project_embedding(vector, self._output_dim) for vector in cached]
+
+    async def _aembed_with_cache(self, texts: List[str], aembed_missing, persist: bool = True) -> List[List[float]]:
+        cached = await asyncio.to_thread(self._cache.get_many, self._namespace, texts)
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        if missing:
+            vectors = await aembed_missing([texts[i] for i in missing])
+            await asyncio.to_thread(
+                self._cache.put_many, self._namespace, [texts[i] for i in missing], vectors, persist
+            )
+            for i, vector in zip(missing, vectors):
+                cached[i] = vector
+        return [project_embedding(vector, self._output_dim) for vector in cached]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed_with_cache(
+            [query], lambda texts: [self._inner.get_query_embedding(texts[0])], persist=False
+        )[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        async def embed(texts):
+            if self._aquery_embed_fn is not None:
+                return [await self._aquery_embed_fn(texts[0])]
+            return [await self._inner.aget_query_embedding(texts[0])]
+        return (await self._aembed_with_cache([query], embed, persist=False))[0]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed_with_cache(
+            [text], lambda texts: [self._inner.get_text_embedding(texts[0])]
+        )[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        async def embed(texts):
+            return [await self._inner.aget_text_embedding(texts[0])]
+        return (await self._aembed_with_cache([text], embed))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._embed_with_cache(texts, self._batch_embed_fn or self._inner.get_text_embedding_batch)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return await self._aembed_with_cache(
+            texts, self._abatch_embed_fn or self._inner.aget_text_embedding_batch
+        )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        为知识库导入批量生成文本嵌入
+
+        与 get_text_embedding_batch 不同，不按 embed_batch_size 切分，
+        全部未命中的文本一次交给批量嵌入函数（由其负责分批和并发）。
+
+        Args:
+            texts: 文本列表
+
+        Returns:
+            List[List[float]]: 与输入顺序一致的嵌入向量
+        """
+        return self._get_text_embeddings(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        异步批量生成文本嵌入（不按 embed_batch_size 切分，见 embed_documents）
+
+        Args:
+            texts: 文本列表
+
+        Returns:
+            List[List[float]]: 与输入顺序一致的嵌入向量
+        """
+        return await self._aget_text_embeddings(texts)
+
+    async def aembed_queries(self, queries: List[str]) -> List[List[float]]:
+        """
+        异步批量生成查询嵌入（一次批量请求，结果只写入进程内 LRU，不写入磁盘）
+
+        Args:
+            queries: 查询文本列表
+
+        Returns:
+            List[List[float]]: 与输入顺序一致的嵌入向量
+        """
+        return await self._aembed_with_cache(
+            queries, self._abatch_embed_fn or self._inner.aget_text_embedding_batch, persist=False
+        )
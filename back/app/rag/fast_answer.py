@@ -0,0 +1,156 @@
+"""
+RAG 抽取式快速回答
+检索结果中最佳分块的相似度足够高、且明显高于其余分块时（如 FAQ 条目精确匹配），
+直接返回该分块原文和来源，跳过 LLM 生成
+
+判断使用向量检索的余弦相似度（混合检索和 MMR 之后保存在 'similarity' 字段），
+不使用 RRF 融合分数：融合分数只反映排名，无法区分“明显最佳”和“勉强第一”。
+"""
+import statistics
+import threading
+from collections import deque
+from pathlib import PurePosixPath
+from typing import Any, Deque, Dict, List, Optional
+from app.config import settings
+from app.utils.logger import logger
+
+
+def document_similarity(doc: Dict[str, Any]) -> Optional[float]:
+    """读取分块与查询的余弦相似度（只有词法命中的分块没有相似度）"""
+    similarity = doc["similarity"] if "similarity" in doc else doc.get("score")
+    return float(similarity) if isinstance(similarity, (int, float)) else None
+
+
+class FastAnswerSelector:
+    """快速回答判定器（记录触发次数和 LLM 生成延迟，用于调整阈值）"""
+
+    def __init__(
+        self,
+        min_score: Optional[float] = None,
+        min_margin: Optional[float] = None,
+        latency_window: int = 200
+    ):
+        """
+        初始化判定器
+
+        Args:
+            min_score: 最佳分块的最低相似度，默认 RAG_FAST_ANSWER_MIN_SCORE
+            min_margin: 最佳分块领先第二名的最小差值，默认 RAG_FAST_ANSWER_MIN_MARGIN
+            latency_window: 保留的 LLM 生成延迟样本数（用于计算 p50）
+        """
+        self.min_score = settings.RAG_FAST_ANSWER_MIN_SCORE if min_score is None else min_score
+        self.min_margin = settings.RAG_FAST_ANSWER_MIN_MARGIN if min_margin is None else min_margin
+        self._lock = threading.Lock()
+        self._stats = {"evaluated": 0, "fired": 0, "below_score": 0, "below_margin": 0}
+        self._fired_score_sum = 0.0
+        self._generation_ms: Deque[float] = deque(maxlen=latency_window)
+
+    def select(self, documents: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        判断是否可以直接返回最佳分块
+
+        Args:
+            documents: 检索结果
+
+        Returns:
+            Optional[Dict[str, Any]]: 满足阈值时返回 {"document", "similarity", "margin"}，否则返回 None
+        """
+        scored = [(document_similarity(doc), doc) for doc in documents]
+        scored = [(similarity, doc) for similarity, doc in scored if similarity is not None]
+        if not scored:
+            return None
+        scored.sort(key=lambda item: item[0], reverse=True)
+        best, document = scored[0]
+        margin = best - scored[1][0] if len(scored) > 1 else best
+
+        with self._lock:
+            self._stats["evaluated"] += 1
+            if best < self.min_score:
+                self._stats["below_score"] += 1
+                return None
+            if margin < self.min_margin:
+                self._stats["below_margin"] += 1
+                return None
+            self._stats["fired"] += 1
+            self._fired_score_sum += best
+        logger.info(f"RAG 快速回答命中: 相似度 {best:.3f}，领先 {margin:.3f}")
+        return {"document": document, "similarity": best, "margin": margin}
+
+    @staticmethod
+    def render(selection: Dict[str, Any]) -> str:
+        """
+        渲染快速回答（分块原文 + 来源）
+
+        Args:
+            selection: select 的返回值
+
+        Returns:
+            str: 回答文本
+        """
+        document = selection["document"]
+        metadata = document.get("metadata") or {}
+        source = metadata.get("source_file") or metadata.get("filename")
+        answer = document.get("text", "").strip()
+        if source:
+            answer += f"\n\n来源：{PurePosixPath(source).name}"
+        return answer
+
+    @staticmethod
+    def source(selection: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        快速回答的来源信息（随查询结果返回）
+
+        Args:
+            selection: select 的返回值
+
+        Returns:
+            Dict[str, Any]: node_id、文件、相似度和领先差值
+        """
+        document = selection["document"]
+        metadata = document.get("metadata") or {}
+        return {
+            "node_id": document.get("node_id"),
+            "source_file": metadata.get("source_file") or metadata.get("filename"),
+            "similarity": selection["similarity"],
+            "margin": selection["margin"],
+        }
+
+    def record_generation(self, latency_ms: float) -> None:
+        """记录一次 RAG 回答的 LLM 生成延迟（用于估算快速回答节省的时间）"""
+        with self._lock:
+            self._generation_ms.append(latency_ms)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取快速回答统计
+
+        Returns:
+            Dict[str, Any]: 阈值、判定次数、触发率、未触发原因计数和估算节省的延迟
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            fired_score_sum = self._fired_score_sum
+            samples = list(self._generation_ms)
+        p50 = statistics.median(samples) if samples else None
+        return {
+            "enabled": settings.RAG_FAST_ANSWER_ENABLED,
+            "min_score": self.min_score,
+            "min_margin": self.min_margin,
+            **stats,
+            "fire_rate": stats["fired"] / stats["evaluated"] if stats["evaluated"] else 0.0,
+            "avg_fired_similarity": fired_score_sum / stats["fired"] if stats["fired"] else 0.0,
+            "generation_p50_ms": p50,
+            "estimated_saved_ms": p50 * stats["fired"] if p50 is not None else None,
+        }
+
+
+# 全局快速回答判定器实例（延迟初始化）
+fast_answer_selector = None
+
+
+def get_fast_answer_selector() -> FastAnswerSelector:
+    """获取快速回答判定器实例（单例模式）"""
+    global fast_answer_selector
+    if fast_answer_selector is None:
+        fast_answer_selector = FastAnswerSelector()
+    return fast_answer_selector
@@ -4,9 +4,9 @@
 """
 from typing import Optional
 from llama_index.core import VectorStoreIndex, Settings
-from sqlalchemy import create_engine
 from app.config import settings
-from app.clients.llm_client import llm_client
+from app.clients.llm_client import get_llm_client
+from app.rag.embedding_cache import CachedEmbedding
 from app.utils.logger import logger
 
 # 尝试不同的导入路径
@@ -34,20 +34,59 @@ except ImportError:
         logger.warning("GeminiEmbedding 不可用，请安装 llama-index-embeddings-gemini")
 
 
+# 全局嵌入模型实例（延迟初始化）
+_embed_model = None
+
+
+def get_embed_model():
+    """
+    获取 Gemini 嵌入模型实例（单例模式）
+    
+    索引加载、检索和语义缓存共用同一个嵌入模型配置。
+    模型外层包装了磁盘嵌入缓存，相同文本只会调用一次嵌入接口；
+    批量文本嵌入走 LLMClient.generate_embeddings（单请求多文本 + 并发批次）；
+    启用 LLM_MICROBATCH_ENABLED 时，并发请求的异步查询嵌入经 LLMClient.aembed_query 合并为批量请求。
+    输出维度由 RAG_EMBED_DIM 配置（截断并重新归一化），与向量表维度一致。
+    
+    Returns:
+        CachedEmbedding 实例，如果模块不可用返回 None
+    """
+    global _embed_model
+    if _embed_model is None and GeminiEmbedding is not None:
+        _embed_model = CachedEmbedding(
+            GeminiEmbedding(
+                model_name="models/gemini-embedding-001",
+                api_key=settings.GEMINI_API_KEY
+            ),
+            batch_embed_fn=lambda texts: get_llm_client().generate_embeddings(texts),
+            abatch_embed_fn=lambda texts: get_llm_client().agenerate_embeddings(texts),
+            aquery_embed_fn=(
+                (lambda text: get_llm_client().aembed_query(text)) if settings.LLM_MICROBATCH_ENABLED else None
+            ),
+            output_dim=settings.RAG_EMBED_DIM
+        )
+    return _embed_model
+
+
 def load_index(
     table_name: str = "llama_index_vectors",  # PGVectorStore 会自动添加 data_ 前缀
-    embed_dim: int = 3072  # GeminiEmbedding 实际维度
+    embed_dim: Optional[int] = None  # 默认使用 RAG_EMBED_DIM
 ) -> Optional[VectorStoreIndex]:
     """
     从 PostgreSQL 加载向量索引
     
+    默认表使用进程级 RAG 资源（见 app.rag.resources），不会重复创建连接池；
+    其他表名或维度会基于共享连接池创建独立的向量存储。
+    
     Args:
         table_name: 向量表名
-        embed_dim: 嵌入向量维度（GeminiEmbedding 实际为 3072）
+        embed_dim: 嵌入向量维度，默认使用 RAG_EMBED_DIM
         
     Returns:
         Optional[VectorStoreIndex]: 向量索引对象，如果加载失败返回 None
     """
+    from app.rag.resources import get_rag_resources
+    
     try:
         # 检查必要的模块是否可用
         if PGVectorStore is None:
@@ -58,36 +97,15 @@ def load_index(
             logger.error("GeminiEmbedding 未安装，请运行: pip install llama-index-embeddings-gemini")
             return None
         
-        # 构建 PostgreSQL 连接 URL
-        connection_string = (
-            f"postgresql://{settings.POSTGRES_USER}:{settings.POSTGRES_PASSWORD}"
-            f"@{settings.POSTGRES_HOST}:{settings.POSTGRES_PORT}/{settings.POSTGRES_DB}"
-        )
-        
-        # 创建数据库引擎
-        engine = create_engine(connection_string)
-        
-        # 配置 Gemini Embedding
-        embed_model = GeminiEmbedding(
-            model_name="models/gemini-embedding-001",
-            api_key=settings.GEMINI_API_KEY
-        )
+        manager = get_rag_resources()
+        embed_dim = embed_dim or manager.embed_dim
+        if table_name == manager.table_name and embed_dim == manager.embed_dim:
+            resources = manager.get()
+            return resources.index if resources else None
         
-        # 设置全局嵌入模型
+        embed_model = get_embed_model()
         Settings.embed_model = embed_model
-        
-        # 创建 PGVectorStore
-        vector_store = PGVectorStore.from_params(
-            database=settings.POSTGRES_DB,
-            host=settings.POSTGRES_HOST,
-            password=settings.POSTGRES_PASSWORD,
-            port=settings.POSTGRES_PORT,
-            user=settings.POSTGRES_USER,
-            table_name=table_name,
-            embed_dim=embed_dim
-        )
-        
-        # 从向量存储加载索引
+        vector_store = manager.create_vector_store(table_name, embed_dim)
         index = VectorStoreIndex.from_vector_store(
             vector_store=vector_store,
             embed_model=embed_model
@@ -103,10 +121,10 @@ def load_index(
 
 def get_or_create_index(
     table_name: str = "llama_index_vectors",  # PGVectorStore 会自动添加 data_ 前缀
-    embed_dim: int = 3072  # GeminiEmbedding 实际维度
+    embed_dim: Optional[int] = None  # 默认使用 RAG_EMBED_DIM
 ) -> Optional[VectorStoreIndex]:
     """
-    获取或创建索引（如果不存在则创建）
+    获取或创建索引（向量表不存在时由 PGVectorStore 自动创建）
     
     Args:
         table_name: 向量表名
@@ -115,51 +133,4 @@ def get_or_create_index(
     Returns:
         Optional[VectorStoreIndex]: 向量索引对象
     """
-    index = load_index(table_name, embed_dim)
-    
-    # 如果索引不存在，创建一个新的
-    if index is None:
-        try:
-            # 检查必要的模块是否可用
-            if PGVectorStore is None or GeminiEmbedding is None:
-                logger.error("必要的模块未安装")
-                return None
-            
-            connection_string = (
-                f"postgresql://{settings.POSTGRES_USER}:{settings.POSTGRES_PASSWORD}"
-                f"@{settings.POSTGRES_HOST}:{settings.POSTGRES_PORT}/{settings.POSTGRES_DB}"
-            )
-            
-            engine = create_engine(connection_string)
-            
-            embed_model = GeminiEmbedding(
-                model_name="models/gemini-embedding-001",
-                api_key=settings.GEMINI_API_KEY
-            )
-            
-            Settings.embed_model = embed_model
-            
-            vector_store = PGVectorStore.from_params(
-                database=settings.POSTGRES_DB,
-                host=settings.POSTGRES_HOST,
-                password=settings.POSTGRES_PASSWORD,
-                port=settings.POSTGRES_PORT,
-                user=settings.POSTGRES_USER,
-                table_name=table_name,
-                embed_dim=embed_dim
-            )
-            
-            index = VectorStoreIndex.from_vector_store(
-                vector_store=vector_store,
-                embed_model=embed_model
-            )
-            
-            logger.info("创建新的向量索引")
-            return index
-            
-        except Exception as e:
-            logger.error(f"创建向量索引失败: {str(e)}")
-            return None
-    
-    return index
-
+    return load_index(table_name, embed_dim)
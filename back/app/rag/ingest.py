@@ -1,18 +1,120 @@
 """
 知识库文档索引更新脚本
-从指定目录加载文档并更新向量索引
+从指定目录加载文档并增量更新向量索引（只处理新增、变化和删除的文件）
 """
-import os
 import sys
 from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
 from llama_index.core import SimpleDirectoryReader, Document
-from app.rag.rag_service import update_knowledge_base
+from app.db.models import KnowledgeFile
+from app.db.session import SessionLocal, engine
+from app.rag.manifest import diff_manifest, load_manifest, scan_directory
+from app.rag.rag_service import rag_service
 from app.utils.logger import logger
 
 
+def load_file_documents(path: Path, source_file: str) -> List[Document]:
+    """
+    读取单个文件为文档，并写入文件相关 metadata
+    
+    Args:
+        path: 文件路径
+        source_file: 文件清单中的相对路径
+        
+    Returns:
+        List[Document]: 文档列表（PDF 等格式每页一个文档）
+    """
+    reader = SimpleDirectoryReader(input_files=[str(path)])
+    documents = reader.load_data()
+    for doc in documents:
+        doc.metadata['filename'] = path.name
+        doc.metadata['file_path'] = str(path)
+        doc.metadata['source_file'] = source_file
+    return documents
+
+
+def sync_directory(
+    data_dir: str = "data",
+    progress: Optional[Callable[..., None]] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    按文件清单增量同步目录到知识库
+    
+    只解析和嵌入新增或内容变化的文件，变化文件的旧分块在同一事务中替换，
+    已删除文件的向量会被移除。
+    
+    Args:
+        data_dir: 文档目录路径
+        progress: 进度回调 progress(phase, **counters)，阶段依次为
+            scanning / loading / embedding / writing（见 app.rag.jobs）
+        
+    Returns:
+        Optional[Dict[str, Any]]: 同步统计（各类文件数、分块增删数），失败返回 None
+    """
+    # 检查目录是否存在
+    data_path = Path(data_dir)
+    if not data_path.exists():
+        logger.warning(f"文档目录不存在: {data_dir}，将创建空目录")
+        data_path.mkdir(parents=True, exist_ok=True)
+        logger.info("请将文档放入 data/ 目录后重新运行")
+        return None
+    
+    if progress:
+        progress("scanning")
+    files = scan_directory(data_dir)
+    KnowledgeFile.__table__.create(bind=engine, checkfirst=True)
+    with SessionLocal() as db:
+        manifest = load_manifest(db)
+    
+    if not files and not manifest:
+        logger.warning("未找到任何文档")
+        return None
+    
+    changes = diff_manifest(files, manifest)
+    logger.info(
+        f"文件变更: 新增 {len(changes['added'])}，变化 {len(changes['changed'])}，"
+        f"删除 {len(changes['deleted'])}，未变化 {len(changes['unchanged']) + len(changes['touched'])}"
+    )
+    
+    # 只读取新增和变化的文件
+    file_documents: Dict[str, List[Document]] = {}
+    load_failed = []
+    to_load = changes["added"] + changes["changed"]
+    if progress:
+        progress("loading", documents_total=len(to_load), documents_processed=0)
+    for i, source_file in enumerate(to_load, start=1):
+        try:
+            file_documents[source_file] = load_file_documents(files[source_file]["path"], source_file)
+        except Exception as e:
+            # 读取失败的文件不写入清单，下次同步时重试
+            load_failed.append(source_file)
+            logger.error(f"读取文件 {source_file} 失败: {str(e)}")
+        if progress:
+            progress("loading", documents_processed=i)
+    
+    summary = rag_service.sync_files(
+        file_documents,
+        files,
+        deleted_files=changes["deleted"],
+        touched_files=changes["touched"],
+        progress=progress
+    )
+    if summary is None:
+        return None
+    
+    return {
+        **summary,
+        "added": len(changes["added"]),
+        "changed": len(changes["changed"]),
+        "deleted": len(changes["deleted"]),
+        "unchanged": len(changes["unchanged"]) + len(changes["touched"]),
+        "load_failed": load_failed,
+    }
+
+
 def ingest_documents(data_dir: str = "data") -> bool:
     """
-    从目录加载文档并更新索引
+    从目录加载文档并更新索引（增量同步，见 sync_directory）
     
     Args:
         data_dir: 文档目录路径
@@ -21,44 +123,14 @@ def ingest_documents(data_dir: str = "data") -> bool:
         bool: 是否成功
     """
     try:
-        # 检查目录是否存在
-        data_path = Path(data_dir)
-        if not data_path.exists():
-            logger.warning(f"文档目录不存在: {data_dir}，将创建空目录")
-            data_path.mkdir(parents=True, exist_ok=True)
-            logger.info("请将文档放入 data/ 目录后重新运行")
-            return False
-        
-        # 读取文档
-        logger.info(f"从 {data_dir} 目录加载文档...")
-        reader = SimpleDirectoryReader(input_dir=data_dir, recursive=True)
-        documents = reader.load_data()
-        
-        # 为每个文档添加文件名到 metadata
-        for doc in documents:
-            if hasattr(doc, 'metadata') and doc.metadata:
-                # 如果 metadata 中有 file_path，提取文件名
-                file_path = doc.metadata.get('file_path', '')
-                if file_path:
-                    filename = Path(file_path).name
-                    doc.metadata['filename'] = filename
-                    doc.metadata['file_path'] = str(file_path)
-        
-        if not documents:
-            logger.warning("未找到任何文档")
-            return False
-        
-        logger.info(f"成功加载 {len(documents)} 个文档")
-        
-        # 更新知识库
-        success = update_knowledge_base(documents)
+        summary = sync_directory(data_dir)
         
-        if success:
+        if summary is not None:
             logger.info("知识库更新成功")
         else:
             logger.error("知识库更新失败")
         
-        return success
+        return summary is not None
         
     except Exception as e:
         logger.error(f"文档索引更新失败: {str(e)}")
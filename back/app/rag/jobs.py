@@ -0,0 +1,351 @@
+"""
+知识库导入后台任务模块
+在单独的工作线程中执行增量导入，接口立即返回任务 ID
+
+同一时间只运行一个导入任务。任务运行期间到达的新请求会合并到同一个排队中的后续任务：
+运行中的任务已经扫描过目录，看不到之后上传的文件，因此不能直接并入；
+而后续任务是增量同步，没有新变化时几乎没有开销。
+
+多个 uvicorn worker 之间通过 Postgres advisory lock 互斥：拿不到锁的 worker 让任务留在队列中
+（phase 为 waiting，新请求仍可并入）并定期重试，避免两个 worker 同时同步同一文件导致分块重复，
+以及同时创建 ANN 索引。
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+from sqlalchemy import text
+from app.utils.logger import logger
+
+# 保留的历史任务数
+JOB_HISTORY_LIMIT = 50
+
+# 导入线程的 nice 值（Linux 上可单独降低线程调度优先级，减少对查询请求的影响）
+WORKER_NICENESS = 10
+
+# 导入任务 advisory lock 的键（所有 worker 相同）
+INGESTION_LOCK_KEY = 0x7261675F696E67
+
+# 其他 worker 持有导入锁时的重试间隔（秒）
+LOCK_RETRY_INTERVAL = 1.0
+
+
+class IngestionJob:
+    """导入任务（进度字段由工作线程更新）"""
+
+    def __init__(self, data_dir: str):
+        self.id = uuid.uuid4().hex
+        self.data_dir = data_dir
+        self.status = "queued"  # queued / running / succeeded / failed
+        self.phase = "queued"  # queued / waiting / scanning / loading / embedding / writing / done
+        self.merged_requests = 1
+        self.counters: Dict[str, int] = {
+            "documents_total": 0,
+            "documents_processed": 0,
+            "nodes_total": 0,
+            "embeddings_done": 0,
+            "files_total": 0,
+            "files_written": 0,
+        }
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.phase_started_at: Optional[float] = None
+        self.embedding_started_at: Optional[float] = None
+        self.summary: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def update(self, phase: str, **counters: int) -> None:
+        """
+        更新任务阶段和计数（作为进度回调传给 sync_directory）
+
+        Args:
+            phase: 当前阶段
+            **counters: 需要更新的计数字段
+        """
+        with self._lock:
+            now = time.time()
+            if phase != self.phase:
+                self.phase = phase
+                self.phase_started_at = now
+                if phase == "embedding":
+                    self.embedding_started_at = now
+            for key, value in counters.items():
+                if key in self.counters:
+                    self.counters[key] = value
+
+    def _rates(self, now: float) -> Dict[str, Optional[float]]:
+        """计算嵌入速度和当前阶段的预计剩余时间"""
+        embeddings_per_second = None
+        if self.embedding_started_at and self.counters["embeddings_done"]:
+            elapsed = now - self.embedding_started_at
+            embeddings_per_second = self.counters["embeddings_done"] / elapsed if elapsed > 0 else None
+
+        progress = {
+            "loading": ("documents_processed", "documents_total"),
+            "embedding": ("embeddings_done", "nodes_total"),
+            "writing": ("files_written", "files_total"),
+        }.get(self.phase)
+        eta_seconds = None
+        if progress and self.phase_started_at and self.status == "running":
+            done, total = self.counters[progress[0]], self.counters[progress[1]]
+            elapsed = now - self.phase_started_at
+            if done and total >= done:
+                eta_seconds = elapsed / done * (total - done)
+        return {"embeddings_per_second": embeddings_per_second, "eta_seconds": eta_seconds}
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典"""
+        with self._lock:
+            now = time.time()
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "phase": self.phase,
+                "data_dir": self.data_dir,
+                "merged_requests": self.merged_requests,
+                **self.counters,
+                **self._rates(now),
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "elapsed_seconds": ((self.finished_at or now) - self.started_at) if self.started_at else None,
+                "summary": self.summary,
+                "error": self.error,
+            }
+
+
+class PostgresAdvisoryLock:
+    """
+    Postgres 会话级 advisory lock（多个 worker 进程之间互斥）
+
+    锁绑定在一个专用连接上，持锁进程崩溃或连接断开时由数据库自动释放。
+    """
+
+    def __init__(self, key: int = INGESTION_LOCK_KEY, engine: Any = None):
+        """
+        初始化锁
+
+        Args:
+            key: 锁的键
+            engine: 数据库引擎，默认为 app.db.session.engine
+        """
+        self.key = key
+        self._engine = engine
+        self._conn = None
+
+    def try_acquire(self) -> bool:
+        """
+        尝试获取锁（不等待）
+
+        Returns:
+            bool: 是否获取成功
+        """
+        if self._engine is None:
+            from app.db.session import engine
+            self._engine = engine
+        conn = self._engine.connect()
+        try:
+            acquired = conn.execute(text("SELECT pg_try_advisory_lock(:key);"), {"key": self.key}).scalar()
+            conn.commit()
+        except Exception:
+            conn.close()
+            raise
+        if not acquired:
+            conn.close()
+            return False
+        self._conn = conn
+        return True
+
+    def release(self) -> None:
+        """释放锁（未持有时跳过）"""
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        try:
+            conn.execute(text("SELECT pg_advisory_unlock(:key);"), {"key": self.key})
+            conn.commit()
+        except Exception as e:
+            # 连接不再放回连接池，断开后数据库自动释放锁
+            logger.warning(f"释放导入锁失败，断开连接: {str(e)}")
+            conn.invalidate()
+        finally:
+            conn.close()
+
+
+class IngestionJobManager:
+    """导入任务管理器（单工作线程）"""
+
+    def __init__(
+        self,
+        runner: Optional[Callable[..., Optional[Dict[str, Any]]]] = None,
+        lock: Any = None
+    ):
+        """
+        初始化任务管理器
+
+        Args:
+            runner: 执行导入的函数，签名为 runner(data_dir, progress=...)，
+                默认为 app.rag.ingest.sync_directory
+            lock: 跨进程导入锁（提供 try_acquire() / release()），默认为 PostgresAdvisoryLock
+        """
+        self._runner = runner
+        self._ingestion_lock = lock if lock is not None else PostgresAdvisoryLock()
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._running: Optional[IngestionJob] = None
+        self._queue: List[IngestionJob] = []
+        self._worker: Optional[threading.Thread] = None
+
+    def _get_runner(self):
+        if self._runner is None:
+            from app.rag.ingest import sync_directory
+            self._runner = sync_directory
+        return self._runner
+
+    def submit(self, data_dir: str = "data") -> Dict[str, Any]:
+        """
+        提交导入请求
+
+        没有任务运行时立即启动；已有任务运行时合并到排队中的后续任务。
+
+        Args:
+            data_dir: 文档目录
+
+        Returns:
+            Dict[str, Any]: {"job": 任务信息, "merged": 是否并入已有任务}
+        """
+        with self._lock:
+            for queued in self._queue:
+                if queued.data_dir == data_dir:
+                    queued.merged_requests += 1
+                    return {"job": queued.to_dict(), "merged": True}
+
+            job = IngestionJob(data_dir)
+            self._jobs[job.id] = job
+            self._queue.append(job)
+            while len(self._jobs) > JOB_HISTORY_LIMIT:
+                oldest = next(iter(self._jobs.values()))
+                if oldest is self._running or oldest in self._queue:
+                    break
+                self._jobs.popitem(last=False)
+
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._work, name="rag-ingestion", daemon=True)
+                self._worker.start()
+            return {"job": job.to_dict(), "merged": False}
+
+    def _work(self) -> None:
+        """工作线程：依次执行排队的任务，直到没有后续任务"""
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), WORKER_NICENESS)
+        except (AttributeError, OSError):
+            pass
+
+        while True:
+            with self._lock:
+                if not self._queue:
+                    self._worker = None
+                    return
+                job = self._queue[0]
+            if not self._acquire_ingestion_lock(job):
+                # 其他 worker 正在导入，任务留在队列中（新请求仍可并入）稍后重试
+                time.sleep(LOCK_RETRY_INTERVAL)
+                continue
+            try:
+                with self._lock:
+                    self._queue.pop(0)
+                    self._running = job
+                    job.status = "running"
+                    job.started_at = time.time()
+                self._run(job)
+            finally:
+                self._ingestion_lock.release()
+                with self._lock:
+                    self._running = None
+
+    def _acquire_ingestion_lock(self, job: IngestionJob) -> bool:
+        """获取跨进程导入锁，拿不到时把任务标记为等待中"""
+        try:
+            acquired = self._ingestion_lock.try_acquire()
+        except Exception as e:
+            # 数据库不可用时导入本身也会失败，不在这里阻塞任务
+            logger.warning(f"获取导入锁失败，直接执行任务 {job.id}: {str(e)}")
+            return True
+        if not acquired and job.phase != "waiting":
+            logger.info(f"其他 worker 正在导入知识库，任务 {job.id} 等待中")
+            job.update("waiting")
+        return acquired
+
+    def _run(self, job: IngestionJob) -> None:
+        """执行单个任务并记录结果"""
+        logger.info(f"开始执行知识库导入任务 {job.id}")
+        try:
+            summary = self._get_runner()(job.data_dir, progress=job.update)
+            if summary is None:
+                raise RuntimeError("知识库更新失败，请检查日志")
+            job.update("done")
+            job.summary = summary
+            job.finished_at = time.time()
+            job.status = "succeeded"
+            logger.info(f"知识库导入任务 {job.id} 完成: {summary}")
+        except Exception as e:
+            job.error = str(e)
+            job.finished_at = time.time()
+            job.status = "failed"
+            logger.error(f"知识库导入任务 {job.id} 失败: {str(e)}")
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        获取任务状态
+
+        Args:
+            job_id: 任务 ID
+
+        Returns:
+            Optional[Dict[str, Any]]: 任务信息，不存在返回 None
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job.to_dict() if job else None
+
+    def list(self) -> List[Dict[str, Any]]:
+        """获取最近的任务（新任务在前）"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.to_dict() for job in reversed(jobs)]
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        阻塞等待任务结束（供脚本和测试使用）
+
+        Args:
+            job_id: 任务 ID
+            timeout: 超时时间（秒）
+
+        Returns:
+            Optional[Dict[str, Any]]: 任务信息
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job["status"] in ("succeeded", "failed"):
+                return job
+            if deadline is not None and time.time() >= deadline:
+                return job
+            time.sleep(0.05)
+
+
+# 全局任务管理器实例（延迟初始化）
+ingestion_jobs = None
+
+
+def get_ingestion_jobs() -> IngestionJobManager:
+    """获取导入任务管理器实例（单例模式）"""
+    global ingestion_jobs
+    if ingestion_jobs is None:
+        ingestion_jobs = IngestionJobManager()
+    return ingestion_jobs
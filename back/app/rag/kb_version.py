@@ -0,0 +1,166 @@
+"""
+知识库版本号模块
+版本号保存在 Postgres 的 knowledge_base_version 表（单行计数器），所有 uvicorn worker 共享：
+
+- 写入方在删除 / 写入分块的同一事务中调用 bump() 递增版本号，事务提交后其他 worker 即可读到
+- 读取方调用 aget() / get()，版本号在进程内缓存 RAG_KB_VERSION_TTL 秒，
+  其他 worker 写入后最多延迟这么久，语义缓存和相同查询合并的键随之失效
+- 数据库不可用时沿用进程内的版本号（本进程的写入仍然递增）
+"""
+import threading
+import time
+from typing import Any, Callable, Optional
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.db.models import KnowledgeBaseVersion
+from app.utils.logger import logger
+
+BUMP_SQL = text("""
+    INSERT INTO knowledge_base_version (id, version, updated_at) VALUES (1, 1, CURRENT_TIMESTAMP)
+    ON CONFLICT (id) DO UPDATE
+    SET version = knowledge_base_version.version + 1, updated_at = CURRENT_TIMESTAMP
+    RETURNING version;
+""")
+
+SELECT_SQL = text("SELECT version FROM knowledge_base_version WHERE id = 1;")
+
+
+class KnowledgeBaseVersionTracker:
+    """多进程共享的知识库版本号（读取带进程内缓存）"""
+
+    def __init__(
+        self,
+        engine: Any,
+        async_engine: Optional[Callable[[], Any]] = None,
+        ttl: Optional[float] = None,
+        on_change: Optional[Callable[[int], None]] = None
+    ):
+        """
+        初始化版本号
+
+        Args:
+            engine: 同步引擎
+            async_engine: 返回异步引擎的函数（异步引擎延迟创建），不提供时异步读取也走同步引擎
+            ttl: 进程内缓存秒数，默认 RAG_KB_VERSION_TTL；不大于 0 表示每次都读取数据库
+            on_change: 读到的版本号与进程内不同时的回调（参数为新版本号）
+        """
+        self.engine = engine
+        self.async_engine = async_engine
+        self.ttl = settings.RAG_KB_VERSION_TTL if ttl is None else ttl
+        self.on_change = on_change
+        self._version = 0
+        self._checked_at: Optional[float] = None
+        self._table_ready = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def bump(connection: Any) -> int:
+        """
+        在调用方的事务中递增版本号（事务提交后生效）
+
+        Args:
+            connection: 数据库连接或会话（由调用方控制事务）
+
+        Returns:
+            int: 新的版本号
+        """
+        bind = connection.connection() if isinstance(connection, Session) else connection
+        KnowledgeBaseVersion.__table__.create(bind=bind, checkfirst=True)
+        return int(connection.execute(BUMP_SQL).scalar())
+
+    def bump_now(self) -> int:
+        """
+        在单独的事务中递增版本号，数据库不可用时只递增进程内的版本号
+
+        Returns:
+            int: 新的版本号
+        """
+        try:
+            with self.engine.begin() as conn:
+                version = self.bump(conn)
+        except Exception as e:
+            logger.warning(f"递增共享知识库版本号失败，使用进程内版本号: {str(e)}")
+            with self._lock:
+                version = self._version + 1
+        self.observe(version)
+        return version
+
+    def observe(self, version: int) -> None:
+        """
+        记录已知的最新版本号（本进程写入提交后调用，或从数据库读到后调用）
+
+        Args:
+            version: 版本号
+        """
+        with self._lock:
+            changed = version != self._version
+            self._version = version
+            self._checked_at = time.monotonic()
+        if changed and self.on_change:
+            try:
+                self.on_change(version)
+            except Exception as e:
+                logger.warning(f"知识库版本号变化回调失败: {str(e)}")
+
+    def _claim_refresh(self) -> bool:
+        """缓存过期时由一个调用方刷新，其他并发调用方继续使用缓存值"""
+        with self._lock:
+            now = time.monotonic()
+            if self._checked_at is not None and now - self._checked_at < self.ttl:
+                return False
+            self._checked_at = now
+            return True
+
+    def _read_failed(self, e: Exception) -> int:
+        logger.warning(f"读取共享知识库版本号失败，使用进程内版本号: {str(e)}")
+        return self._version
+
+    def get(self) -> int:
+        """
+        读取当前版本号（同步）
+
+        Returns:
+            int: 版本号
+        """
+        if not self._claim_refresh():
+            return self._version
+        try:
+            with self.engine.begin() as conn:
+                if not self._table_ready:
+                    KnowledgeBaseVersion.__table__.create(bind=conn, checkfirst=True)
+                version = conn.execute(SELECT_SQL).scalar() or 0
+            self._table_ready = True
+        except Exception as e:
+            return self._read_failed(e)
+        self.observe(int(version))
+        return int(version)
+
+    async def aget(self) -> int:
+        """
+        读取当前版本号（异步，用于请求路径）
+
+        Returns:
+            int: 版本号
+        """
+        if self.async_engine is None:
+            return self.get()
+        if not self._claim_refresh():
+            return self._version
+        try:
+            async with self.async_engine().begin() as conn:
+                if not self._table_ready:
+                    await conn.run_sync(lambda sync_conn: KnowledgeBaseVersion.__table__.create(
+                        bind=sync_conn, checkfirst=True
+                    ))
+                version = (await conn.execute(SELECT_SQL)).scalar() or 0
+            self._table_ready = True
+        except Exception as e:
+            return self._read_failed(e)
+        self.observe(int(version))
+        return int(version)
+
+    @property
+    def cached(self) -> int:
+        """进程内缓存的版本号（不访问数据库）"""
+        return self._version
@@ -0,0 +1,239 @@
+"""
+词法检索模块
+在向量表上维护一列中文友好的 tsvector，与向量检索结果用 RRF（倒数排名融合）合并
+
+PostgreSQL 自带的全文检索解析器不做中文分词，这里在 Python 侧分词后直接写入词位：
+- 中文按相邻两字切分（二元组），单字词保留单字，不依赖分词词典
+- 英文和数字按整体保留，带连字符、点、下划线的编号（如 SKU-1024、E0x3F）同时保留整体和各部分
+- 先做 NFKC 归一化并转为小写，全角字母数字与半角等价
+
+查询使用同样的分词，词位之间为 OR，按 ts_rank_cd 排序；GIN 索引保证查询开销与数据量无关。
+"""
+import json
+import re
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from sqlalchemy import text
+from app.utils.logger import logger
+
+# 向量表上的词法列名
+LEXICAL_COLUMN = "lexical_tsv"
+
+# 回填时每批处理的行数
+BACKFILL_BATCH_SIZE = 500
+
+# tsvector 的位置上限和每个词位最多保留的位置数
+MAX_POSITION = 16383
+MAX_POSITIONS_PER_LEXEME = 256
+
+_TOKEN_RE = re.compile(
+    r"[a-z0-9]+(?:[-_./][a-z0-9]+)*"
+    r"|[㐀-䶿一-鿿豈-﫿]+"
+)
+_SEPARATOR_RE = re.compile(r"[-_./]")
+
+
+def tokenize(content: str) -> List[str]:
+    """
+    分词（中文二元组 + 英文数字整词）
+
+    Args:
+        content: 文本
+
+    Returns:
+        List[str]: 按出现顺序排列的词位（可能重复）
+    """
+    tokens: List[str] = []
+    normalized = unicodedata.normalize("NFKC", content or "").lower()
+    for match in _TOKEN_RE.finditer(normalized):
+        token = match.group()
+        if token[0].isascii():
+            tokens.append(token)
+            parts = _SEPARATOR_RE.split(token)
+            if len(parts) > 1:
+                tokens.extend(part for part in parts if part)
+        elif len(token) == 1:
+            tokens.append(token)
+        else:
+            tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+    return tokens
+
+
+def _quote(lexeme: str) -> str:
+    """按 tsvector / tsquery 文本格式转义词位"""
+    return "'" + lexeme.replace("\\", "\\\\").replace("'", "''") + "'"
+
+
+def to_tsvector_literal(tokens: Sequence[str]) -> str:
+    """
+    将词位序列转换为 tsvector 文本（带位置，供 ts_rank_cd 计算邻近度）
+
+    Args:
+        tokens: tokenize 的结果
+
+    Returns:
+        str: 如 "'退货':1 '货流':2"
+    """
+    positions: Dict[str, List[int]] = {}
+    for position, token in enumerate(tokens, start=1):
+        slots = positions.setdefault(token, [])
+        if len(slots) < MAX_POSITIONS_PER_LEXEME:
+            slots.append(min(position, MAX_POSITION))
+    return " ".join(
+        f"{_quote(token)}:{','.join(map(str, sorted(set(slots))))}"
+        for token, slots in positions.items()
+    )
+
+
+def to_tsquery_literal(tokens: Sequence[str]) -> Optional[str]:
+    """
+    将查询词位转换为 tsquery 文本（词位之间为 OR）
+
+    Args:
+        tokens: tokenize 的结果
+
+    Returns:
+        Optional[str]: tsquery 文本，没有词位时返回 None
+    """
+    unique = list(dict.fromkeys(tokens))
+    if not unique:
+        return None
+    return " | ".join(_quote(token) for token in unique)
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    倒数排名融合：score(d) = Σ 1 / (k + rank_i(d))
+
+    只依赖排名，不需要对余弦相似度和 ts_rank 两种分数做归一化。
+
+    Args:
+        rankings: 多路检索结果（按相关度排序的 ID 列表）
+        k: 平滑常数，越大各路排名靠后的结果权重衰减越慢
+
+    Returns:
+        List[Tuple[str, float]]: 按融合分数降序排列的 (ID, 分数)
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def ensure_lexical_column(engine: Any, table_name: str) -> int:
+    """
+    确保向量表上存在词法列和 GIN 索引，并回填尚未分词的行
+
+    Args:
+        engine: 同步数据库引擎
+        table_name: 向量表实际表名
+
+    Returns:
+        int: 回填的行数
+    """
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {LEXICAL_COLUMN} tsvector"))
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS {table_name}_{LEXICAL_COLUMN}_idx "
+            f"ON {table_name} USING gin ({LEXICAL_COLUMN})"
+        ))
+
+    backfilled = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(text(
+                f"SELECT id, text FROM {table_name} WHERE {LEXICAL_COLUMN} IS NULL LIMIT :limit"
+            ), {"limit": BACKFILL_BATCH_SIZE}).fetchall()
+            if not rows:
+                break
+            conn.execute(
+                text(f"UPDATE {table_name} SET {LEXICAL_COLUMN} = CAST(:tsv AS tsvector) WHERE id = :id"),
+                [{"id": row[0], "tsv": to_tsvector_literal(tokenize(row[1]))} for row in rows]
+            )
+            backfilled += len(rows)
+    if backfilled:
+        logger.info(f"已为 {backfilled} 个分块回填词法索引")
+    return backfilled
+
+
+def index_nodes(conn: Any, table_name: str, nodes: Sequence[Any]) -> None:
+    """
+    为刚写入的节点写入词法列（在调用方的事务中执行）
+
+    Args:
+        conn: 数据库连接或会话
+        table_name: 向量表实际表名
+        nodes: 已写入的节点
+    """
+    if not nodes:
+        return
+    conn.execute(
+        text(f"UPDATE {table_name} SET {LEXICAL_COLUMN} = CAST(:tsv AS tsvector) WHERE node_id = :node_id"),
+        [
+            {"node_id": node.node_id, "tsv": to_tsvector_literal(tokenize(node.get_content()))}
+            for node in nodes
+        ]
+    )
+
+
+def _search_sql(table_name: str) -> str:
+    return f"""
+        SELECT node_id, text, metadata_, ts_rank_cd({LEXICAL_COLUMN}, query, 1) AS rank
+        FROM {table_name}, CAST(:query AS tsquery) AS query
+        WHERE {LEXICAL_COLUMN} @@ query
+        ORDER BY rank DESC
+        LIMIT :limit
+    """
+
+
+def _rows_to_results(rows: Sequence[Any]) -> List[Dict[str, Any]]:
+    results = []
+    for node_id, content, metadata, rank in rows:
+        if isinstance(metadata, str):
+            metadata = json.loads(metadata)
+        results.append({"node_id": node_id, "text": content, "metadata": metadata or {}, "score": float(rank)})
+    return results
+
+
+def lexical_search(engine: Any, table_name: str, query: str, limit: int) -> List[Dict[str, Any]]:
+    """
+    词法检索
+
+    Args:
+        engine: 同步数据库引擎
+        table_name: 向量表实际表名
+        query: 查询文本
+        limit: 返回结果数
+
+    Returns:
+        List[Dict[str, Any]]: 按 ts_rank_cd 降序排列的分块
+    """
+    tsquery = to_tsquery_literal(tokenize(query))
+    if tsquery is None:
+        return []
+    with engine.connect() as conn:
+        rows = conn.execute(text(_search_sql(table_name)), {"query": tsquery, "limit": limit}).fetchall()
+    return _rows_to_results(rows)
+
+
+async def alexical_search(async_engine: Any, table_name: str, query: str, limit: int) -> List[Dict[str, Any]]:
+    """
+    异步词法检索
+
+    Args:
+        async_engine: 异步数据库引擎
+        table_name: 向量表实际表名
+        query: 查询文本
+        limit: 返回结果数
+
+    Returns:
+        List[Dict[str, Any]]: 按 ts_rank_cd 降序排列的分块
+    """
+    tsquery = to_tsquery_literal(tokenize(query))
+    if tsquery is None:
+        return []
+    async with async_engine.connect() as conn:
+        result = await conn.execute(text(_search_sql(table_name)), {"query": tsquery, "limit": limit})
+        rows = result.fetchall()
+    return _rows_to_results(rows)
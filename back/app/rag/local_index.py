@@ -0,0 +1,291 @@
+"""
+本地向量索引模块
+把 pgvector 中全部分块的嵌入导出为本地快照，用 NumPy 矩阵乘法在进程内完成向量检索
+
+适用于数千到数万个分块的知识库：检索不需要访问数据库，pgvector 仍是唯一的数据来源，
+每次导入完成后重新导出快照。
+
+快照目录结构（{RAG_LOCAL_INDEX_DIR}/）：
+- snapshot-{时间戳}-{pid}/vectors.npy: 归一化后的向量矩阵（float32 / float16 / int8）
+- snapshot-{时间戳}-{pid}/scales.npy: int8 量化时每行的缩放系数
+- snapshot-{时间戳}-{pid}/meta.json: 分块的 node_id、文本和 metadata
+- CURRENT: 当前快照目录名（写完快照后原子替换）
+
+向量矩阵以 memmap 只读打开，多个 uvicorn worker 共享同一份页缓存；
+每次检索前检查 CURRENT，其他 worker 导出新快照后自动切换。
+
+精度选择：float32 可以直接走 BLAS，5000 × 768 的矩阵检索约 1 ms；
+NumPy 没有 float16 / int8 的快速矩阵乘法，这两种精度需要分块转换为 float32 计算，
+文件更小但检索慢一个数量级，适合内存比延迟更紧张的场景。
+"""
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from app.config import settings
+from app.utils.logger import logger
+
+SUPPORTED_DTYPES = ("float32", "float16", "int8")
+
+# float16 / int8 分块转换为 float32 计算时每块的行数
+SCORE_BLOCK_ROWS = 4096
+
+
+class _Snapshot:
+    """一份已加载的快照（只读）"""
+
+    def __init__(self, path: Path):
+        self.name = path.name
+        self.vectors = np.load(path / "vectors.npy", mmap_mode="r")
+        scales_path = path / "scales.npy"
+        self.scales = np.load(scales_path, mmap_mode="r") if scales_path.exists() else None
+        with open(path / "meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.node_ids: List[str] = meta["node_ids"]
+        self.texts: List[str] = meta["texts"]
+        self.metadata: List[Dict[str, Any]] = meta["metadata"]
+        self.created_at: float = meta["created_at"]
+        self.positions: Dict[str, int] = {node_id: i for i, node_id in enumerate(self.node_ids)}
+
+    @property
+    def dim(self) -> int:
+        return int(self.vectors.shape[1]) if self.vectors.ndim == 2 else 0
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        """计算全部分块与查询向量的余弦相似度（向量均已归一化）"""
+        if self.vectors.dtype == np.float32:
+            return self.vectors @ query
+        scores = np.empty(self.vectors.shape[0], dtype=np.float32)
+        for start in range(0, self.vectors.shape[0], SCORE_BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + len(block)] = block @ query
+        if self.scales is not None:
+            scores *= self.scales
+        return scores
+
+
+def quantize_int8(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    按行对称量化为 int8
+
+    Args:
+        matrix: float32 矩阵
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (int8 矩阵, 每行缩放系数)
+    """
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+class LocalVectorIndex:
+    """本地向量索引（memmap 快照 + NumPy 检索）"""
+
+    def __init__(self, index_dir: Optional[str] = None, dtype: Optional[str] = None):
+        """
+        初始化本地向量索引
+
+        Args:
+            index_dir: 快照目录，默认 RAG_LOCAL_INDEX_DIR
+            dtype: 导出精度（float32 / float16 / int8），默认 RAG_LOCAL_INDEX_DTYPE
+        """
+        self.index_dir = Path(index_dir or settings.RAG_LOCAL_INDEX_DIR)
+        self.dtype = dtype or settings.RAG_LOCAL_INDEX_DTYPE
+        if self.dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"不支持的本地索引精度: {self.dtype}")
+        self._snapshot: Optional[_Snapshot] = None
+        self._current_stamp: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def _current_path(self) -> Path:
+        return self.index_dir / "CURRENT"
+
+    def _refresh(self) -> Optional[_Snapshot]:
+        """CURRENT 变化时切换到新快照（CURRENT 每次都是替换为新文件，inode 必然变化）"""
+        try:
+            stat = self._current_path.stat()
+        except FileNotFoundError:
+            return None
+        stamp = (stat.st_ino, stat.st_mtime_ns)
+        if stamp == self._current_stamp and self._snapshot is not None:
+            return self._snapshot
+        with self._lock:
+            if stamp != self._current_stamp or self._snapshot is None:
+                try:
+                    name = self._current_path.read_text().strip()
+                    if self._snapshot is None or self._snapshot.name != name:
+                        self._snapshot = _Snapshot(self.index_dir / name)
+                        logger.info(f"本地向量索引已加载: {name}（{len(self._snapshot.node_ids)} 个分块）")
+                    self._current_stamp = stamp
+                except Exception as e:
+                    logger.error(f"加载本地向量索引失败: {str(e)}")
+        return self._snapshot
+
+    def is_ready(self) -> bool:
+        """是否已有可用快照"""
+        return self._refresh() is not None
+
+    def build(self, rows: Iterable[Tuple[str, str, Dict[str, Any], Sequence[float]]]) -> int:
+        """
+        导出快照并切换为当前快照
+
+        多个进程同时导出时通过文件锁串行执行。
+
+        Args:
+            rows: (node_id, 文本, metadata, 嵌入向量) 序列
+
+        Returns:
+            int: 导出的分块数
+        """
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.index_dir / "build.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            node_ids, texts, metadata, vectors = [], [], [], []
+            for node_id, content, meta, embedding in rows:
+                node_ids.append(node_id)
+                texts.append(content)
+                metadata.append(meta or {})
+                vectors.append(np.asarray(embedding, dtype=np.float32))
+
+            matrix = np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+            if len(matrix):
+                norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                norms[norms == 0] = 1.0
+                matrix /= norms
+
+            name = f"snapshot-{int(time.time() * 1000)}-{os.getpid()}"
+            path = self.index_dir / name
+            path.mkdir()
+            if self.dtype == "int8":
+                quantized, scales = quantize_int8(matrix)
+                np.save(path / "vectors.npy", quantized)
+                np.save(path / "scales.npy", scales)
+            else:
+                np.save(path / "vectors.npy", matrix.astype(self.dtype))
+            with open(path / "meta.json", "w", encoding="utf-8") as f:
+                json.dump(
+                    {"node_ids": node_ids, "texts": texts, "metadata": metadata, "created_at": time.time()},
+                    f,
+                    ensure_ascii=False
+                )
+
+            previous = self._current_path.read_text().strip() if self._current_path.exists() else None
+            tmp_path = self.index_dir / f"CURRENT.{os.getpid()}"
+            tmp_path.write_text(name)
+            os.replace(tmp_path, self._current_path)
+            # 保留上一份快照，正在切换的 worker 仍可以读取
+            self._cleanup(keep={name, previous})
+        logger.info(f"本地向量索引已导出: {name}（{len(node_ids)} 个分块，{self.dtype}）")
+        return len(node_ids)
+
+    def _cleanup(self, keep: set) -> None:
+        """删除旧快照（其他 worker 已 mmap 的文件在解除映射前仍然有效）"""
+        for path in self.index_dir.glob("snapshot-*"):
+            if path.name not in keep:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def search(self, query_embedding: Sequence[float], top_k: int = 3) -> Optional[List[Dict[str, Any]]]:
+        """
+        检索最相似的分块
+
+        Args:
+            query_embedding: 查询向量
+            top_k: 返回结果数
+
+        Returns:
+            Optional[List[Dict[str, Any]]]: 检索结果（与 RAGService 结果格式一致），
+                没有快照或维度不一致时返回 None（调用方回退到 pgvector）
+        """
+        snapshot = self._refresh()
+        if snapshot is None:
+            return None
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if snapshot.dim != len(query):
+            if snapshot.node_ids:
+                logger.warning(f"本地向量索引维度 {snapshot.dim} 与查询向量维度 {len(query)} 不一致")
+                return None
+            return []
+        norm = float(np.linalg.norm(query))
+        if norm > 0:
+            query = query / norm
+
+        scores = snapshot.scores(query)
+        k = min(top_k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            {
+                "node_id": snapshot.node_ids[i],
+                "text": snapshot.texts[i],
+                "score": float(scores[i]),
+                "metadata": snapshot.metadata[i],
+            }
+            for i in top
+        ]
+
+    def get_vectors(self, node_ids: Sequence[str]) -> Optional[Dict[str, np.ndarray]]:
+        """
+        读取指定分块的归一化嵌入（供检索结果后处理使用）
+
+        Args:
+            node_ids: 分块 node_id 列表
+
+        Returns:
+            Optional[Dict[str, np.ndarray]]: {node_id: float32 向量}，没有快照时返回 None
+        """
+        snapshot = self._refresh()
+        if snapshot is None:
+            return None
+        vectors = {}
+        for node_id in node_ids:
+            position = snapshot.positions.get(node_id)
+            if position is not None:
+                vector = np.asarray(snapshot.vectors[position], dtype=np.float32)
+                if snapshot.scales is not None:
+                    vector = vector * snapshot.scales[position]
+                vectors[node_id] = vector
+        return vectors
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取本地索引状态
+
+        Returns:
+            Dict[str, Any]: 快照名、分块数、维度、精度和文件大小
+        """
+        snapshot = self._refresh()
+        if snapshot is None:
+            return {"enabled": True, "snapshot": None}
+        return {
+            "enabled": True,
+            "snapshot": snapshot.name,
+            "chunks": len(snapshot.node_ids),
+            "dim": snapshot.dim,
+            "dtype": str(snapshot.vectors.dtype),
+            "size_bytes": int(snapshot.vectors.nbytes),
+            "created_at": snapshot.created_at,
+        }
+
+
+# 全局本地索引实例（延迟初始化）
+local_index = None
+
+
+def get_local_index() -> Optional[LocalVectorIndex]:
+    """获取本地向量索引实例（单例模式），未启用时返回 None"""
+    global local_index
+    if not settings.RAG_LOCAL_INDEX_ENABLED:
+        return None
+    if local_index is None:
+        local_index = LocalVectorIndex()
+    return local_index
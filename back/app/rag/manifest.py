@@ -0,0 +1,121 @@
+"""
+知识库文件清单模块
+记录已导入文件的大小、修改时间和内容哈希，计算增量导入所需的变更集
+
+文件以相对 data 目录的 POSIX 路径作为键（同时写入向量 metadata 的 source_file 字段），
+判断顺序：
+1. 大小和修改时间都未变 → 未变化（不读取文件内容）
+2. 内容哈希未变 → 未变化（只刷新修改时间）
+3. 否则 → 新增或变化
+清单中存在但磁盘上已不存在的文件 → 已删除
+"""
+import hashlib
+from pathlib import Path
+from typing import Any, Dict, List
+from sqlalchemy.orm import Session
+from app.db.models import KnowledgeFile
+
+# 计算文件哈希时的读取块大小
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def compute_file_hash(path: Path) -> str:
+    """
+    计算文件内容的 SHA-256
+
+    Args:
+        path: 文件路径
+
+    Returns:
+        str: 十六进制哈希
+    """
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def scan_directory(data_dir: str) -> Dict[str, Dict[str, Any]]:
+    """
+    扫描目录中的文件（递归，跳过隐藏文件，与 SimpleDirectoryReader 默认行为一致）
+
+    Args:
+        data_dir: 文档目录
+
+    Returns:
+        Dict[str, Dict[str, Any]]: {相对路径: {"path", "size", "mtime"}}
+    """
+    root = Path(data_dir)
+    files = {}
+    for path in sorted(root.rglob("*")):
+        relative = path.relative_to(root)
+        if not path.is_file() or any(part.startswith(".") for part in relative.parts):
+            continue
+        stat = path.stat()
+        files[relative.as_posix()] = {
+            "path": path,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+        }
+    return files
+
+
+def load_manifest(db: Session) -> Dict[str, Dict[str, Any]]:
+    """
+    读取数据库中的文件清单
+
+    Args:
+        db: 数据库会话
+
+    Returns:
+        Dict[str, Dict[str, Any]]: {相对路径: {"size", "mtime", "content_hash", "chunk_count"}}
+    """
+    return {
+        item.file_path: {
+            "size": item.size,
+            "mtime": item.mtime,
+            "content_hash": item.content_hash,
+            "chunk_count": item.chunk_count,
+        }
+        for item in db.query(KnowledgeFile).all()
+    }
+
+
+def diff_manifest(
+    files: Dict[str, Dict[str, Any]],
+    manifest: Dict[str, Dict[str, Any]]
+) -> Dict[str, List[str]]:
+    """
+    对比磁盘文件与清单，得到变更集
+
+    需要读取内容时会在 files 中补充 "content_hash"。
+
+    Args:
+        files: scan_directory 的结果
+        manifest: load_manifest 的结果
+
+    Returns:
+        Dict[str, List[str]]: {"added", "changed", "deleted", "unchanged", "touched"}，
+            touched 为内容未变但修改时间变化、只需刷新清单的文件
+    """
+    changes: Dict[str, List[str]] = {
+        "added": [], "changed": [], "deleted": [], "unchanged": [], "touched": []
+    }
+    for key, info in files.items():
+        known = manifest.get(key)
+        if known is None:
+            info["content_hash"] = compute_file_hash(info["path"])
+            changes["added"].append(key)
+            continue
+        if known["size"] == info["size"] and known["mtime"] == info["mtime"]:
+            info["content_hash"] = known["content_hash"]
+            changes["unchanged"].append(key)
+            continue
+        info["content_hash"] = compute_file_hash(info["path"])
+        if info["content_hash"] == known["content_hash"]:
+            changes["touched"].append(key)
+        else:
+            changes["changed"].append(key)
+    changes["deleted"] = sorted(key for key in manifest if key not in files)
+    return changes
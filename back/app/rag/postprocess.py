@@ -0,0 +1,203 @@
+"""
+检索结果后处理模块
+在把分块交给 LLM 之前去重、按 MMR 选出相关且互不重复的分块，并合并同一文件中相邻的分块
+
+全部计算使用向量表中已存储的嵌入（或本地向量索引快照），不额外调用嵌入接口：
+1. 去重：文本相同，或嵌入余弦相似度不低于阈值的分块只保留排名靠前的一个
+2. MMR：score = λ · sim(查询, 分块) − (1 − λ) · max sim(分块, 已选分块)，依次选出 top_k 个
+3. 合并：同一文件中 chunk_index 连续的已选分块拼接为一段，并去掉切分时的重叠文本
+"""
+import hashlib
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+
+# 判断相邻分块重叠时最多比较的字符数（chunk_overlap=50 个 token，约 100~200 个字符）
+MAX_OVERLAP_CHARS = 1000
+
+# 认定为重叠的最短字符数，避免偶然相同的一两个字符被当作重叠
+MIN_OVERLAP_CHARS = 8
+
+
+def _normalize(vector: Sequence[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(array))
+    return array / norm if norm > 0 else array
+
+
+def dedupe_documents(
+    documents: List[Dict[str, Any]],
+    vectors: Dict[str, np.ndarray],
+    threshold: float = 0.95
+) -> List[Dict[str, Any]]:
+    """
+    去除重复分块（保留排名靠前的）
+
+    Args:
+        documents: 按相关度排序的检索结果
+        vectors: {node_id: 归一化嵌入}，缺少嵌入的分块只按文本去重
+        threshold: 认定为重复的余弦相似度
+
+    Returns:
+        List[Dict[str, Any]]: 去重后的结果
+    """
+    kept: List[Dict[str, Any]] = []
+    kept_vectors: List[np.ndarray] = []
+    seen_text = set()
+    for doc in documents:
+        digest = hashlib.blake2b(doc["text"].strip().encode("utf-8"), digest_size=16).digest()
+        if digest in seen_text:
+            continue
+        vector = vectors.get(doc.get("node_id"))
+        if vector is not None and kept_vectors and float(np.max(np.stack(kept_vectors) @ vector)) >= threshold:
+            continue
+        seen_text.add(digest)
+        kept.append(doc)
+        if vector is not None:
+            kept_vectors.append(vector)
+    return kept
+
+
+def mmr_select(
+    query_vector: Optional[np.ndarray],
+    documents: List[Dict[str, Any]],
+    vectors: Dict[str, np.ndarray],
+    top_k: int,
+    lambda_mult: float = 0.7
+) -> List[Dict[str, Any]]:
+    """
+    最大边际相关性选择
+
+    缺少查询向量或分块嵌入时，分块与查询的相似度按排名线性递减估计，与其他分块的相似度视为 0。
+
+    Args:
+        query_vector: 归一化的查询嵌入
+        documents: 按相关度排序的候选结果
+        vectors: {node_id: 归一化嵌入}
+        top_k: 选出的数量
+        lambda_mult: 相关性权重 λ（1 为只看相关性，0 为只看多样性）
+
+    Returns:
+        List[Dict[str, Any]]: 按选中顺序排列的结果
+    """
+    if len(documents) <= 1 or top_k <= 0:
+        return documents[:top_k]
+
+    dim = next((len(v) for v in vectors.values()), 0)
+    has_vector = np.array([doc.get("node_id") in vectors for doc in documents])
+    matrix = np.stack([
+        vectors[doc["node_id"]] if has_vector[i] else np.zeros(dim, dtype=np.float32)
+        for i, doc in enumerate(documents)
+    ]) if dim else np.zeros((len(documents), 0), dtype=np.float32)
+
+    rank_relevance = 1.0 - np.arange(len(documents), dtype=np.float32) / len(documents)
+    if query_vector is not None and dim == len(query_vector):
+        relevance = np.where(has_vector, matrix @ query_vector, rank_relevance)
+    else:
+        relevance = rank_relevance
+    similarity = matrix @ matrix.T if dim else np.zeros((len(documents), len(documents)), dtype=np.float32)
+
+    selected: List[int] = []
+    remaining = list(range(len(documents)))
+    max_similarity = np.zeros(len(documents), dtype=np.float32)
+    while remaining and len(selected) < top_k:
+        scores = lambda_mult * relevance[remaining] - (1 - lambda_mult) * max_similarity[remaining]
+        best = remaining[int(np.argmax(scores))]
+        selected.append(best)
+        remaining.remove(best)
+        max_similarity = np.maximum(max_similarity, similarity[best])
+    return [documents[i] for i in selected]
+
+
+def _join_overlapping(head: str, tail: str) -> str:
+    """拼接相邻分块，去掉 head 结尾与 tail 开头的重叠部分"""
+    limit = min(len(head), len(tail), MAX_OVERLAP_CHARS)
+    for size in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+        if head.endswith(tail[:size]):
+            return head + tail[size:]
+    return f"{head}\n{tail}"
+
+
+def merge_adjacent(documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    合并同一文件中相邻的分块（按 metadata 中的 source_file / filename 和 chunk_index 判断）
+
+    合并后的分块放在其中排名最靠前的分块的位置，merged_node_ids 记录被合并的分块。
+
+    Args:
+        documents: 按选中顺序排列的结果
+
+    Returns:
+        List[Dict[str, Any]]: 合并后的结果
+    """
+    groups: Dict[Any, List[int]] = {}
+    for i, doc in enumerate(documents):
+        metadata = doc.get("metadata") or {}
+        source = metadata.get("source_file") or metadata.get("filename")
+        if source is not None and isinstance(metadata.get("chunk_index"), int):
+            groups.setdefault(source, []).append(i)
+
+    replacements: Dict[int, Dict[str, Any]] = {}
+    absorbed = set()
+    for indices in groups.values():
+        ordered = sorted(indices, key=lambda i: documents[i]["metadata"]["chunk_index"])
+        run = [ordered[0]]
+        for i in ordered[1:] + [None]:
+            if i is not None and (
+                documents[i]["metadata"]["chunk_index"] == documents[run[-1]]["metadata"]["chunk_index"] + 1
+            ):
+                run.append(i)
+                continue
+            if len(run) > 1:
+                text = documents[run[0]]["text"]
+                for j in run[1:]:
+                    text = _join_overlapping(text, documents[j]["text"])
+                anchor = min(run)
+                replacements[anchor] = {
+                    **documents[anchor],
+                    "text": text,
+                    "score": max((documents[j].get("score") or 0.0) for j in run),
+                    "metadata": {**documents[run[0]]["metadata"]},
+                    "merged_node_ids": [documents[j].get("node_id") for j in run],
+                }
+                similarities = [documents[j]["similarity"] for j in run if documents[j].get("similarity") is not None]
+                if similarities:
+                    replacements[anchor]["similarity"] = max(similarities)
+                absorbed.update(j for j in run if j != anchor)
+            run = [i] if i is not None else []
+
+    return [
+        replacements.get(i, doc)
+        for i, doc in enumerate(documents)
+        if i not in absorbed
+    ]
+
+
+def postprocess_documents(
+    query_vector: Optional[Sequence[float]],
+    documents: List[Dict[str, Any]],
+    vectors: Dict[str, Sequence[float]],
+    top_k: int,
+    lambda_mult: float = 0.7,
+    dedupe_threshold: float = 0.95,
+    merge: bool = True
+) -> List[Dict[str, Any]]:
+    """
+    检索结果后处理：去重 → MMR 选择 → 合并相邻分块
+
+    Args:
+        query_vector: 查询嵌入（可为 None）
+        documents: 按相关度排序的候选结果（数量通常大于 top_k）
+        vectors: {node_id: 已存储的嵌入}
+        top_k: 最终返回的分块数（合并后可能更少）
+        lambda_mult: MMR 相关性权重
+        dedupe_threshold: 去重的余弦相似度阈值
+        merge: 是否合并相邻分块
+
+    Returns:
+        List[Dict[str, Any]]: 处理后的结果
+    """
+    normalized = {node_id: _normalize(vector) for node_id, vector in vectors.items() if vector is not None}
+    query = _normalize(query_vector) if query_vector is not None else None
+    documents = dedupe_documents(documents, normalized, dedupe_threshold)
+    documents = mmr_select(query, documents, normalized, top_k, lambda_mult)
+    return merge_adjacent(documents) if merge else documents
@@ -2,12 +2,23 @@
 RAG 服务模块
 提供知识库检索功能
 """
-from typing import List, Dict, Any, Optional
+import asyncio
+from pathlib import PurePosixPath
+from typing import List, Dict, Any, Callable, Iterable, Optional
 from llama_index.core import VectorStoreIndex, Document, Settings
 from llama_index.core.node_parser import SimpleNodeParser
-from sqlalchemy import create_engine
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+from app.clients.response_cache import get_response_cache
 from app.config import settings
-from app.rag.index_loader import get_or_create_index
+from app.db.models import KnowledgeFile
+from app.rag.ann_index import get_ann_index_manager
+from app.rag.index_loader import get_embed_model
+from app.rag.kb_version import KnowledgeBaseVersionTracker
+from app.rag.lexical import alexical_search, ensure_lexical_column, index_nodes, lexical_search, reciprocal_rank_fusion
+from app.rag.local_index import get_local_index
+from app.rag.postprocess import postprocess_documents
+from app.rag.resources import get_rag_resources
 from app.utils.logger import logger
 
 # 尝试不同的导入路径
@@ -38,55 +49,175 @@ class RAGService:
     
     def __init__(self):
         """初始化 RAG 服务"""
-        self.index: Optional[VectorStoreIndex] = None
-        self.table_name = "llama_index_vectors"  # PGVectorStore 会自动添加 data_ 前缀
-        self.embed_dim = 3072  # GeminiEmbedding 实际维度（不是 768）
+        self.resources = get_rag_resources()
+        self.table_name = self.resources.table_name  # PGVectorStore 会自动添加 data_ 前缀
+        self.vector_table_name = f"data_{self.table_name}"
+        self.embed_dim = self.resources.embed_dim  # 由 RAG_EMBED_DIM 配置（完整维度为 3072）
+        # 知识库版本号（各 worker 共享，语义缓存和相同查询合并据此判断旧结果是否失效）
+        self.kb_versions = KnowledgeBaseVersionTracker(
+            self.resources.engine,
+            lambda: self.resources.async_engine,
+            on_change=self._on_kb_version_changed
+        )
     
-    def _ensure_index(self) -> bool:
+    @staticmethod
+    def _on_kb_version_changed(version: int) -> None:
         """
-        确保索引已加载
+        知识库版本号变化（本进程或其他 worker 写入）时失效进程内依赖检索内容的 LLM 响应缓存
+        
+        可能在请求路径上（aget）调用，不访问 Redis；Redis 中的共享缓存由写入方在 mark_knowledge_base_changed 中清除。
+        """
+        get_response_cache().invalidate(shared=False)
+    
+    async def aget_kb_version(self) -> int:
+        """
+        获取当前知识库版本号（进程内缓存 RAG_KB_VERSION_TTL 秒）
         
         Returns:
-            bool: 是否成功加载索引
+            int: 知识库版本号
         """
-        if self.index is None:
-            self.index = get_or_create_index(self.table_name, self.embed_dim)
-        return self.index is not None
+        return await self.kb_versions.aget()
+    
+    def mark_knowledge_base_changed(self, version: Optional[int] = None) -> int:
+        """
+        标记知识库内容已变化
+        
+        所有写入路径（导入、追加、删除、清空）提交后都应调用：先重新导出本地向量索引快照，
+        再递增版本号。写入方应在删除 / 写入分块的事务中调用 self.kb_versions.bump()，
+        提交后传入新版本号；未传入时在单独的事务中递增共享版本号。
+        
+        Args:
+            version: 写入事务中递增得到的版本号
+            
+        Returns:
+            int: 新的知识库版本号
+        """
+        # 本地快照和 Redis 中的响应缓存在各 worker 之间共享，由写入方处理一次即可
+        self.rebuild_local_index()
+        if version is None:
+            version = self.kb_versions.bump_now()
+        else:
+            self.kb_versions.observe(version)
+        get_response_cache().invalidate()
+        return version
+    
+    @property
+    def index(self) -> Optional[VectorStoreIndex]:
+        """当前索引（来自进程级 RAG 资源，重新加载后自动切换）"""
+        resources = self.resources.get()
+        return resources.index if resources else None
     
     def retrieve_documents(
         self,
         query: str,
-        top_k: int = 3
+        top_k: int = 3,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        hybrid: Optional[bool] = None,
+        rerank: Optional[bool] = None
     ) -> List[Dict[str, Any]]:
         """
         检索相关文档
         
+        启用混合检索时，向量检索和词法检索各取 RAG_HYBRID_CANDIDATES 个候选，
+        用 RRF 融合后返回前 top_k 个（score 为融合分数）。
+        启用后处理时，同样先取 RAG_HYBRID_CANDIDATES 个候选，去重、按 MMR 选出 top_k 个并合并相邻分块。
+        启用本地向量索引且快照可用时，向量检索在进程内完成，不访问数据库。
+        
         Args:
             query: 查询文本
             top_k: 返回前 k 个最相关的文档
+            ef_search: HNSW 搜索宽度（越大召回越高、越慢），默认 RAG_HNSW_EF_SEARCH
+            probes: IVFFlat 探测的列表数（越大召回越高、越慢），默认 RAG_IVFFLAT_PROBES
+            hybrid: 是否混合词法检索，默认 RAG_HYBRID_ENABLED
+            rerank: 是否做去重 / MMR / 合并相邻分块，默认 RAG_RERANK_ENABLED
             
         Returns:
             List[Dict[str, Any]]: 检索到的文档列表
         """
         try:
-            if not self._ensure_index():
-                logger.warning("索引未加载，无法检索文档")
-                return []
+            hybrid = settings.RAG_HYBRID_ENABLED if hybrid is None else hybrid
+            rerank = settings.RAG_RERANK_ENABLED if rerank is None else rerank
+            candidates = max(top_k, settings.RAG_HYBRID_CANDIDATES) if hybrid or rerank else top_k
+            keep = candidates if rerank else top_k
             
-            # 创建检索器
-            retriever = self.index.as_retriever(similarity_top_k=top_k)
+            results = self._local_search(query, candidates)
+            if results is None:
+                index = self.index
+                if index is None:
+                    logger.warning("索引未加载，无法检索文档")
+                    return []
+                
+                # 创建检索器（附带 ANN 索引的查询参数）
+                retriever = index.as_retriever(
+                    similarity_top_k=candidates,
+                    vector_store_kwargs=get_ann_index_manager().search_kwargs(candidates, ef_search, probes)
+                )
+                
+                # 检索相关节点
+                results = self._nodes_to_results(retriever.retrieve(query))
             
-            # 检索相关节点
-            nodes = retriever.retrieve(query)
+            if hybrid:
+                try:
+                    lexical = lexical_search(self.resources.engine, self.vector_table_name, query, candidates)
+                except Exception as e:
+                    logger.warning(f"词法检索失败，仅使用向量检索结果: {str(e)}")
+                    lexical = []
+                results = self._fuse_results(results, lexical, keep)
+            if rerank:
+                results = self._postprocess(query, results, top_k)
+            logger.info(f"检索到 {len(results)} 个相关文档")
+            return results
             
-            # 转换为字典格式
-            results = []
-            for node in nodes:
-                results.append({
-                    "text": node.text,
-                    "score": node.score if hasattr(node, 'score') else None,
-                    "metadata": node.metadata if hasattr(node, 'metadata') else {}
-                })
+        except Exception as e:
+            logger.error(f"检索文档失败: {str(e)}")
+            return []
+    
+    async def aretrieve_documents(
+        self,
+        query: str,
+        top_k: int = 3,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        hybrid: Optional[bool] = None,
+        rerank: Optional[bool] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        异步检索相关文档（查询嵌入和向量检索均不阻塞事件循环，混合检索时两路并发执行）
+        
+        Args:
+            query: 查询文本
+            top_k: 返回前 k 个最相关的文档
+            ef_search: HNSW 搜索宽度（越大召回越高、越慢），默认 RAG_HNSW_EF_SEARCH
+            probes: IVFFlat 探测的列表数（越大召回越高、越慢），默认 RAG_IVFFLAT_PROBES
+            hybrid: 是否混合词法检索，默认 RAG_HYBRID_ENABLED
+            rerank: 是否做去重 / MMR / 合并相邻分块，默认 RAG_RERANK_ENABLED
+            
+        Returns:
+            List[Dict[str, Any]]: 检索到的文档列表
+        """
+        try:
+            hybrid = settings.RAG_HYBRID_ENABLED if hybrid is None else hybrid
+            rerank = settings.RAG_RERANK_ENABLED if rerank is None else rerank
+            candidates = max(top_k, settings.RAG_HYBRID_CANDIDATES) if hybrid or rerank else top_k
+            keep = candidates if rerank else top_k
+            
+            if not hybrid:
+                results = await self._adense_search(query, candidates, ef_search, probes)
+            else:
+                dense, lexical = await asyncio.gather(
+                    self._adense_search(query, candidates, ef_search, probes),
+                    alexical_search(self.resources.async_engine, self.vector_table_name, query, candidates),
+                    return_exceptions=True
+                )
+                if isinstance(dense, BaseException):
+                    raise dense
+                if isinstance(lexical, BaseException):
+                    logger.warning(f"词法检索失败，仅使用向量检索结果: {str(lexical)}")
+                    lexical = []
+                results = self._fuse_results(dense, lexical, keep)
+            if rerank:
+                results = await self._apostprocess(query, results, top_k)
             
             logger.info(f"检索到 {len(results)} 个相关文档")
             return results
@@ -95,6 +226,414 @@ class RAGService:
             logger.error(f"检索文档失败: {str(e)}")
             return []
     
+    async def awarm_query_embeddings(self, queries: List[str]) -> int:
+        """
+        批量预先生成查询嵌入
+        
+        未命中嵌入缓存的查询合并为批量请求生成嵌入并写入进程内查询嵌入缓存，
+        随后的检索和语义缓存查询直接命中，不再逐条调用嵌入接口。
+        
+        Args:
+            queries: 查询文本列表
+            
+        Returns:
+            int: 预热的查询数，嵌入模型不可用或失败时返回 0
+        """
+        queries = list(dict.fromkeys(query for query in queries if query))
+        embed_model = get_embed_model()
+        if embed_model is None or not queries:
+            return 0
+        try:
+            await embed_model.aembed_queries(queries)
+            return len(queries)
+        except Exception as e:
+            logger.warning(f"预热查询嵌入失败: {str(e)}")
+            return 0
+    
+    @staticmethod
+    def _local_search(query: str, top_k: int) -> Optional[List[Dict[str, Any]]]:
+        """本地向量索引检索，未启用或快照不可用时返回 None"""
+        local_index = get_local_index()
+        if local_index is None or not local_index.is_ready():
+            return None
+        return local_index.search(get_embed_model().get_query_embedding(query), top_k)
+    
+    async def _adense_search(
+        self,
+        query: str,
+        top_k: int,
+        ef_search: Optional[int],
+        probes: Optional[int]
+    ) -> List[Dict[str, Any]]:
+        """异步向量检索（优先使用本地向量索引，否则查询 pgvector）"""
+        local_index = get_local_index()
+        if local_index is not None and local_index.is_ready():
+            results = local_index.search(await get_embed_model().aget_query_embedding(query), top_k)
+            if results is not None:
+                return results
+        
+        # 首次加载索引涉及同步初始化，放到线程池执行（应用启动时已预热）
+        resources = await asyncio.to_thread(self.resources.get)
+        if resources is None:
+            logger.warning("索引未加载，无法检索文档")
+            return []
+        
+        retriever = resources.index.as_retriever(
+            similarity_top_k=top_k,
+            vector_store_kwargs=get_ann_index_manager().search_kwargs(top_k, ef_search, probes)
+        )
+        return self._nodes_to_results(await retriever.aretrieve(query))
+    
+    def _stored_vectors(self, node_ids: List[str]) -> Dict[str, Any]:
+        """
+        读取候选分块已存储的嵌入（优先本地向量索引快照，否则查询向量表）
+        
+        Args:
+            node_ids: 候选分块 node_id 列表
+            
+        Returns:
+            Dict[str, Any]: {node_id: 嵌入向量}
+        """
+        local_index = get_local_index()
+        if local_index is not None:
+            vectors = local_index.get_vectors(node_ids)
+            if vectors is not None and len(vectors) == len(set(node_ids)):
+                return vectors
+        table = self._create_vector_store()._table_class
+        with self.resources.engine.connect() as conn:
+            rows = conn.execute(
+                select(table.node_id, table.embedding).where(table.node_id.in_(node_ids))
+            ).fetchall()
+        return {
+            node_id: embedding.to_numpy() if hasattr(embedding, "to_numpy") else embedding
+            for node_id, embedding in rows
+        }
+    
+    @staticmethod
+    def _postprocess_settings() -> Dict[str, Any]:
+        """后处理参数（来自配置）"""
+        return {
+            "lambda_mult": settings.RAG_MMR_LAMBDA,
+            "dedupe_threshold": settings.RAG_DEDUP_THRESHOLD,
+            "merge": settings.RAG_MERGE_ADJACENT,
+        }
+    
+    def _postprocess(self, query: str, results: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+        """
+        检索结果后处理（去重 / MMR / 合并相邻分块），失败时退回按相关度截取前 top_k 个
+        
+        查询嵌入来自嵌入缓存（检索时已计算），分块嵌入来自向量表，不额外调用嵌入接口。
+        """
+        if len(results) <= 1:
+            return results[:top_k]
+        try:
+            vectors = self._stored_vectors([doc["node_id"] for doc in results])
+            query_vector = get_embed_model().get_query_embedding(query)
+            return postprocess_documents(query_vector, results, vectors, top_k, **self._postprocess_settings())
+        except Exception as e:
+            logger.warning(f"检索结果后处理失败，按相关度返回: {str(e)}")
+            return results[:top_k]
+    
+    async def _apostprocess(self, query: str, results: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+        """异步检索结果后处理（读取嵌入放到线程池执行）"""
+        if len(results) <= 1:
+            return results[:top_k]
+        try:
+            vectors, query_vector = await asyncio.gather(
+                asyncio.to_thread(self._stored_vectors, [doc["node_id"] for doc in results]),
+                get_embed_model().aget_query_embedding(query)
+            )
+            return postprocess_documents(query_vector, results, vectors, top_k, **self._postprocess_settings())
+        except Exception as e:
+            logger.warning(f"检索结果后处理失败，按相关度返回: {str(e)}")
+            return results[:top_k]
+    
+    @staticmethod
+    def _nodes_to_results(nodes: List[Any]) -> List[Dict[str, Any]]:
+        """将检索节点转换为字典格式"""
+        results = []
+        for node in nodes:
+            results.append({
+                "node_id": node.node_id,
+                "text": node.text,
+                "score": node.score if hasattr(node, 'score') else None,
+                "metadata": node.metadata if hasattr(node, 'metadata') else {}
+            })
+        return results
+    
+    @staticmethod
+    def _fuse_results(
+        dense: List[Dict[str, Any]],
+        lexical: List[Dict[str, Any]],
+        top_k: int
+    ) -> List[Dict[str, Any]]:
+        """
+        用 RRF 融合向量检索和词法检索结果
+        
+        Args:
+            dense: 向量检索结果（按相似度降序）
+            lexical: 词法检索结果（按 ts_rank_cd 降序）
+            top_k: 返回结果数
+            
+        Returns:
+            List[Dict[str, Any]]: 融合后的前 top_k 个结果，score 为 RRF 分数，
+                similarity 为向量检索的相似度（只有词法命中时为 None）
+        """
+        documents = {doc["node_id"]: {**doc, "similarity": None} for doc in lexical}
+        documents.update((doc["node_id"], {**doc, "similarity": doc["score"]}) for doc in dense)
+        fused = reciprocal_rank_fusion(
+            [[doc["node_id"] for doc in dense], [doc["node_id"] for doc in lexical]],
+            k=settings.RAG_RRF_K
+        )
+        return [{**documents[node_id], "score": score} for node_id, score in fused[:top_k]]
+    
+    def _create_vector_store(self, table_name: Optional[str] = None):
+        """
+        获取 PGVectorStore 实例（默认表复用进程级资源，其他表基于共享连接池创建）
+        
+        Args:
+            table_name: 向量表名，如果不提供则使用默认值
+            
+        Returns:
+            PGVectorStore 实例
+        """
+        Settings.embed_model = get_embed_model()
+        if table_name in (None, self.table_name):
+            resources = self.resources.get()
+            if resources is None:
+                raise RuntimeError("RAG 资源初始化失败")
+            return resources.vector_store
+        return self.resources.create_vector_store(table_name)
+    
+    @staticmethod
+    def _parse_and_embed(
+        documents: List[Document],
+        progress: Optional[Callable[..., None]] = None
+    ) -> List[Any]:
+        """
+        将文档解析为节点并批量生成嵌入向量（已缓存的文本不会调用接口）
+        
+        嵌入按"批大小 × 并发数"分段提交，每段完成后上报进度。
+        
+        Args:
+            documents: 文档列表
+            progress: 进度回调 progress(phase, **counters)
+            
+        Returns:
+            List[Any]: 带嵌入向量的节点列表
+        """
+        node_parser = SimpleNodeParser.from_defaults(
+            chunk_size=512,
+            chunk_overlap=50
+        )
+        
+        logger.info("解析文档为节点...")
+        nodes = node_parser.get_nodes_from_documents(documents, show_progress=True)
+        logger.info(f"生成了 {len(nodes)} 个节点")
+        
+        # 记录分块在文件内的顺序（检索后据此合并相邻分块，不参与嵌入）
+        chunk_counters: Dict[str, int] = {}
+        for node in nodes:
+            source = node.metadata.get("source_file") or node.metadata.get("filename") or ""
+            node.metadata["chunk_index"] = chunk_counters.get(source, 0)
+            chunk_counters[source] = node.metadata["chunk_index"] + 1
+            for keys in (node.excluded_embed_metadata_keys, node.excluded_llm_metadata_keys):
+                if "chunk_index" not in keys:
+                    keys.append("chunk_index")
+        
+        pending = [node for node in nodes if getattr(node, 'embedding', None) is None]
+        logger.info(f"生成嵌入向量: {len(pending)} 个节点...")
+        if progress:
+            progress("embedding", nodes_total=len(pending), embeddings_done=0)
+        embed_model = get_embed_model()
+        step = settings.EMBEDDING_BATCH_SIZE * settings.EMBEDDING_MAX_CONCURRENCY
+        for start in range(0, len(pending), step):
+            chunk = pending[start:start + step]
+            embeddings = embed_model.embed_documents([node.text for node in chunk])
+            for node, embedding in zip(chunk, embeddings):
+                node.embedding = embedding
+            if progress:
+                progress("embedding", embeddings_done=start + len(chunk))
+        return nodes
+    
+    @staticmethod
+    def _delete_file_rows(session: Session, table_name: str, source_file: str) -> int:
+        """
+        删除某个文件的全部向量分块
+        
+        兼容增量导入之前写入的数据：没有 source_file 字段时按文件名匹配。
+        
+        Args:
+            session: 数据库会话（由调用方控制事务）
+            table_name: 向量表实际表名
+            source_file: 文件清单中的相对路径
+            
+        Returns:
+            int: 删除的行数
+        """
+        result = session.execute(
+            text(f"""
+                DELETE FROM {table_name}
+                WHERE metadata_->>'source_file' = :source_file
+                   OR (metadata_->>'source_file' IS NULL
+                       AND metadata_->>'filename' = :filename);
+            """),
+            {"source_file": source_file, "filename": PurePosixPath(source_file).name}
+        )
+        return result.rowcount
+    
+    @staticmethod
+    def _upsert_manifest(session: Session, source_file: str, state: Dict[str, Any], chunk_count: int) -> None:
+        """写入或更新文件清单记录"""
+        item = session.query(KnowledgeFile).filter(KnowledgeFile.file_path == source_file).first()
+        if item is None:
+            item = KnowledgeFile(file_path=source_file)
+            session.add(item)
+        item.size = state["size"]
+        item.mtime = state["mtime"]
+        item.content_hash = state["content_hash"]
+        item.chunk_count = chunk_count
+    
+    def sync_files(
+        self,
+        file_documents: Dict[str, List[Document]],
+        file_states: Dict[str, Dict[str, Any]],
+        deleted_files: Iterable[str] = (),
+        touched_files: Iterable[str] = (),
+        progress: Optional[Callable[..., None]] = None
+    ) -> Optional[Dict[str, int]]:
+        """
+        按文件增量同步知识库
+        
+        每个文件在单独的事务中"删除旧分块 + 写入新分块 + 更新清单"，
+        检索方不会看到某个文件只有一半分块的中间状态。
+        
+        Args:
+            file_documents: {相对路径: 该文件解析出的文档}，新增或内容变化的文件
+            file_states: {相对路径: {"size", "mtime", "content_hash"}}
+            deleted_files: 已从磁盘删除、需要移除向量的文件
+            touched_files: 内容未变、只需刷新清单中修改时间的文件
+            progress: 进度回调 progress(phase, **counters)
+            
+        Returns:
+            Optional[Dict[str, int]]: 同步统计，失败返回 None
+        """
+        try:
+            if PGVectorStore is None or GeminiEmbedding is None:
+                logger.error("必要的模块未安装")
+                return None
+            
+            deleted_files = list(deleted_files)
+            touched_files = list(touched_files)
+            vector_store = self._create_vector_store()
+            # 确保向量表已创建（默认表在资源构建时已初始化）
+            vector_store._initialize()
+            table_name = vector_store._table_class.__tablename__
+            self._ensure_manifest_table(table_name)
+            # 词法检索列（已有数据首次同步时回填）
+            ensure_lexical_column(self.resources.engine, table_name)
+            
+            # 所有变化文件的节点一次性批量嵌入
+            documents = [doc for docs in file_documents.values() for doc in docs]
+            nodes = self._parse_and_embed(documents, progress) if documents else []
+            nodes_by_file: Dict[str, List[Any]] = {key: [] for key in file_documents}
+            for node in nodes:
+                nodes_by_file[node.metadata["source_file"]].append(node)
+            
+            summary = {"files_updated": 0, "files_deleted": 0, "chunks_added": 0, "chunks_deleted": 0, "failed": 0}
+            kb_version = None
+            files_total = len(nodes_by_file) + len(deleted_files)
+            if progress:
+                progress("writing", files_total=files_total, files_written=0)
+            for source_file, file_nodes in nodes_by_file.items():
+                try:
+                    with Session(self.resources.engine) as session, session.begin():
+                        summary["chunks_deleted"] += self._delete_file_rows(session, table_name, source_file)
+                        session.add_all(vector_store._node_to_table_row(node) for node in file_nodes)
+                        session.flush()
+                        index_nodes(session, table_name, file_nodes)
+                        self._upsert_manifest(session, source_file, file_states[source_file], len(file_nodes))
+                        kb_version = self.kb_versions.bump(session)
+                    summary["files_updated"] += 1
+                    summary["chunks_added"] += len(file_nodes)
+                except Exception as e:
+                    summary["failed"] += 1
+                    logger.error(f"同步文件 {source_file} 失败: {str(e)}")
+                if progress:
+                    progress("writing", files_written=summary["files_updated"] + summary["failed"])
+            
+            for source_file in deleted_files:
+                try:
+                    with Session(self.resources.engine) as session, session.begin():
+                        summary["chunks_deleted"] += self._delete_file_rows(session, table_name, source_file)
+                        session.query(KnowledgeFile).filter(KnowledgeFile.file_path == source_file).delete()
+                        kb_version = self.kb_versions.bump(session)
+                    summary["files_deleted"] += 1
+                except Exception as e:
+                    summary["failed"] += 1
+                    logger.error(f"删除文件 {source_file} 的向量失败: {str(e)}")
+                if progress:
+                    progress(
+                        "writing",
+                        files_written=summary["files_updated"] + summary["files_deleted"] + summary["failed"]
+                    )
+            
+            if touched_files:
+                with Session(self.resources.engine) as session, session.begin():
+                    for source_file in touched_files:
+                        item = session.query(KnowledgeFile).filter(KnowledgeFile.file_path == source_file).first()
+                        if item is not None:
+                            item.size = file_states[source_file]["size"]
+                            item.mtime = file_states[source_file]["mtime"]
+            
+            if kb_version is not None:
+                # 首次导入后创建 ANN 索引，IVFFlat 在数据量大幅增长后重建
+                index_result = get_ann_index_manager().ensure_index()
+                summary["ann_index"] = index_result["action"]
+                if index_result["action"] not in ("created", "rebuilt"):
+                    # 重建完成后原子切换到新一代向量存储和索引（构建索引时已切换）
+                    self.resources.reload()
+                self.mark_knowledge_base_changed(kb_version)
+            
+            logger.info(f"知识库增量同步完成: {summary}")
+            return summary
+            
+        except Exception as e:
+            logger.error(f"知识库增量同步失败: {str(e)}")
+            return None
+    
+    def _ensure_manifest_table(self, vector_table_name: str) -> None:
+        """创建文件清单表和向量表 source_file 索引（已存在时跳过）"""
+        KnowledgeFile.__table__.create(bind=self.resources.engine, checkfirst=True)
+        with self.resources.engine.begin() as conn:
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {vector_table_name}_source_file_idx "
+                f"ON {vector_table_name} ((metadata_->>'source_file'));"
+            ))
+    
+    def rebuild_local_index(self) -> Optional[int]:
+        """
+        从 pgvector 重新导出本地向量索引快照（未启用本地索引时跳过）
+        
+        Returns:
+            Optional[int]: 导出的分块数，未启用或失败返回 None
+        """
+        local_index = get_local_index()
+        if local_index is None:
+            return None
+        try:
+            table = self._create_vector_store()._table_class
+            statement = select(table.node_id, table.text, table.metadata_, table.embedding)
+            with Session(self.resources.engine) as session:
+                rows = session.execute(statement.execution_options(yield_per=1000))
+                return local_index.build(
+                    (node_id, content, metadata, embedding.to_numpy() if hasattr(embedding, "to_numpy") else embedding)
+                    for node_id, content, metadata, embedding in rows
+                )
+        except Exception as e:
+            logger.error(f"导出本地向量索引失败: {str(e)}")
+            return None
+    
     def update_knowledge_base(
         self,
         documents: List[Document],
@@ -103,6 +642,8 @@ class RAGService:
         """
         更新知识库索引
         
+        直接追加文档节点，不做去重；从目录导入请使用 ingest_documents（按文件清单增量同步）。
+        
         Args:
             documents: 文档列表
             table_name: 向量表名，如果不提供则使用默认值
@@ -120,65 +661,20 @@ class RAGService:
                 logger.error("GeminiEmbedding 未安装，请运行: pip install llama-index-embeddings-gemini")
                 return False
             
-            table_name = table_name or self.table_name
-            
-            # 构建 PostgreSQL 连接 URL
-            connection_string = (
-                f"postgresql://{settings.POSTGRES_USER}:{settings.POSTGRES_PASSWORD}"
-                f"@{settings.POSTGRES_HOST}:{settings.POSTGRES_PORT}/{settings.POSTGRES_DB}"
-            )
-            
-            # 创建数据库引擎
-            engine = create_engine(connection_string)
-            
-            # 配置 Gemini Embedding
-            embed_model = GeminiEmbedding(
-                model_name="models/gemini-embedding-001",
-                api_key=settings.GEMINI_API_KEY
-            )
-            
-            Settings.embed_model = embed_model
-            
             # 创建 PGVectorStore
-            vector_store = PGVectorStore.from_params(
-                database=settings.POSTGRES_DB,
-                host=settings.POSTGRES_HOST,
-                password=settings.POSTGRES_PASSWORD,
-                port=settings.POSTGRES_PORT,
-                user=settings.POSTGRES_USER,
-                table_name=table_name,
-                embed_dim=self.embed_dim
-            )
-            
-            # 创建节点解析器
-            node_parser = SimpleNodeParser.from_defaults(
-                chunk_size=512,
-                chunk_overlap=50
-            )
+            vector_store = self._create_vector_store(table_name)
             
-            # 解析文档为节点
-            logger.info("解析文档为节点...")
-            nodes = node_parser.get_nodes_from_documents(documents, show_progress=True)
-            logger.info(f"生成了 {len(nodes)} 个节点")
-            
-            # 为节点生成嵌入向量
-            logger.info("生成嵌入向量...")
-            for node in nodes:
-                if not hasattr(node, 'embedding') or node.embedding is None:
-                    node.embedding = embed_model.get_text_embedding(node.text)
+            # 解析文档并批量生成嵌入向量
+            nodes = self._parse_and_embed(documents)
             
             # 直接添加到向量存储
             logger.info("添加节点到向量存储...")
             vector_store.add(nodes)
+            # 为新写入的分块建立词法索引
+            ensure_lexical_column(self.resources.engine, vector_store._table_class.__tablename__)
             
-            # 创建索引（用于检索）
-            index = VectorStoreIndex.from_vector_store(
-                vector_store=vector_store,
-                embed_model=embed_model
-            )
-            
-            # 更新实例索引
-            self.index = index
+            # 知识库已变化，重新导出本地快照、递增版本号并失效相关缓存
+            self.mark_knowledge_base_changed()
             
             logger.info(f"成功更新知识库，共 {len(documents)} 个文档，{len(nodes)} 个节点")
             return True
@@ -206,6 +702,20 @@ def retrieve_documents(query: str, top_k: int = 3) -> List[Dict[str, Any]]:
     return rag_service.retrieve_documents(query, top_k)
 
 
+async def aretrieve_documents(query: str, top_k: int = 3) -> List[Dict[str, Any]]:
+    """
+    异步检索相关文档（便捷函数）
+    
+    Args:
+        query: 查询文本
+        top_k: 返回前 k 个最相关的文档
+        
+    Returns:
+        List[Dict[str, Any]]: 检索到的文档列表
+    """
+    return await rag_service.aretrieve_documents(query, top_k)
+
+
 def update_knowledge_base(documents: List[Document]) -> bool:
     """
     更新知识库（便捷函数）
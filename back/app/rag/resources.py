@@ -0,0 +1,221 @@
+"""
+RAG 资源管理模块
+每个进程只持有一套向量库连接、嵌入模型和索引
+
+- 同步引擎复用 app.db.session 的连接池（与订单等业务查询共用）
+- 异步引擎（asyncpg，供检索使用）每个进程只创建一个
+- 向量存储和索引打包为不可变的 RAGResources，重新加载时整体替换，
+  正在执行的检索继续使用旧对象，新请求拿到新对象，不会看到半初始化状态
+"""
+import asyncio
+import threading
+import time
+from typing import Any, Dict, Optional
+from llama_index.core import VectorStoreIndex, Settings
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from app.config import settings
+from app.db.session import engine as db_engine
+from app.rag.index_loader import PGVectorStore, get_embed_model
+from app.utils.logger import logger
+
+# 异步连接 URL（PGVectorStore 检索使用 asyncpg）
+ASYNC_DATABASE_URL = (
+    f"postgresql+asyncpg://{settings.POSTGRES_USER}:{settings.POSTGRES_PASSWORD}"
+    f"@{settings.POSTGRES_HOST}:{settings.POSTGRES_PORT}/{settings.POSTGRES_DB}"
+)
+
+
+class RAGResources:
+    """一代 RAG 资源（创建后不再修改）"""
+
+    def __init__(self, vector_store: Any, index: VectorStoreIndex, generation: int):
+        self.vector_store = vector_store
+        self.index = index
+        self.generation = generation
+        self.created_at = time.time()
+
+
+class RAGResourceManager:
+    """RAG 资源管理器（进程级单例）"""
+
+    def __init__(
+        self,
+        table_name: str = "llama_index_vectors",
+        embed_dim: Optional[int] = None,
+        use_halfvec: Optional[bool] = None
+    ):
+        """
+        初始化资源管理器
+
+        Args:
+            table_name: 向量表名（PGVectorStore 会自动添加 data_ 前缀）
+            embed_dim: 嵌入向量维度，默认 RAG_EMBED_DIM
+            use_halfvec: 是否使用半精度向量列，默认 RAG_USE_HALFVEC
+        """
+        self.table_name = table_name
+        self.embed_dim = embed_dim or settings.RAG_EMBED_DIM
+        self.use_halfvec = settings.RAG_USE_HALFVEC if use_halfvec is None else use_halfvec
+        self.engine = db_engine
+        self._async_engine: Optional[AsyncEngine] = None
+        self._resources: Optional[RAGResources] = None
+        self._generation = 0
+        self._lock = threading.RLock()
+
+    @property
+    def async_engine(self) -> AsyncEngine:
+        """进程级异步引擎（延迟创建）"""
+        if self._async_engine is None:
+            with self._lock:
+                if self._async_engine is None:
+                    self._async_engine = create_async_engine(
+                        ASYNC_DATABASE_URL,
+                        pool_pre_ping=True,
+                        pool_size=settings.RAG_ASYNC_POOL_SIZE,
+                        max_overflow=settings.RAG_ASYNC_MAX_OVERFLOW
+                    )
+        return self._async_engine
+
+    def create_vector_store(
+        self,
+        table_name: Optional[str] = None,
+        embed_dim: Optional[int] = None,
+        **kwargs: Any
+    ):
+        """
+        创建使用共享连接池的 PGVectorStore
+
+        Args:
+            table_name: 向量表名，默认使用管理器的表名
+            embed_dim: 嵌入向量维度，默认使用管理器的维度
+            **kwargs: 传给 PGVectorStore 的其他参数
+
+        Returns:
+            PGVectorStore 实例
+        """
+        if PGVectorStore is None:
+            raise RuntimeError("PGVectorStore 未安装，请运行: pip install llama-index-vector-stores-postgres")
+        kwargs.setdefault("use_halfvec", self.use_halfvec)
+        return PGVectorStore(
+            engine=self.engine,
+            async_engine=self.async_engine,
+            table_name=table_name or self.table_name,
+            embed_dim=embed_dim or self.embed_dim,
+            **kwargs
+        )
+
+    def _build(self) -> RAGResources:
+        """构建新一代资源（向量存储初始化在此完成，首个查询无需再建表或连接）"""
+        embed_model = get_embed_model()
+        if embed_model is None:
+            raise RuntimeError("GeminiEmbedding 未安装，请运行: pip install llama-index-embeddings-gemini")
+        Settings.embed_model = embed_model
+
+        # 初始化失败时抛出异常，避免缓存一个未建表的向量存储
+        vector_store = self.create_vector_store(initialization_fail_on_error=True)
+        # PGVectorStore 默认在首次读写时才建表，这里提前完成
+        vector_store._initialize()
+        if settings.RAG_ANN_INDEX_TYPE.lower() == "hnsw":
+            # PGVectorStore 只在 hnsw_kwargs 非空时才应用查询传入的 hnsw_ef_search；
+            # 初始化完成后再设置，索引本身由 ANNIndexManager 创建和维护
+            vector_store.hnsw_kwargs = {"hnsw_ef_search": settings.RAG_HNSW_EF_SEARCH}
+        index = VectorStoreIndex.from_vector_store(
+            vector_store=vector_store,
+            embed_model=embed_model
+        )
+        self._generation += 1
+        return RAGResources(vector_store, index, self._generation)
+
+    def get(self) -> Optional[RAGResources]:
+        """
+        获取当前资源（首次调用时构建）
+
+        Returns:
+            Optional[RAGResources]: 当前资源，构建失败返回 None
+        """
+        resources = self._resources
+        if resources is not None:
+            return resources
+        with self._lock:
+            if self._resources is None:
+                try:
+                    self._resources = self._build()
+                    logger.info(f"RAG 资源已初始化（第 {self._generation} 代）")
+                except Exception as e:
+                    logger.error(f"初始化 RAG 资源失败: {str(e)}")
+            return self._resources
+
+    def reload(self) -> Optional[RAGResources]:
+        """
+        重新构建资源并原子替换（重建索引或修改向量表配置后调用）
+
+        新资源构建失败时保留旧资源。
+
+        Returns:
+            Optional[RAGResources]: 替换后的资源
+        """
+        with self._lock:
+            try:
+                self._resources = self._build()
+                logger.info(f"RAG 资源已重新加载（第 {self._generation} 代）")
+            except Exception as e:
+                logger.error(f"重新加载 RAG 资源失败，继续使用旧资源: {str(e)}")
+            return self._resources
+
+    async def warm(self) -> bool:
+        """
+        预热：构建资源并建立一条异步连接，避免首个查询承担冷启动开销
+
+        Returns:
+            bool: 是否预热成功
+        """
+        resources = await asyncio.to_thread(self.get)
+        if resources is None:
+            return False
+        try:
+            async with self.async_engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+            return True
+        except Exception as e:
+            logger.warning(f"RAG 异步连接预热失败: {str(e)}")
+            return False
+
+    async def dispose(self) -> None:
+        """关闭异步连接池（应用关闭时调用；同步引擎由 app.db.session 管理）"""
+        if self._async_engine is not None:
+            await self._async_engine.dispose()
+            self._async_engine = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取资源状态
+
+        Returns:
+            Dict[str, Any]: 当前代数、创建时间和连接池占用情况
+        """
+        resources = self._resources
+        stats: Dict[str, Any] = {
+            "generation": resources.generation if resources else 0,
+            "created_at": resources.created_at if resources else None,
+            "sync_pool": {
+                "size": self.engine.pool.size(),
+                "checked_out": self.engine.pool.checkedout(),
+            },
+            "async_pool": None,
+        }
+        if self._async_engine is not None:
+            pool = self._async_engine.sync_engine.pool
+            stats["async_pool"] = {"size": pool.size(), "checked_out": pool.checkedout()}
+        return stats
+
+
+# 全局资源管理器实例（延迟初始化）
+rag_resources = None
+
+
+def get_rag_resources() -> RAGResourceManager:
+    """获取 RAG 资源管理器实例（单例模式）"""
+    global rag_resources
+    if rag_resources is None:
+        rag_resources = RAGResourceManager()
+    return rag_resources
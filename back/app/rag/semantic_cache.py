@@ -0,0 +1,278 @@
+"""
+语义答案缓存模块
+在 RAG 分支前对用户问题做语义匹配，复用已回答过的相似问题的答案
+
+精确匹配缓存（见 app.clients.response_cache）无法命中同义改写，
+例如"多久发货"和"什么时候发货"。语义缓存对问题做向量化，
+在内存中对历史问题做最近邻搜索，相似度超过阈值且知识库版本未变化时直接返回答案。
+
+向量矩阵预分配为固定容量，写满后按最久未访问淘汰；
+知识库版本变化或过期的条目会被优先复用。
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import numpy as np
+from app.config import settings
+from app.utils.logger import logger
+
+# 嵌入函数类型：输入问题文本，返回向量
+EmbedFn = Callable[[str], Awaitable[List[float]]]
+
+# 查询后暂存的向量数量上限（供随后 store 复用，避免重复嵌入）
+PENDING_EMBEDDINGS_LIMIT = 256
+
+
+async def _default_embed(text: str) -> List[float]:
+    """使用 index_loader 中的 Gemini 嵌入模型生成问题向量"""
+    from app.rag.index_loader import get_embed_model
+
+    embed_model = get_embed_model()
+    if embed_model is None:
+        raise RuntimeError("嵌入模型不可用")
+    return await embed_model.aget_query_embedding(text)
+
+
+class SemanticCache:
+    """基于问题向量的语义答案缓存（进程内，容量有界）"""
+
+    def __init__(
+        self,
+        threshold: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        ttl: Optional[int] = None,
+        enabled: Optional[bool] = None,
+        embed_fn: Optional[EmbedFn] = None
+    ):
+        """
+        初始化语义缓存
+
+        Args:
+            threshold: 命中所需的最低余弦相似度
+            max_entries: 最大缓存条目数
+            ttl: 条目有效期（秒），0 表示不过期
+            enabled: 是否启用
+            embed_fn: 异步嵌入函数，默认使用 Gemini 嵌入模型
+        """
+        self.enabled = settings.SEMANTIC_CACHE_ENABLED if enabled is None else enabled
+        self.threshold = settings.SEMANTIC_CACHE_THRESHOLD if threshold is None else threshold
+        self.max_entries = settings.SEMANTIC_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.ttl = settings.SEMANTIC_CACHE_TTL if ttl is None else ttl
+        self.embed_fn = embed_fn or _default_embed
+
+        self._lock = threading.Lock()
+        # 向量矩阵在第一次写入时按维度分配
+        self._vectors: Optional[np.ndarray] = None
+        self._versions = np.full(self.max_entries, -1, dtype=np.int64)
+        self._expires_at = np.zeros(self.max_entries, dtype=np.float64)
+        self._last_access = np.zeros(self.max_entries, dtype=np.float64)
+        self._payloads: List[Optional[Dict[str, Any]]] = [None] * self.max_entries
+        self._size = 0
+        self._pending: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._stats: Dict[str, Any] = {
+            "lookups": 0,
+            "hits": 0,
+            "misses": 0,
+            "stale_skips": 0,
+            "stores": 0,
+            "evictions": 0,
+            "embed_errors": 0,
+        }
+        self._hit_similarity_sum = 0.0
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        """转换为 float32 单位向量"""
+        array = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(array))
+        return array / norm if norm > 0 else array
+
+    @staticmethod
+    def _query_key(query: str) -> str:
+        return " ".join(query.split())
+
+    def _remember_pending(self, key: str, vector: np.ndarray) -> None:
+        """暂存查询向量，供随后写入答案时复用"""
+        with self._lock:
+            self._pending[key] = vector
+            self._pending.move_to_end(key)
+            while len(self._pending) > PENDING_EMBEDDINGS_LIMIT:
+                self._pending.popitem(last=False)
+
+    def _valid_mask(self, kb_version: int, now: float) -> np.ndarray:
+        """当前仍可命中的条目掩码（版本一致且未过期）"""
+        versions = self._versions[:self._size]
+        mask = versions == kb_version
+        if self.ttl > 0:
+            mask &= self._expires_at[:self._size] > now
+        return mask
+
+    async def alookup(self, query: str, kb_version: int) -> Optional[Dict[str, Any]]:
+        """
+        查找语义相似的已回答问题
+
+        Args:
+            query: 用户问题
+            kb_version: 当前知识库版本号
+
+        Returns:
+            Optional[Dict[str, Any]]: 命中时返回
+                {"response", "documents", "matched_query", "similarity"}
+        """
+        if not self.enabled or not query.strip():
+            return None
+
+        key = self._query_key(query)
+        try:
+            vector = self._normalize(await self.embed_fn(query))
+        except Exception as e:
+            with self._lock:
+                self._stats["embed_errors"] += 1
+            logger.warning(f"语义缓存生成问题向量失败: {str(e)}")
+            return None
+        self._remember_pending(key, vector)
+
+        now = time.time()
+        with self._lock:
+            self._stats["lookups"] += 1
+            if self._size == 0 or self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                self._stats["misses"] += 1
+                return None
+
+            similarities = self._vectors[:self._size] @ vector
+            valid = self._valid_mask(kb_version, now)
+            stale_match = bool(np.any(~valid & (similarities >= self.threshold)))
+            similarities = np.where(valid, similarities, -np.inf)
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+
+            if similarity < self.threshold:
+                self._stats["misses"] += 1
+                if stale_match:
+                    self._stats["stale_skips"] += 1
+                return None
+
+            self._last_access[best] = now
+            self._stats["hits"] += 1
+            self._hit_similarity_sum += similarity
+            payload = self._payloads[best]
+
+        logger.info(f"语义缓存命中，相似度 {similarity:.3f}: {query[:50]}")
+        return {
+            "response": payload["response"],
+            "documents": payload["documents"],
+            "matched_query": payload["query"],
+            "similarity": similarity,
+        }
+
+    def _select_slot(self, kb_version: int, now: float) -> int:
+        """选择写入位置：未满时追加，否则优先复用失效条目，再淘汰最久未访问的条目"""
+        if self._size < self.max_entries:
+            self._size += 1
+            return self._size - 1
+        invalid = np.flatnonzero(~self._valid_mask(kb_version, now))
+        if invalid.size:
+            return int(invalid[0])
+        self._stats["evictions"] += 1
+        return int(np.argmin(self._last_access[:self._size]))
+
+    async def astore(
+        self,
+        query: str,
+        response: str,
+        kb_version: int,
+        documents: Optional[List[Dict[str, Any]]] = None
+    ) -> bool:
+        """
+        写入已回答的问题
+
+        优先复用 alookup 时生成的问题向量，没有时重新嵌入。
+
+        Args:
+            query: 用户问题
+            response: 生成的答案
+            kb_version: 生成答案时的知识库版本号
+            documents: 生成答案所依据的检索结果
+
+        Returns:
+            bool: 是否写入成功
+        """
+        if not self.enabled or not query.strip() or not response:
+            return False
+
+        key = self._query_key(query)
+        with self._lock:
+            vector = self._pending.pop(key, None)
+        if vector is None:
+            try:
+                vector = self._normalize(await self.embed_fn(query))
+            except Exception as e:
+                with self._lock:
+                    self._stats["embed_errors"] += 1
+                logger.warning(f"语义缓存生成问题向量失败: {str(e)}")
+                return False
+
+        now = time.time()
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                # 首次写入或嵌入维度变化，重新分配矩阵
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                self._versions.fill(-1)
+                self._payloads = [None] * self.max_entries
+                self._size = 0
+
+            slot = self._select_slot(kb_version, now)
+            self._vectors[slot] = vector
+            self._versions[slot] = kb_version
+            self._expires_at[slot] = now + self.ttl
+            self._last_access[slot] = now
+            self._payloads[slot] = {
+                "query": query,
+                "response": response,
+                "documents": documents or [],
+            }
+            self._stats["stores"] += 1
+        return True
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._versions.fill(-1)
+            self._payloads = [None] * self.max_entries
+            self._size = 0
+            self._pending.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取缓存统计
+
+        Returns:
+            Dict[str, Any]: 查询/命中计数、命中率、命中平均相似度、当前条目数等
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            size = self._size
+            similarity_sum = self._hit_similarity_sum
+        lookups = stats["lookups"]
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "size": size,
+            "max_entries": self.max_entries,
+            "hit_rate": stats["hits"] / lookups if lookups else 0.0,
+            "avg_hit_similarity": similarity_sum / stats["hits"] if stats["hits"] else 0.0,
+            **stats,
+        }
+
+
+# 全局语义缓存实例（延迟初始化）
+semantic_cache = None
+
+
+def get_semantic_cache() -> SemanticCache:
+    """获取语义缓存实例（单例模式）"""
+    global semantic_cache
+    if semantic_cache is None:
+        semantic_cache = SemanticCache()
+    return semantic_cache
@@ -3,11 +3,27 @@
 接入 LangGraph AgentFlow
 """
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from app.agent.graph import process_query
+from typing import List
+from app.agent.graph import process_queries, process_query, stream_query
+from app.agent.intent_classifier import get_intent_classifier
+from app.agent.latency_budget import get_latency_budget_stats
+from app.agent.single_flight import get_single_flight
+from app.agent.speculation import get_speculation_stats
+from app.clients.llm_client import get_llm_client
+from app.clients.prompt_builder import get_prompt_builder
+from app.clients.response_cache import get_response_cache
+from app.rag.embedding_cache import get_embedding_cache
+from app.rag.fast_answer import get_fast_answer_selector
+from app.rag.local_index import get_local_index
+from app.rag.resources import get_rag_resources
+from app.rag.semantic_cache import get_semantic_cache
+from app.config import settings
+from app.db.session import SessionLocal
 from app.deps import get_db
-from app.utils.response import create_response
+from app.utils.response import create_response, format_ndjson_line, format_sse_event
 from app.utils.logger import logger
 
 router = APIRouter()
@@ -17,14 +33,24 @@ class QueryRequest(BaseModel):
     """查询请求模型"""
     query: str
     thread_id: str = "default"
+    budget_ms: int = None  # 延迟预算（毫秒），默认 LATENCY_BUDGET_MS
+
+
+class BatchQueryRequest(BaseModel):
+    """批量查询请求模型"""
+    queries: List[str]
+    concurrency: int = None  # 最大并发数，不超过 QUERY_BATCH_CONCURRENCY
+    budget_ms: int = None  # 每条查询的延迟预算（毫秒），默认 LATENCY_BUDGET_MS
 
 
 class QueryResponse(BaseModel):
     """查询响应模型"""
     response: str
     intent: str = "chat"
+    intent_tier: str = None
     order: dict = None
     documents: list = None
+    degradations: list = None
     error: str = None
 
 
@@ -51,11 +77,12 @@ async def query_endpoint(
     try:
         logger.info(f"收到查询请求: {request.query[:50]}...")
         
-        # 处理查询
-        result = process_query(
+        # 处理查询（异步执行整个工作流）
+        result = await process_query(
             query=request.query,
             db_session=db,
-            thread_id=request.thread_id
+            thread_id=request.thread_id,
+            budget_ms=request.budget_ms
         )
         
         return create_response(
@@ -71,3 +98,124 @@ async def query_endpoint(
             detail=f"查询处理失败: {str(e)}"
         )
 
+
+
+@router.post("/stream")
+async def query_stream_endpoint(request: QueryRequest):
+    """
+    流式查询接口（Server-Sent Events）
+    
+    与主查询接口使用同一个 LangGraph 工作流，按执行进度推送事件：
+    intent → order / documents → token（逐段回答）→ done
+    
+    Args:
+        request: 查询请求
+        
+    Returns:
+        StreamingResponse: text/event-stream 响应
+    """
+    logger.info(f"收到流式查询请求: {request.query[:50]}...")
+    
+    async def event_generator():
+        # 会话生命周期与流一致，不依赖请求级依赖注入的关闭时机
+        db = SessionLocal()
+        try:
+            async for item in stream_query(
+                query=request.query,
+                db_session=db,
+                thread_id=request.thread_id,
+                budget_ms=request.budget_ms
+            ):
+                yield format_sse_event(item["event"], item["data"])
+        finally:
+            db.close()
+    
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+
+@router.post("/batch")
+async def query_batch_endpoint(request: BatchQueryRequest):
+    """
+    批量查询接口（NDJSON）
+    
+    用于离线评估和缓存预热：所有查询以受限并发通过同一个 LangGraph 工作流执行，
+    相同的查询只执行一次，查询嵌入合并为批量请求预先生成。
+    每条查询完成后立即输出一行 JSON：{"index", "query", "response", "intent", ...}，顺序为完成顺序。
+    
+    Args:
+        request: 批量查询请求
+        
+    Returns:
+        StreamingResponse: application/x-ndjson 响应
+    """
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="queries 不能为空")
+    if len(request.queries) > settings.QUERY_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"单次最多 {settings.QUERY_BATCH_MAX_SIZE} 条查询，收到 {len(request.queries)} 条"
+        )
+    
+    concurrency = max(min(request.concurrency or settings.QUERY_BATCH_CONCURRENCY, settings.QUERY_BATCH_CONCURRENCY), 1)
+    logger.info(f"收到批量查询请求: {len(request.queries)} 条，并发 {concurrency}")
+    
+    async def line_generator():
+        # 每条查询使用独立的数据库会话（会话不能跨线程并发使用）
+        async for item in process_queries(
+            request.queries,
+            session_factory=SessionLocal,
+            concurrency=concurrency,
+            budget_ms=request.budget_ms
+        ):
+            yield format_ndjson_line(item)
+    
+    return StreamingResponse(line_generator(), media_type="application/x-ndjson")
+
+
+@router.get("/metrics")
+async def query_metrics():
+    """
+    查询链路运行指标
+    
+    - intent_router: 意图分类各层（rules / model / llm）的命中率和 p50 延迟
+    - llm_cache: LLM 响应缓存的命中/未命中计数和容量
+    - semantic_cache: 语义答案缓存的命中率、命中平均相似度和容量
+    - embedding_cache: 磁盘嵌入缓存的命中率和各维度条目数
+    - rag_resources: RAG 资源当前代数和连接池占用
+    - local_index: 本地向量索引快照信息（未启用时为 {"enabled": false}）
+    - prompt_builder: 回答提示的 token 预算、平均 / 最大 token 数和截断次数
+    - rag_fast_answer: RAG 快速回答的触发率、未触发原因和估算节省的延迟
+    - speculation: 推测检索的使用 / 丢弃次数、平均节省时间和浪费的检索时间
+    - single_flight: 重复查询的合并次数、实际执行次数和合并比例
+    - latency_budget: 延迟预算、降级请求比例、超出预算的请求数和各类降级次数
+    - llm_microbatch: 查询嵌入和意图分类的跨请求微批次数、平均批大小和节省的调用次数
+    
+    Returns:
+        dict: 运行指标
+    """
+    local_index = get_local_index()
+    return create_response(
+        data={
+            "intent_router": get_intent_classifier().get_stats(),
+            "llm_cache": get_response_cache().get_stats(),
+            "semantic_cache": get_semantic_cache().get_stats(),
+            "embedding_cache": get_embedding_cache().get_stats(),
+            "rag_resources": get_rag_resources().get_stats(),
+            "local_index": local_index.get_stats() if local_index else {"enabled": False},
+            "prompt_builder": get_prompt_builder().get_stats(),
+            "rag_fast_answer": get_fast_answer_selector().get_stats(),
+            "speculation": get_speculation_stats().get_stats(),
+            "single_flight": get_single_flight().get_stats(),
+            "latency_budget": get_latency_budget_stats().get_stats(),
+            "llm_microbatch": get_llm_client().get_microbatch_stats()
+        },
+        message="获取指标成功",
+        success=True
+    )
@@ -1,12 +1,14 @@
 """
 RAG 知识库更新路由
 """
+import asyncio
 import os
 from pathlib import Path
 from fastapi import APIRouter, HTTPException, UploadFile, File, Query
 from typing import List, Optional
-from app.rag.rag_service import update_knowledge_base
-from app.rag.ingest import ingest_documents
+from app.rag.rag_service import rag_service, update_knowledge_base
+from app.rag.ann_index import get_ann_index_manager
+from app.rag.jobs import get_ingestion_jobs
 from app.utils.response import create_response
 from app.utils.logger import logger
 
@@ -20,42 +22,129 @@ DATA_DIR.mkdir(exist_ok=True)
 @router.post("/update")
 async def update_rag():
     """
-    更新知识库索引
+    更新知识库索引（后台任务）
     
-    从 data/ 目录加载文档并更新向量索引
+    提交一个增量同步任务后立即返回任务 ID，通过 GET /rag/jobs/{job_id} 查询进度。
+    已有任务运行时，新请求会合并到同一个排队中的后续任务。
     
     Returns:
-        dict: 更新结果
+        dict: 任务信息（job_id、status、phase 等），merged 表示是否并入已有任务
     """
     try:
-        logger.info("开始更新知识库索引...")
+        logger.info("提交知识库更新任务...")
         
-        # 从 data/ 目录加载文档并更新索引
-        success = ingest_documents("data")
+        submitted = get_ingestion_jobs().submit(str(DATA_DIR))
         
-        if success:
-            return create_response(
-                data={"status": "success"},
-                message="知识库更新成功",
-                success=True
-            )
-        else:
-            return create_response(
-                data={"status": "failed"},
-                message="知识库更新失败，请检查日志",
-                success=False,
-                status_code=500,
-                error="更新失败"
-            )
+        return create_response(
+            data={**submitted["job"], "merged": submitted["merged"]},
+            message="知识库更新任务已提交",
+            success=True,
+            status_code=202
+        )
         
     except Exception as e:
-        logger.error(f"知识库更新失败: {str(e)}")
+        logger.error(f"提交知识库更新任务失败: {str(e)}")
         raise HTTPException(
             status_code=500,
             detail=f"知识库更新失败: {str(e)}"
         )
 
 
+@router.get("/jobs")
+async def list_ingestion_jobs():
+    """
+    获取最近的知识库导入任务
+    
+    Returns:
+        dict: 任务列表（新任务在前）
+    """
+    jobs = get_ingestion_jobs().list()
+    return create_response(
+        data={"jobs": jobs},
+        message=f"找到 {len(jobs)} 个任务",
+        success=True
+    )
+
+
+@router.get("/jobs/{job_id}")
+async def get_ingestion_job(job_id: str):
+    """
+    查询知识库导入任务进度
+    
+    返回阶段（queued / scanning / loading / embedding / writing / done）、
+    已处理的文档数和节点数、嵌入速度（embeddings_per_second）和当前阶段预计剩余时间（eta_seconds）。
+    
+    Args:
+        job_id: 任务 ID
+        
+    Returns:
+        dict: 任务信息
+    """
+    job = get_ingestion_jobs().get(job_id)
+    if job is None:
+        return create_response(
+            data=None,
+            message="任务不存在",
+            success=False,
+            status_code=404,
+            error="任务不存在"
+        )
+    return create_response(data=job, message="获取任务成功", success=True)
+
+
+@router.get("/index")
+async def get_vector_index_status():
+    """
+    查询向量近似索引状态
+    
+    返回配置的索引类型、向量列类型和维度、表和索引大小（字节）、索引参数，
+    以及正在构建时来自 pg_stat_progress_create_index 的进度。
+    
+    Returns:
+        dict: 索引状态
+    """
+    try:
+        status = await asyncio.to_thread(get_ann_index_manager().get_status)
+        return create_response(data=status, message="获取索引状态成功", success=True)
+    except Exception as e:
+        logger.error(f"获取向量索引状态失败: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"获取向量索引状态失败: {str(e)}"
+        )
+
+
+@router.post("/index")
+async def build_vector_index(rebuild: bool = Query(False, description="是否强制重建（修改构建参数后使用）")):
+    """
+    在后台构建向量近似索引
+    
+    索引不存在时创建；rebuild=true 时按当前配置重建，构建期间检索继续使用旧索引。
+    通过 GET /rag/index 查询构建进度。
+    
+    Args:
+        rebuild: 是否强制重建
+    
+    Returns:
+        dict: 是否已启动构建
+    """
+    started = get_ann_index_manager().start_build(rebuild=rebuild)
+    if not started:
+        return create_response(
+            data={"started": False},
+            message="索引正在构建",
+            success=False,
+            status_code=409,
+            error="索引正在构建"
+        )
+    return create_response(
+        data={"started": True, "rebuild": rebuild},
+        message="索引构建已开始",
+        success=True,
+        status_code=202
+    )
+
+
 @router.post("/upload")
 async def upload_files(files: List[UploadFile] = File(...)):
     """
@@ -159,7 +248,7 @@ async def upload_files(files: List[UploadFile] = File(...)):
 @router.post("/upload-and-update")
 async def upload_and_update(files: List[UploadFile] = File(...)):
     """
-    上传文件并立即更新知识库
+    上传文件并提交知识库更新任务
     
     支持的文件格式：txt, md, pdf
     
@@ -167,7 +256,7 @@ async def upload_and_update(files: List[UploadFile] = File(...)):
         files: 上传的文件列表
         
     Returns:
-        dict: 上传和更新结果
+        dict: 上传结果和更新任务信息（通过 GET /rag/jobs/{job_id} 查询进度）
     """
     try:
         if not files:
@@ -239,32 +328,20 @@ async def upload_and_update(files: List[UploadFile] = File(...)):
                 error="上传失败"
             )
         
-        # 然后更新知识库
-        logger.info("开始更新知识库索引...")
-        success = ingest_documents(str(DATA_DIR))
+        # 然后提交知识库更新任务
+        submitted = get_ingestion_jobs().submit(str(DATA_DIR))
         
-        if success:
-            return create_response(
-                data={
-                    "uploaded": uploaded_files,
-                    "failed": failed_files,
-                    "index_updated": True
-                },
-                message="文件上传成功，知识库已更新",
-                success=True
-            )
-        else:
-            return create_response(
-                data={
-                    "uploaded": uploaded_files,
-                    "failed": failed_files,
-                    "index_updated": False
-                },
-                message="文件上传成功，但知识库更新失败",
-                success=False,
-                status_code=500,
-                error="知识库更新失败"
-            )
+        return create_response(
+            data={
+                "uploaded": uploaded_files,
+                "failed": failed_files,
+                "job": submitted["job"],
+                "merged": submitted["merged"]
+            },
+            message="文件上传成功，知识库更新任务已提交",
+            success=True,
+            status_code=202
+        )
         
     except Exception as e:
         logger.error(f"上传并更新失败: {str(e)}")
@@ -332,18 +409,11 @@ async def clear_rag(filename: Optional[str] = Query(None, description="要删除
         dict: 删除结果
     """
     try:
-        from sqlalchemy import create_engine, text
-        from app.config import settings
-        import json
-        
-        # 构建 PostgreSQL 连接 URL
-        connection_string = (
-            f"postgresql://{settings.POSTGRES_USER}:{settings.POSTGRES_PASSWORD}"
-            f"@{settings.POSTGRES_HOST}:{settings.POSTGRES_PORT}/{settings.POSTGRES_DB}"
-        )
+        from sqlalchemy import text
+        from app.db.models import KnowledgeFile
         
-        # 创建数据库引擎
-        engine = create_engine(connection_string)
+        # 使用进程级 RAG 资源的共享连接池
+        engine = rag_service.resources.engine
         
         # 向量表名（PGVectorStore 会自动添加 data_ 前缀）
         table_name = "data_llama_index_vectors"
@@ -401,7 +471,17 @@ async def clear_rag(filename: Optional[str] = Query(None, description="要删除
                     {"pattern1": pattern1, "pattern2": pattern2, "filename": filename}
                 )
                 deleted_count = result.rowcount
+                
+                # 同步删除文件清单记录，避免下次增量导入误判为未变化
+                KnowledgeFile.__table__.create(bind=conn, checkfirst=True)
+                conn.execute(
+                    text("DELETE FROM knowledge_files WHERE file_path = :filename OR file_path LIKE :pattern1;"),
+                    {"filename": filename, "pattern1": pattern1}
+                )
+                kb_version = rag_service.kb_versions.bump(conn)
                 conn.commit()
+                # 重新导出本地向量索引快照，避免继续返回已删除的分块
+                await asyncio.to_thread(rag_service.mark_knowledge_base_changed, kb_version)
                 
                 # 同时删除文件（如果存在）
                 file_path = DATA_DIR / filename
@@ -432,7 +512,13 @@ async def clear_rag(filename: Optional[str] = Query(None, description="要删除
                 delete_query = text(f"DELETE FROM {table_name};")
                 result = conn.execute(delete_query)
                 deleted_count = result.rowcount
+                
+                # 清空文件清单，下次更新时重新导入全部文件
+                KnowledgeFile.__table__.create(bind=conn, checkfirst=True)
+                conn.execute(text("DELETE FROM knowledge_files;"))
+                kb_version = rag_service.kb_versions.bump(conn)
                 conn.commit()
+                await asyncio.to_thread(rag_service.mark_knowledge_base_changed, kb_version)
                 
                 logger.info(f"成功清空知识库，删除了 {deleted_count} 条记录")
                 
@@ -1,6 +1,7 @@
 """
 统一响应格式模块
 """
+import json
 from typing import Any, Optional, Dict
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
@@ -49,3 +50,31 @@ def create_response(
         status_code=status_code
     )
 
+
+
+def format_sse_event(event: str, data: Any) -> str:
+    """
+    格式化 Server-Sent Events 事件
+    
+    Args:
+        event: 事件名
+        data: 事件数据（JSON 序列化）
+        
+    Returns:
+        str: SSE 文本帧
+    """
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+def format_ndjson_line(data: Any) -> str:
+    """
+    格式化 NDJSON 行（每行一个 JSON 对象）
+    
+    Args:
+        data: 行数据（JSON 序列化）
+        
+    Returns:
+        str: 以换行结尾的 JSON 文本
+    """
+    return json.dumps(data, ensure_ascii=False, default=str) + "\n"
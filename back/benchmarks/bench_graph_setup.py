@@ -0,0 +1,76 @@
+"""
+工作流图构建开销基准测试
+对比每个请求重新构建图（旧方式）与复用进程级编译图（新方式）的准备耗时
+
+运行方式（在 back/ 目录下）：
+    python -m benchmarks.bench_graph_setup [迭代次数]
+
+说明：只测量请求处理前的准备开销（构建 Agent、StateGraph、checkpoint），
+不调用 Gemini，因此无需配置 API Key。若 Redis 不可用，旧方式中的
+ping 失败耗时同样计入（这正是每个请求原本要付出的代价）。
+"""
+import asyncio
+import statistics
+import sys
+import time
+from typing import Awaitable, Callable, Dict, List
+from app.agent.graph import create_agent_graph, get_agent_graph, reset_agent_graph
+
+
+async def _measure(fn: Callable[[], Awaitable[object]], iterations: int) -> List[float]:
+    """执行 fn 若干次，返回每次耗时（毫秒）"""
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def _summarize(timings: List[float]) -> Dict[str, float]:
+    """计算耗时统计（毫秒）"""
+    ordered = sorted(timings)
+    return {
+        "mean": statistics.fmean(ordered),
+        "p50": ordered[len(ordered) // 2],
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max": ordered[-1],
+    }
+
+
+async def run(iterations: int = 50) -> Dict[str, Dict[str, float]]:
+    """
+    运行基准测试
+    
+    Args:
+        iterations: 每种方式的迭代次数
+        
+    Returns:
+        Dict[str, Dict[str, float]]: 两种方式的耗时统计
+    """
+    # 旧方式：每个请求都调用 create_agent_graph()
+    per_request = await _measure(create_agent_graph, iterations)
+    
+    # 新方式：首次构建后复用进程级编译图
+    reset_agent_graph()
+    cold_start = (await _measure(get_agent_graph, 1))[0]
+    cached = await _measure(get_agent_graph, iterations)
+    
+    results = {
+        "per_request_build": _summarize(per_request),
+        "process_cached": _summarize(cached),
+    }
+    
+    print(f"迭代次数: {iterations}")
+    print(f"{'方式':<20}{'mean(ms)':>12}{'p50(ms)':>12}{'p95(ms)':>12}{'max(ms)':>12}")
+    for name, stats in results.items():
+        print(
+            f"{name:<20}{stats['mean']:>12.3f}{stats['p50']:>12.3f}"
+            f"{stats['p95']:>12.3f}{stats['max']:>12.3f}"
+        )
+    print(f"进程级编译图首次构建耗时: {cold_start:.3f} ms（启动时一次性支付）")
+    return results
+
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 50))
@@ -0,0 +1,142 @@
+"""
+嵌入向量存储迁移脚本
+将已有向量表迁移到 RAG_EMBED_DIM / RAG_USE_HALFVEC 配置的维度和精度
+
+- 目标维度不大于当前维度：在数据库内截断并重新归一化（subvector + l2_normalize，需要 pgvector >= 0.7），
+  与重新调用嵌入接口得到的结果一致，无需重新嵌入
+- 目标维度大于当前维度：截断不可逆，需要加 --reembed，清空向量表和文件清单后重新导入
+  （嵌入缓存保存完整维度向量，已导入过的文本不会再调用嵌入接口）
+
+运行方式（在 back/ 目录下，先在 .env 中设置新的 RAG_EMBED_DIM / RAG_USE_HALFVEC）：
+    python migrate_embeddings.py [--dry-run] [--reembed] [--data-dir data]
+
+ALTER TABLE 会重写整张表并在迁移期间锁表，请在维护窗口执行，完成后重启服务。
+"""
+import argparse
+from typing import Optional, Tuple
+from sqlalchemy import inspect, text
+from app.config import settings
+from app.rag.ann_index import get_ann_index_manager
+from app.rag.rag_service import rag_service
+from app.rag.resources import get_rag_resources
+from app.utils.logger import logger
+
+
+def plan_migration(
+    current: Optional[Tuple[str, int]],
+    target: Tuple[str, int],
+    reembed: bool = False
+) -> str:
+    """
+    确定迁移方式
+
+    Args:
+        current: 当前向量列（类型, 维度），表不存在为 None
+        target: 目标向量列（类型, 维度）
+        reembed: 是否允许清空后重新导入
+
+    Returns:
+        str: none（无需迁移）/ reproject（库内转换）/ reembed（重新导入）
+    """
+    if current is None or current == target:
+        return "none"
+    if reembed:
+        return "reembed"
+    if target[1] <= current[1]:
+        return "reproject"
+    raise ValueError(
+        f"目标维度 {target[1]} 大于当前维度 {current[1]}，无法从已截断的向量恢复，请使用 --reembed 重新导入"
+    )
+
+
+def reproject_sql(table_name: str, current_dim: int, target_type: str, target_dim: int) -> str:
+    """
+    生成库内转换向量列的 SQL
+
+    Args:
+        table_name: 向量表名
+        current_dim: 当前维度
+        target_type: 目标类型（vector / halfvec）
+        target_dim: 目标维度
+
+    Returns:
+        str: ALTER TABLE 语句
+    """
+    expression = "embedding"
+    if target_dim < current_dim:
+        expression = f"l2_normalize(subvector(embedding, 1, {int(target_dim)}))"
+    column = f"{target_type}({int(target_dim)})"
+    return f"ALTER TABLE {table_name} ALTER COLUMN embedding TYPE {column} USING {expression}::{column}"
+
+
+def _table_size(conn, table_name: str) -> int:
+    return conn.execute(
+        text("SELECT coalesce(pg_total_relation_size(to_regclass(:name)), 0)"), {"name": table_name}
+    ).scalar()
+
+
+def migrate_embeddings(dry_run: bool = False, reembed: bool = False, data_dir: str = "data") -> str:
+    """
+    执行迁移
+
+    Args:
+        dry_run: 只打印迁移计划，不修改数据
+        reembed: 允许清空向量表后重新导入
+        data_dir: 重新导入时的文档目录
+
+    Returns:
+        str: 实际采用的迁移方式
+    """
+    resources = get_rag_resources()
+    ann_index = get_ann_index_manager()
+    table_name = ann_index.table_name
+    target = ("halfvec" if settings.RAG_USE_HALFVEC else "vector", settings.RAG_EMBED_DIM)
+
+    with resources.engine.connect() as conn:
+        current = ann_index.column_info(conn)
+        size_before = _table_size(conn, table_name)
+    action = plan_migration(current, target, reembed)
+    logger.info(f"向量列 {current} -> {target}，迁移方式: {action}，当前表大小 {size_before} 字节")
+    if action == "none" or dry_run:
+        if action == "reproject":
+            logger.info(reproject_sql(table_name, current[1], *target))
+        return action
+
+    if action == "reproject":
+        with resources.engine.begin() as conn:
+            # 旧索引的操作符类与新列类型不匹配，先删除，迁移后按新类型重建
+            conn.execute(text(f"DROP INDEX IF EXISTS {ann_index.index_name}"))
+            conn.execute(text(reproject_sql(table_name, current[1], *target)))
+            kb_version = rag_service.kb_versions.bump(conn)
+        with resources.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text(f"VACUUM ANALYZE {table_name}"))
+        resources.reload()
+        logger.info(f"重建向量索引: {ann_index.ensure_index()}")
+        # 所有向量都已改变：按新维度重新导出本地向量索引快照，并让语义缓存等按版本号失效
+        rag_service.mark_knowledge_base_changed(kb_version)
+    else:
+        from app.rag.ingest import sync_directory
+        with resources.engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {table_name}"))
+            if inspect(conn).has_table("knowledge_files"):
+                conn.execute(text("DELETE FROM knowledge_files"))
+        # 重新加载资源时按新的维度和精度建表
+        resources.reload()
+        summary = sync_directory(data_dir)
+        if summary is None:
+            raise RuntimeError("重新导入知识库失败，请检查日志")
+        logger.info(f"重新导入完成: {summary}")
+
+    with resources.engine.connect() as conn:
+        size_after = _table_size(conn, table_name)
+    logger.info(f"迁移完成，表大小 {size_before} -> {size_after} 字节，请重启服务以使用新配置")
+    return action
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="迁移向量表到 RAG_EMBED_DIM / RAG_USE_HALFVEC 配置")
+    parser.add_argument("--dry-run", action="store_true", help="只打印迁移计划")
+    parser.add_argument("--reembed", action="store_true", help="清空向量表和文件清单后重新导入")
+    parser.add_argument("--data-dir", default="data", help="重新导入时的文档目录")
+    args = parser.parse_args()
+    migrate_embeddings(dry_run=args.dry_run, reembed=args.reembed, data_dir=args.data_dir)
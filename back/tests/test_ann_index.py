@@ -0,0 +1,54 @@
+"""
+向量近似索引管理测试
+"""
+import pytest  # type: ignore
+from app.config import settings
+from app.rag.ann_index import ANNIndexManager, build_index_sql, recommended_lists
+
+
+def test_build_index_sql():
+    """测试生成的建索引语句使用余弦距离和对应的向量类型"""
+    sql = build_index_sql(
+        "data_llama_index_vectors", "data_llama_index_vectors_embedding_idx",
+        "hnsw", "halfvec", {"m": 16, "ef_construction": 64}
+    )
+    assert "CONCURRENTLY" in sql
+    assert "USING hnsw (embedding halfvec_cosine_ops)" in sql
+    assert "WITH (m = 16, ef_construction = 64)" in sql
+
+    sql = build_index_sql("t", "t_idx", "ivfflat", "vector", {"lists": 200}, concurrently=False)
+    assert "CONCURRENTLY" not in sql
+    assert "USING ivfflat (embedding vector_cosine_ops) WITH (lists = 200)" in sql
+
+    with pytest.raises(ValueError):
+        build_index_sql("t", "t_idx", "flat", "vector", {})
+
+
+def test_recommended_lists():
+    """测试 IVFFlat lists 推荐值"""
+    assert recommended_lists(0) == 1
+    assert recommended_lists(200_000) == 200
+    assert recommended_lists(4_000_000) == 2000
+
+
+def test_search_kwargs_and_dimension_limit(monkeypatch):
+    """测试查询参数和维度上限检查"""
+    manager = ANNIndexManager(resources=object())
+
+    monkeypatch.setattr(settings, "RAG_ANN_INDEX_TYPE", "hnsw")
+    # ef_search 不能小于 top_k，否则 HNSW 返回的结果不足 top_k 个
+    assert manager.search_kwargs(top_k=100, ef_search=40) == {"hnsw_ef_search": 100}
+    assert manager.search_kwargs(top_k=3)["hnsw_ef_search"] == settings.RAG_HNSW_EF_SEARCH
+    assert manager._unsupported_reason(("vector", 3072)) is not None
+    assert manager._unsupported_reason(("halfvec", 3072)) is None
+
+    monkeypatch.setattr(settings, "RAG_ANN_INDEX_TYPE", "ivfflat")
+    assert manager.search_kwargs(top_k=3, probes=20) == {"ivfflat_probes": 20}
+
+    monkeypatch.setattr(settings, "RAG_ANN_INDEX_TYPE", "none")
+    assert manager.search_kwargs(top_k=3) == {}
+    assert manager._unsupported_reason(("halfvec", 768)) is not None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,148 @@
+"""
+嵌入向量缓存测试
+"""
+import asyncio
+from typing import List
+import pytest  # type: ignore
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from app.clients.llm_client import MicroBatcher
+from app.rag.embedding_cache import CachedEmbedding, EmbeddingCache, project_embedding
+
+
+class CountingEmbedding(BaseEmbedding):
+    """记录调用次数的模拟嵌入模型"""
+
+    calls: List[str] = []
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CountingEmbedding"
+
+    def _vector(self, text: str) -> List[float]:
+        self.calls.append(text)
+        return [float(len(text)), 1.0, 0.5, 0.25]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._vector(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._vector(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._vector(text)
+
+
+def test_put_get_roundtrip_and_persistence(tmp_path):
+    """测试写入后可读取，且新实例可从磁盘加载"""
+    cache = EmbeddingCache(cache_dir=str(tmp_path), dtype="float16", enabled=True)
+    assert cache.get("m", "退货政策") is None
+    assert cache.put_many("m", ["退货政策", "发货时间"], [[0.1, 0.2, 0.3], [0.4, 0.5, 0.6]]) == 2
+    # 重复写入不会追加
+    assert cache.put("m", "退货政策", [0.1, 0.2, 0.3]) == 0
+
+    reloaded = EmbeddingCache(cache_dir=str(tmp_path), dtype="float16", enabled=True)
+    assert reloaded.get("m", "发货时间") == pytest.approx([0.4, 0.5, 0.6], abs=1e-3)
+    # 命名空间（模型）不同则不命中
+    assert reloaded.get("other-model", "发货时间") is None
+    assert reloaded.get_stats()["entries"] == {"3": 2}
+
+
+def test_sees_entries_written_by_another_instance(tmp_path):
+    """测试多个实例（模拟多个 worker）共享缓存目录"""
+    reader = EmbeddingCache(cache_dir=str(tmp_path), dtype="float32", enabled=True)
+    writer = EmbeddingCache(cache_dir=str(tmp_path), dtype="float32", enabled=True)
+    writer.put("m", "a", [1.0, 2.0])
+    reader.get("m", "a")
+    writer.put("m", "b", [3.0, 4.0])
+
+    assert reader.get("m", "b") == [3.0, 4.0]
+
+
+def test_cached_embedding_skips_model_for_unchanged_text(tmp_path):
+    """测试重复导入未变化文本时不再调用嵌入模型"""
+    inner = CountingEmbedding(model_name="counting")
+    inner.calls = []
+    model = CachedEmbedding(inner, cache=EmbeddingCache(cache_dir=str(tmp_path), enabled=True))
+
+    first = model.get_text_embedding_batch(["节点一", "节点二"])
+    calls_after_first = len(inner.calls)
+    second = model.get_text_embedding_batch(["节点一", "节点二"])
+    query = asyncio.run(model.aget_query_embedding("节点一"))
+
+    assert calls_after_first == 2
+    assert len(inner.calls) == 2
+    assert second[1] == pytest.approx(first[1], abs=1e-2)
+    assert query == pytest.approx(first[0], abs=1e-2)
+
+
+def test_output_dim_truncates_and_reuses_full_vectors(tmp_path):
+    """测试降维输出为单位向量，且不同输出维度共用缓存中的完整向量"""
+    inner = CountingEmbedding(model_name="counting")
+    inner.calls = []
+    cache = EmbeddingCache(cache_dir=str(tmp_path), dtype="float32", enabled=True)
+
+    full = CachedEmbedding(inner, cache=cache).get_text_embedding("节点一")
+    reduced = CachedEmbedding(inner, cache=cache, output_dim=2).get_text_embedding("节点一")
+
+    assert len(full) == 4
+    assert len(reduced) == 2
+    assert sum(v * v for v in reduced) == pytest.approx(1.0)
+    assert reduced[0] / reduced[1] == pytest.approx(full[0] / full[1])
+    assert len(inner.calls) == 1
+    assert project_embedding([3.0, 4.0, 5.0], None) == [3.0, 4.0, 5.0]
+
+
+
+def test_concurrent_query_embeddings_are_micro_batched(tmp_path):
+    """测试并发的查询嵌入未命中缓存时经微批合并为一次批量请求"""
+    inner = CountingEmbedding(model_name="counting")
+    inner.calls = []
+    batches = []
+
+    async def embed_batch(texts):
+        batches.append(list(texts))
+        return [[float(len(text)), 1.0, 0.5, 0.25] for text in texts]
+
+    batcher = MicroBatcher("embedding", embed_batch, window_ms=10, max_batch_size=16)
+    model = CachedEmbedding(
+        inner,
+        cache=EmbeddingCache(cache_dir=str(tmp_path), enabled=True),
+        aquery_embed_fn=batcher.submit
+    )
+
+    async def main():
+        return await asyncio.gather(*[model.aget_query_embedding(text) for text in ["退货", "发货时间", "退货"]])
+
+    vectors = asyncio.run(main())
+    assert batches == [["退货", "发货时间"]]
+    assert inner.calls == []
+    assert vectors[0] == vectors[2]
+    # 结果已写入缓存
+    asyncio.run(model.aget_query_embedding("发货时间"))
+    assert len(batches) == 1
+
+
+
+def test_query_embeddings_stay_in_bounded_memory(tmp_path):
+    """测试查询嵌入只写入有容量上限的进程内 LRU，不追加到磁盘文件"""
+    inner = CountingEmbedding(model_name="counting")
+    inner.calls = []
+    cache = EmbeddingCache(cache_dir=str(tmp_path), enabled=True, max_query_entries=2)
+    model = CachedEmbedding(inner, cache=cache)
+
+    for query in ("退货", "发货时间", "退货", "保修政策"):
+        model.get_query_embedding(query)
+    stats = cache.get_stats()
+
+    assert inner.calls == ["退货", "发货时间", "保修政策"]
+    assert stats["entries"] == {} and stats["query_entries"] == 2
+    assert stats["query_evictions"] == 1
+    # 最久未使用的"发货时间"被淘汰，其他进程也看不到查询嵌入
+    assert cache.get(model.namespace, "发货时间") is None
+    assert cache.get(model.namespace, "退货") is not None
+    assert EmbeddingCache(cache_dir=str(tmp_path), enabled=True).get(model.namespace, "退货") is None
+    assert list(tmp_path.glob("*.idx")) == []
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,44 @@
+"""
+RAG 快速回答测试
+"""
+import pytest  # type: ignore
+from app.agent.graph import route_after_rag
+from app.rag.fast_answer import FastAnswerSelector
+
+
+def _doc(node_id, similarity, score=0.03):
+    return {
+        "node_id": node_id,
+        "text": f"{node_id} 的内容",
+        "score": score,
+        "similarity": similarity,
+        "metadata": {"source_file": "faq/退货.md"},
+    }
+
+
+def test_fires_only_when_score_and_margin_are_met():
+    """测试相似度和领先幅度都达到阈值时才直接返回原文"""
+    selector = FastAnswerSelector(min_score=0.85, min_margin=0.1)
+    assert selector.select([_doc("a", 0.80), _doc("b", 0.5)]) is None
+    assert selector.select([_doc("a", 0.90), _doc("b", 0.85)]) is None
+    # 只有词法命中的分块没有相似度，不参与比较
+    selection = selector.select([_doc("b", None), _doc("a", 0.95), _doc("c", 0.70)])
+    assert selection["document"]["node_id"] == "a"
+    assert selector.render(selection) == "a 的内容\n\n来源：退货.md"
+    assert selector.source(selection)["source_file"] == "faq/退货.md"
+
+    stats = selector.get_stats()
+    assert (stats["evaluated"], stats["fired"], stats["below_score"], stats["below_margin"]) == (3, 1, 1, 1)
+    assert stats["estimated_saved_ms"] is None
+    selector.record_generation(1200.0)
+    assert selector.get_stats()["estimated_saved_ms"] == 1200.0
+
+
+def test_rag_response_skips_llm_node():
+    """测试 RAG 节点已有回答时工作流直接结束"""
+    assert route_after_rag({"response": "a 的内容", "rag_fast_answer": {"node_id": "a"}}) == "end"
+    assert route_after_rag({"response": "", "documents": [_doc("a", 0.5)]}) == "llm"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,49 @@
+"""
+Agent 工作流图测试
+"""
+import asyncio
+import pytest  # type: ignore
+from app.agent.graph import build_run_config, get_agent_graph, reset_agent_graph, route_after_order
+from app.agent.order_agent import OrderAgent
+
+
+def test_agent_graph_is_compiled_once():
+    """测试进程内复用同一个编译图"""
+    async def _get_twice():
+        reset_agent_graph()
+        return await get_agent_graph(), await get_agent_graph()
+    
+    first, second = asyncio.run(_get_twice())
+    assert first is second
+
+
+def test_order_agent_reads_session_from_config():
+    """测试 OrderAgent 从运行配置中读取数据库会话"""
+    agent = OrderAgent()
+    
+    # 未提供会话时返回数据库错误
+    result = asyncio.run(
+        agent.process({"input": "订单 ORD-2024-001"}, config=build_run_config())
+    )
+    assert result["order"] is None
+    assert result["error"] == "数据库连接失败"
+
+
+def test_templated_order_answer_ends_graph(monkeypatch):
+    """测试模板模式下订单节点直接给出回答，不再进入 llm 节点"""
+    monkeypatch.setattr("app.agent.order_agent.settings.ORDER_ANSWER_MODE", "template")
+    result = asyncio.run(
+        OrderAgent().process({"input": "订单 ORD-2024-001"}, config=build_run_config())
+    )
+    assert result["response"] == "抱歉，查询订单时出现错误，请稍后再试。"
+    assert route_after_order(result) == "end"
+    
+    monkeypatch.setattr("app.agent.order_agent.settings.ORDER_ANSWER_MODE", "llm")
+    result = asyncio.run(
+        OrderAgent().process({"input": "订单 ORD-2024-001", "response": ""}, config=build_run_config())
+    )
+    assert route_after_order(result) == "llm"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
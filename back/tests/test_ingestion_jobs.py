@@ -0,0 +1,128 @@
+"""
+知识库导入后台任务测试
+"""
+import threading
+import time
+import pytest  # type: ignore
+from fastapi.testclient import TestClient
+from app.main import app
+from app.rag import jobs
+from app.rag.jobs import IngestionJobManager
+
+
+class SharedLock:
+    """模拟多个 worker 共享的 advisory lock"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        return self._lock.acquire(blocking=False)
+
+    def release(self):
+        self._lock.release()
+
+
+def _blocking_runner():
+    """返回一个在 release 之前阻塞的模拟导入函数"""
+    release = threading.Event()
+    started = threading.Event()
+    calls = []
+
+    def runner(data_dir, progress=None):
+        calls.append(data_dir)
+        started.set()
+        progress("embedding", nodes_total=10, embeddings_done=4)
+        release.wait(5)
+        progress("writing", files_total=1, files_written=1)
+        return {"files_updated": 1}
+
+    return runner, release, started, calls
+
+
+def test_requests_during_running_job_are_merged():
+    """测试任务运行期间的请求合并到同一个后续任务"""
+    runner, release, started, calls = _blocking_runner()
+    manager = IngestionJobManager(runner=runner, lock=SharedLock())
+
+    first = manager.submit("data")
+    started.wait(5)
+    running = manager.get(first["job"]["job_id"])
+    second = manager.submit("data")
+    third = manager.submit("data")
+    release.set()
+
+    first_done = manager.wait(first["job"]["job_id"], timeout=5)
+    follow_up = manager.wait(second["job"]["job_id"], timeout=5)
+
+    assert running["status"] == "running"
+    assert running["phase"] == "embedding"
+    assert running["embeddings_done"] == 4 and running["nodes_total"] == 10
+    assert running["eta_seconds"] is not None
+    assert not second["merged"] and third["merged"]
+    assert third["job"]["job_id"] == second["job"]["job_id"]
+    assert follow_up["merged_requests"] == 2
+    assert first_done["status"] == follow_up["status"] == "succeeded"
+    assert follow_up["phase"] == "done"
+    # 只执行了两次导入：当前任务 + 合并后的后续任务
+    assert calls == ["data", "data"]
+
+
+def test_managers_sharing_lock_run_one_at_a_time(monkeypatch):
+    """测试两个 worker 的任务管理器共享导入锁时不会同时导入"""
+    monkeypatch.setattr(jobs, "LOCK_RETRY_INTERVAL", 0.01)
+    runner, release, started, calls = _blocking_runner()
+    lock = SharedLock()
+    first_worker = IngestionJobManager(runner=runner, lock=lock)
+    second_worker = IngestionJobManager(runner=runner, lock=lock)
+
+    first = first_worker.submit("data")
+    started.wait(5)
+    second = second_worker.submit("data")
+    time.sleep(0.1)
+    waiting = second_worker.get(second["job"]["job_id"])
+    calls_while_waiting = list(calls)
+    merged = second_worker.submit("data")
+    release.set()
+
+    assert first_worker.wait(first["job"]["job_id"], timeout=5)["status"] == "succeeded"
+    follow_up = second_worker.wait(second["job"]["job_id"], timeout=5)
+    assert waiting["status"] == "queued" and waiting["phase"] == "waiting"
+    assert calls_while_waiting == ["data"]
+    # 等待锁期间到达的请求并入排队中的任务
+    assert merged["merged"] and follow_up["merged_requests"] == 2
+    assert follow_up["status"] == "succeeded"
+    assert calls == ["data", "data"]
+
+
+def test_failed_job_records_error():
+    """测试导入失败时任务状态为 failed"""
+    manager = IngestionJobManager(runner=lambda data_dir, progress=None: None, lock=SharedLock())
+
+    job = manager.submit("data")["job"]
+    result = manager.wait(job["job_id"], timeout=5)
+
+    assert result["status"] == "failed"
+    assert result["error"]
+
+
+def test_update_endpoint_returns_job_immediately(monkeypatch):
+    """测试 /rag/update 立即返回任务 ID，并可查询进度"""
+    runner, release, started, _ = _blocking_runner()
+    monkeypatch.setattr(jobs, "ingestion_jobs", IngestionJobManager(runner=runner, lock=SharedLock()))
+    client = TestClient(app)
+
+    response = client.post("/rag/update")
+    job_id = response.json()["data"]["job_id"]
+    started.wait(5)
+    status = client.get(f"/rag/jobs/{job_id}")
+    release.set()
+
+    assert response.status_code == 202
+    assert status.status_code == 200
+    assert status.json()["data"]["status"] == "running"
+    assert client.get("/rag/jobs/unknown").status_code == 404
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,97 @@
+"""
+分层意图分类测试
+"""
+import asyncio
+import pytest  # type: ignore
+from app.agent.intent_classifier import TieredIntentClassifier
+
+
+class FakeLLMClient:
+    """记录调用次数的 LLM 客户端替身"""
+    
+    def __init__(self, intent: str = "rag"):
+        self.intent = intent
+        self.calls = 0
+    
+    async def aclassify_intent(self, user_input: str) -> str:
+        self.calls += 1
+        return self.intent
+
+
+def _classifier(threshold: float = 0.75) -> TieredIntentClassifier:
+    return TieredIntentClassifier(threshold=threshold, training_data="", enabled=True)
+
+
+def test_rules_tier_handles_order_id_and_greeting():
+    """测试订单ID和问候语由规则层处理"""
+    classifier = _classifier()
+    
+    assert classifier.classify_fast("订单 ORD-2024-001") == {
+        "intent": "order", "tier": "rules", "confidence": 1.0
+    }
+    assert classifier.classify_fast("你好！")["intent"] == "chat"
+    assert classifier.classify_fast("你好！")["tier"] == "rules"
+
+
+
+@pytest.mark.parametrize("text", [
+    "RTX4090 显卡驱动怎么安装？",
+    "SKU1024 支持保修吗",
+    "型号 AB12345 的说明书",
+    "客服电话 4008123456 几点上班",
+])
+def test_bare_codes_are_not_order_hits(text):
+    """测试商品型号、SKU 和电话号码不被规则层判定为订单"""
+    assert _classifier().classify_rules(text) is None
+
+
+def test_bare_order_id_with_order_keyword():
+    """测试不带前缀的编号和订单关键词同时出现时判定为订单"""
+    classifier = _classifier()
+    assert classifier.classify_rules("订单 ORDER123 到哪了")["intent"] == "order"
+    assert classifier.classify_rules("快递单号 12345678 查一下")["intent"] == "order"
+    assert classifier.classify_rules("ORD-2024-001 什么时候到")["confidence"] == 1.0
+
+def test_model_tier_handles_knowledge_question():
+    """测试常见知识问题由本地模型处理"""
+    classifier = _classifier()
+    result = classifier.classify_fast("怎么退货？")
+    
+    assert result is not None
+    assert result["intent"] == "rag"
+    assert result["tier"] == "model"
+
+
+def test_low_confidence_falls_through_to_llm():
+    """测试低置信度输入交给 LLM，并记录分类层统计"""
+    classifier = _classifier(threshold=1.01)
+    llm = FakeLLMClient(intent="rag")
+    
+    result = asyncio.run(classifier.aclassify("运费谁出", llm))
+    assert result == {"intent": "rag", "tier": "llm", "confidence": None}
+    assert llm.calls == 1
+    
+    # 规则层命中不调用 LLM
+    asyncio.run(classifier.aclassify("你好", llm))
+    assert llm.calls == 1
+    
+    stats = classifier.get_stats()
+    assert stats["total"] == 2
+    assert stats["tiers"]["llm"]["count"] == 1
+    assert stats["tiers"]["rules"]["count"] == 1
+    assert stats["fast_path_hit_rate"] == 0.5
+    assert stats["saved_p50_ms_per_fast_hit"] is not None
+
+
+def test_disabled_fast_path_always_uses_llm():
+    """测试关闭快速通道后全部走 LLM"""
+    classifier = TieredIntentClassifier(training_data="", enabled=False)
+    llm = FakeLLMClient(intent="order")
+    
+    result = asyncio.run(classifier.aclassify("订单 ORD-2024-001", llm))
+    assert result["tier"] == "llm"
+    assert llm.calls == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,81 @@
+"""
+共享知识库版本号测试
+"""
+import asyncio
+import pytest  # type: ignore
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import Session
+from app.rag.kb_version import KnowledgeBaseVersionTracker
+from app.rag.rag_service import rag_service
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return tmp_path / "kb.db"
+
+
+def test_bump_in_writer_transaction_is_seen_by_other_process(db_path):
+    """测试写入事务中递增的版本号对另一个进程的实例可见（模拟两个 worker）"""
+    engine = create_engine(f"sqlite:///{db_path}")
+    changes = []
+    writer = KnowledgeBaseVersionTracker(engine, ttl=60)
+    reader = KnowledgeBaseVersionTracker(engine, ttl=0, on_change=changes.append)
+    assert reader.get() == 0
+
+    with Session(engine) as session, session.begin():
+        version = writer.bump(session)
+    writer.observe(version)
+    assert version == 1 and writer.get() == 1
+    assert reader.get() == 1 and changes == [1]
+
+    # 回滚的写入不改变版本号
+    with pytest.raises(RuntimeError):
+        with engine.begin() as conn:
+            writer.bump(conn)
+            raise RuntimeError("写入失败")
+    assert reader.get() == 1
+
+
+def test_async_read_uses_ttl_cache(db_path):
+    """测试异步读取在缓存有效期内不访问数据库"""
+    engine = create_engine(f"sqlite:///{db_path}")
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    tracker = KnowledgeBaseVersionTracker(engine, lambda: async_engine, ttl=60)
+    assert asyncio.run(tracker.aget()) == 0
+
+    KnowledgeBaseVersionTracker(engine).bump_now()
+    assert asyncio.run(tracker.aget()) == 0
+    tracker.ttl = 0
+    assert asyncio.run(tracker.aget()) == 1
+
+
+def test_falls_back_to_local_version_when_db_unavailable(tmp_path):
+    """测试数据库不可用时沿用并递增进程内版本号"""
+    engine = create_engine(f"sqlite:///{tmp_path}/missing/kb.db")
+    tracker = KnowledgeBaseVersionTracker(engine, ttl=0)
+    assert tracker.get() == 0
+    assert tracker.bump_now() == 1
+    assert tracker.get() == 1
+
+
+
+def test_only_writer_clears_shared_response_cache(monkeypatch):
+    """测试其他 worker 发现版本变化时只清除进程内响应缓存，Redis 由写入方清除"""
+    calls = []
+
+    class FakeResponseCache:
+        def invalidate(self, shared=True):
+            calls.append(shared)
+
+    monkeypatch.setattr("app.rag.rag_service.get_response_cache", lambda: FakeResponseCache())
+    monkeypatch.setattr(rag_service, "rebuild_local_index", lambda: None)
+
+    rag_service.kb_versions.observe(rag_service.kb_versions.cached + 1)
+    assert calls == [False]
+    rag_service.mark_knowledge_base_changed(rag_service.kb_versions.cached + 1)
+    assert calls == [False, False, True]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
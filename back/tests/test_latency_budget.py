@@ -0,0 +1,189 @@
+"""
+延迟预算与降级测试
+"""
+import asyncio
+import time
+import pytest  # type: ignore
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from app.agent import graph as graph_module
+from app.agent.latency_budget import FALLBACK_ANSWER, FALLBACK_DOCUMENT_PREFIX, LatencyBudgetStats, make_deadline, merge_degradations, remaining_ms
+from app.agent.llm_agent import LLMAgent
+from app.agent.order_agent import OrderAgent
+from app.agent.rag_agent import RAGAgent
+from app.config import settings
+from app.db.models import Order
+
+
+def deadline_in(ms):
+    return time.monotonic() + ms / 1000
+
+
+class FakeSemanticCache:
+    async def alookup(self, text, kb_version):
+        return None
+
+
+class FakeLLMClient:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.models = []
+
+    async def agenerate_response(self, model=None, **kwargs):
+        self.models.append(model)
+        await asyncio.sleep(self.delay)
+        return "生成的回答"
+
+
+def test_deadline_helpers(monkeypatch):
+    """测试截止时间计算和降级列表合并"""
+    monkeypatch.setattr(settings, "LATENCY_BUDGET_MS", 0)
+    assert make_deadline() is None
+    assert remaining_ms({"deadline": None}) is None
+    assert 900 < remaining_ms({"deadline": make_deadline(1000)}) <= 1000
+    assert remaining_ms({"deadline": deadline_in(-10)}) == 0.0
+    assert merge_degradations(["skip_retrieval"], ["cheap_model", "skip_retrieval"]) == ["skip_retrieval", "cheap_model"]
+    assert merge_degradations(["skip_retrieval"], []) == []
+
+
+def test_rag_skips_retrieval_when_budget_low(monkeypatch):
+    """测试剩余预算不足时跳过检索"""
+    async def fail(*args, **kwargs):
+        raise AssertionError("不应执行检索")
+
+    monkeypatch.setattr("app.agent.rag_agent.aretrieve_documents", fail)
+    agent = RAGAgent()
+    state = {"input": "退货政策", "deadline": deadline_in(settings.LATENCY_SKIP_RETRIEVAL_MS / 2)}
+    result = asyncio.run(agent.process(state))
+    assert result["documents"] == [] and result["degradations"] == ["skip_retrieval"]
+
+
+def test_rag_abandons_slow_retrieval(monkeypatch):
+    """测试检索超出预算时放弃检索结果"""
+    async def slow(*args, **kwargs):
+        await asyncio.sleep(1)
+        return [{"text": "退货政策"}]
+
+    monkeypatch.setattr(settings, "LATENCY_SKIP_RETRIEVAL_MS", 0)
+    monkeypatch.setattr(settings, "LATENCY_MIN_GENERATION_MS", 0)
+    monkeypatch.setattr("app.agent.rag_agent.aretrieve_documents", slow)
+    agent = RAGAgent()
+    agent.semantic_cache = FakeSemanticCache()
+
+    start = time.perf_counter()
+    result = asyncio.run(agent.process({"input": "退货政策", "deadline": deadline_in(50)}))
+    assert time.perf_counter() - start < 0.5
+    assert result["documents"] == [] and result["degradations"] == ["retrieval_timeout"]
+
+
+def test_order_lookup_uses_thread_owned_session(monkeypatch, tmp_path):
+    """测试订单查询在线程自己的会话中执行，超时后不会留下仍在使用请求会话的线程"""
+    engine = create_engine(f"sqlite:///{tmp_path}/orders.db")
+    Order.__table__.create(engine)
+    with Session(engine) as session, session.begin():
+        session.add(Order(order_id="ORD-2024-001", status="shipped"))
+
+    class RequestSession:
+        def get_bind(self):
+            return engine
+
+        def query(self, *args):
+            raise AssertionError("不应在线程中使用请求会话")
+
+    config = graph_module.build_run_config(db_session=RequestSession())
+    result = asyncio.run(OrderAgent()._lookup({"input": "订单 ORD-2024-001", "deadline": None}, config))
+    assert result["order"]["status"] == "shipped"
+
+    timeouts = []
+
+    def slow_query(bind, order_id, timeout_ms):
+        timeouts.append(timeout_ms)
+        time.sleep(0.3)
+
+    monkeypatch.setattr(settings, "LATENCY_MIN_GENERATION_MS", 0)
+    monkeypatch.setattr("app.agent.order_agent.query_order", slow_query)
+    state = {"input": "订单 ORD-2024-001", "deadline": deadline_in(50)}
+    result = asyncio.run(OrderAgent()._lookup(state, config))
+    assert result["order"] is None and result["degradations"] == ["order_timeout"]
+    # 语句超时取剩余预算
+    assert 0 < timeouts[0] <= 50
+
+
+def test_llm_uses_cheaper_model_when_budget_low(monkeypatch):
+    """测试剩余预算低于阈值时改用更便宜的模型"""
+    monkeypatch.setattr(settings, "LATENCY_CHEAP_MODEL_MS", 4000)
+    monkeypatch.setattr(settings, "LATENCY_MIN_GENERATION_MS", 1000)
+    agent = LLMAgent()
+    agent._llm_client = FakeLLMClient()
+
+    result = asyncio.run(agent.process({"input": "你好", "intent": "chat", "deadline": deadline_in(2000)}))
+    assert result["response"] == "生成的回答"
+    assert agent._llm_client.models == [settings.LLM_FALLBACK_MODEL]
+    assert result["degradations"] == ["cheap_model"]
+
+    result = asyncio.run(agent.process({"input": "你好", "intent": "chat", "deadline": None}))
+    assert agent._llm_client.models[-1] is None and result["degradations"] == []
+
+
+def test_llm_falls_back_without_calling_model(monkeypatch):
+    """测试剩余预算不足以生成时直接返回模板回答"""
+    monkeypatch.setattr(settings, "LATENCY_MIN_GENERATION_MS", 1000)
+    agent = LLMAgent()
+    agent._llm_client = FakeLLMClient()
+    state = {
+        "input": "我的订单到哪了",
+        "intent": "order",
+        "order": {"order_id": "ORD-2024-001", "status": "shipped"},
+        "deadline": deadline_in(100)
+    }
+    result = asyncio.run(agent.process(state))
+    assert agent._llm_client.models == []
+    assert result["response"].startswith("您的订单 ORD-2024-001 当前状态：已发货")
+    assert result["degradations"] == ["fallback_answer"]
+
+
+def test_llm_generation_timeout_returns_best_document(monkeypatch):
+    """测试生成超出预算时返回最相关的检索分块"""
+    monkeypatch.setattr(settings, "LATENCY_CHEAP_MODEL_MS", 0)
+    monkeypatch.setattr(settings, "LATENCY_MIN_GENERATION_MS", 10)
+    agent = LLMAgent()
+    agent._llm_client = FakeLLMClient(delay=1)
+    state = {
+        "input": "怎么退货",
+        "intent": "rag",
+        "documents": [{"text": "七天无理由退货", "metadata": {"source_file": "faq/return.md"}}],
+        "kb_version": 1,
+        "deadline": deadline_in(50)
+    }
+    result = asyncio.run(agent.process(state))
+    assert result["response"].startswith(FALLBACK_DOCUMENT_PREFIX)
+    assert "七天无理由退货" in result["response"] and "来源：return.md" in result["response"]
+    assert result["degradations"] == ["fallback_answer"]
+
+
+def test_process_query_enforces_hard_deadline(monkeypatch):
+    """测试工作流超出预算时取消并返回兜底回答"""
+    class SlowGraph:
+        async def ainvoke(self, state, config=None):
+            await asyncio.sleep(1)
+            return {**state, "response": "太慢了"}
+
+    async def get_graph():
+        return SlowGraph()
+
+    stats = LatencyBudgetStats()
+    monkeypatch.setattr(settings, "LATENCY_BUDGET_GRACE_MS", 0)
+    monkeypatch.setattr(graph_module, "get_agent_graph", get_graph)
+    monkeypatch.setattr(graph_module, "get_latency_budget_stats", lambda: stats)
+
+    start = time.perf_counter()
+    result = asyncio.run(graph_module.process_query("你好", budget_ms=50))
+    assert time.perf_counter() - start < 0.5
+    assert result["response"] == FALLBACK_ANSWER
+    assert result["degradations"] == ["deadline_exceeded"]
+    assert stats.get_stats()["degradations"] == {"deadline_exceeded": 1}
+    assert stats.get_stats()["over_budget"] == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,51 @@
+"""
+词法检索和 RRF 融合测试
+"""
+import pytest  # type: ignore
+from app.rag.lexical import reciprocal_rank_fusion, to_tsquery_literal, to_tsvector_literal, tokenize
+from app.rag.rag_service import RAGService
+
+
+def test_tokenize_chinese_bigrams_and_codes():
+    """测试中文二元组和编号分词"""
+    assert tokenize("退货流程") == ["退货", "货流", "流程"]
+    assert tokenize("买") == ["买"]
+    # 全角编号与半角等价，整体和各部分都保留
+    assert tokenize("型号ＳＫＵ-1024") == ["型号", "sku-1024", "sku", "1024"]
+    assert tokenize("错误码 E0X3F！") == ["错误", "误码", "e0x3f"]
+
+
+def test_tsvector_and_tsquery_literals():
+    """测试 tsvector / tsquery 文本格式（位置合并、引号转义）"""
+    assert to_tsvector_literal(["退货", "货流", "退货"]) == "'退货':1,3 '货流':2"
+    assert to_tsvector_literal(["it's"]) == "'it''s':1"
+    assert to_tsquery_literal(["退货", "货流", "退货"]) == "'退货' | '货流'"
+    assert to_tsquery_literal([]) is None
+
+
+def test_reciprocal_rank_fusion_prefers_documents_in_both_lists():
+    """测试两路都命中的文档排在前面"""
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d"]], k=60)
+    assert fused[0][0] == "c"
+    assert {key for key, _ in fused} == {"a", "b", "c", "d"}
+
+
+def test_fuse_results_keeps_dense_payload_and_limits_top_k():
+    """测试融合结果优先保留向量检索的文档内容，并截断到 top_k"""
+    dense = [
+        {"node_id": "n1", "text": "退货政策", "score": 0.9, "metadata": {"filename": "a.md"}},
+        {"node_id": "n2", "text": "配送说明", "score": 0.8, "metadata": {}},
+    ]
+    lexical = [
+        {"node_id": "n3", "text": "SKU-1024 说明", "score": 0.5, "metadata": {}},
+        {"node_id": "n2", "text": "配送说明", "score": 0.4, "metadata": {}},
+    ]
+
+    results = RAGService._fuse_results(dense, lexical, top_k=2)
+
+    assert [doc["node_id"] for doc in results] == ["n2", "n1"]
+    assert results[1]["metadata"] == {"filename": "a.md"}
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
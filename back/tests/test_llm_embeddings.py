@@ -0,0 +1,101 @@
+"""
+批量嵌入接口测试
+"""
+import asyncio
+import threading
+import pytest  # type: ignore
+from app.clients.llm_client import LLMClient
+from app.config import settings
+
+
+class FakeEmbedding:
+    def __init__(self, values):
+        self.values = values
+
+
+class FakeModels:
+    """模拟 embed_content：记录每次请求的文本数，包含 "坏" 的批次失败"""
+
+    def __init__(self):
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def _embed(self, contents):
+        self.requests.append(len(contents))
+        if len(contents) > 1 and any("坏" in text for text in contents):
+            raise RuntimeError("batch rejected")
+
+        class Response:
+            embeddings = [FakeEmbedding([float(len(text)), 1.0]) for text in contents]
+        return Response()
+
+    def embed_content(self, model, contents, config=None):
+        return self._embed(contents)
+
+
+class FakeAsyncModels(FakeModels):
+    async def embed_content(self, model, contents, config=None):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        return self._embed(contents)
+
+
+def _client(models):
+    class FakeClient:
+        pass
+    client = LLMClient(api_key="test")
+    client.client = FakeClient()
+    client.client.models = models
+    client.client.aio = FakeClient()
+    client.client.aio.models = models
+    return client
+
+
+@pytest.fixture(autouse=True)
+def no_retry_sleep(monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDING_MAX_RETRIES", 0)
+
+
+def test_generate_embeddings_packs_texts_per_request():
+    """测试多条文本打包到一个请求，结果与输入顺序一致"""
+    models = FakeModels()
+    texts = [f"文本{i}" * (i + 1) for i in range(250)]
+
+    embeddings = _client(models).generate_embeddings(texts, batch_size=100)
+
+    assert sorted(models.requests) == [50, 100, 100]
+    assert [e[0] for e in embeddings] == [float(len(t)) for t in texts]
+
+
+def test_agenerate_embeddings_bounds_concurrency():
+    """测试异步批量嵌入的并发批次数受限"""
+    models = FakeAsyncModels()
+    texts = [f"t{i}" for i in range(40)]
+
+    embeddings = asyncio.run(
+        _client(models).agenerate_embeddings(texts, batch_size=4, max_concurrency=3)
+    )
+
+    assert len(models.requests) == 10
+    assert models.max_active == 3
+    assert len(embeddings) == 40
+
+
+def test_failed_batch_is_split_and_retried():
+    """测试失败批次拆分重试，只有坏文本所在的小批次反复失败"""
+    models = FakeModels()
+    texts = ["a", "b", "坏", "d"]
+
+    embeddings = _client(models).generate_embeddings(texts, batch_size=4)
+
+    assert [e[0] for e in embeddings] == [1.0, 1.0, 1.0, 1.0]
+    assert models.requests[0] == 4
+    assert len(models.requests) > 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
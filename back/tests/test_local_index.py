@@ -0,0 +1,71 @@
+"""
+本地向量索引测试
+"""
+import numpy as np
+import pytest  # type: ignore
+from app.rag.local_index import LocalVectorIndex
+from app.rag.rag_service import rag_service
+
+
+def _rows(count: int, dim: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((count, dim)).astype(np.float32)
+    return [(f"node-{i}", f"分块 {i}", {"filename": "a.md"}, vectors[i]) for i in range(count)], vectors
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16", "int8"])
+def test_search_matches_exact_cosine_ranking(tmp_path, dtype):
+    """测试各精度下的检索结果与精确余弦相似度排序一致"""
+    rows, vectors = _rows(200, 32)
+    index = LocalVectorIndex(index_dir=str(tmp_path), dtype=dtype)
+    assert index.search(vectors[0]) is None
+
+    assert index.build(rows) == 200
+    results = index.search(vectors[7] * 3.0, top_k=3)
+
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    expected = np.argsort(-(normalized @ normalized[7]))[:3]
+    assert [doc["node_id"] for doc in results] == [f"node-{i}" for i in expected]
+    assert results[0]["score"] == pytest.approx(1.0, abs=2e-2)
+    assert results[0]["text"] == "分块 7"
+    assert results[0]["metadata"] == {"filename": "a.md"}
+
+
+def test_other_instances_pick_up_new_snapshot(tmp_path):
+    """测试其他进程（实例）导出新快照后，读取方自动切换，旧快照只保留一份"""
+    writer = LocalVectorIndex(index_dir=str(tmp_path))
+    reader = LocalVectorIndex(index_dir=str(tmp_path))
+    first, _ = _rows(10, 8, seed=1)
+    writer.build(first)
+    assert reader.get_stats()["chunks"] == 10
+
+    for count in (20, 30):
+        rows, _ = _rows(count, 8, seed=count)
+        writer.build(rows)
+    assert reader.get_stats()["chunks"] == 30
+    assert len(list(tmp_path.glob("snapshot-*"))) == 2
+
+    # 维度不一致（修改了 RAG_EMBED_DIM 但尚未重新导出）时交给 pgvector
+    assert reader.search([1.0] * 4) is None
+
+
+def test_local_index_get_vectors(tmp_path):
+    """测试从本地向量索引快照读取已存储的嵌入"""
+    index = LocalVectorIndex(index_dir=str(tmp_path), dtype="int8")
+    assert index.get_vectors(["a"]) is None
+    index.build([("a", "x", {}, [3.0, 4.0]), ("b", "y", {}, [0.0, 2.0])])
+    vectors = index.get_vectors(["b", "missing"])
+    assert list(vectors) == ["b"]
+    assert np.allclose(vectors["b"], [0.0, 1.0], atol=0.01)
+
+
+def test_knowledge_base_change_rebuilds_snapshot(monkeypatch):
+    """测试标记知识库变化（包括删除和清空）时先重新导出本地快照再递增版本号"""
+    calls = []
+    monkeypatch.setattr(rag_service, "rebuild_local_index", lambda: calls.append("rebuild"))
+    monkeypatch.setattr(rag_service.kb_versions, "observe", calls.append)
+    assert rag_service.mark_knowledge_base_changed(7) == 7
+    assert calls == ["rebuild", 7]
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,57 @@
+"""
+知识库文件清单测试
+"""
+import os
+import pytest  # type: ignore
+from app.rag.manifest import compute_file_hash, diff_manifest, scan_directory
+
+
+def _manifest_from(files):
+    return {
+        key: {
+            "size": info["size"],
+            "mtime": info["mtime"],
+            "content_hash": compute_file_hash(info["path"]),
+            "chunk_count": 1,
+        }
+        for key, info in files.items()
+    }
+
+
+def test_scan_directory_is_recursive_and_skips_hidden(tmp_path):
+    """测试递归扫描并跳过隐藏文件"""
+    (tmp_path / "faq.md").write_text("退货政策", encoding="utf-8")
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "manual.txt").write_text("使用说明", encoding="utf-8")
+    (tmp_path / ".DS_Store").write_text("x")
+
+    files = scan_directory(str(tmp_path))
+
+    assert sorted(files) == ["faq.md", "sub/manual.txt"]
+
+
+def test_diff_manifest_classifies_changes(tmp_path):
+    """测试新增、变化、删除、未变化和仅修改时间变化的文件分类"""
+    for name in ("same.md", "edited.md", "touched.md", "removed.md"):
+        (tmp_path / name).write_text(f"{name} 原始内容", encoding="utf-8")
+    manifest = _manifest_from(scan_directory(str(tmp_path)))
+
+    (tmp_path / "edited.md").write_text("全新的内容", encoding="utf-8")
+    stat = (tmp_path / "touched.md").stat()
+    os.utime(tmp_path / "touched.md", (stat.st_atime, stat.st_mtime + 10))
+    (tmp_path / "removed.md").unlink()
+    (tmp_path / "new.md").write_text("新文件", encoding="utf-8")
+
+    files = scan_directory(str(tmp_path))
+    changes = diff_manifest(files, manifest)
+
+    assert changes["added"] == ["new.md"]
+    assert changes["changed"] == ["edited.md"]
+    assert changes["deleted"] == ["removed.md"]
+    assert changes["unchanged"] == ["same.md"]
+    assert changes["touched"] == ["touched.md"]
+    assert files["edited.md"]["content_hash"] == compute_file_hash(tmp_path / "edited.md")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,113 @@
+"""
+跨请求微批测试
+"""
+import asyncio
+import json
+import pytest  # type: ignore
+from app.clients.llm_client import LLMClient, MicroBatcher
+from app.clients.response_cache import ResponseCache
+from app.config import settings
+
+
+def test_concurrent_requests_share_one_batch():
+    """测试时间窗口内的并发请求合并为一次调用，相同请求只发送一次"""
+    calls = []
+
+    async def batch_fn(items):
+        calls.append(list(items))
+        return [item.upper() for item in items]
+
+    batcher = MicroBatcher("test", batch_fn, window_ms=10, max_batch_size=10)
+
+    async def main():
+        return await asyncio.gather(*[batcher.submit(item) for item in ["a", "b", "a", "c"]])
+
+    assert asyncio.run(main()) == ["A", "B", "A", "C"]
+    assert calls == [["a", "b", "c"]]
+    stats = batcher.get_stats()
+    assert stats["requests"] == 4 and stats["batches"] == 1
+    assert stats["avg_batch_size"] == 3 and stats["saved_calls"] == 3
+
+
+def test_full_batch_is_sent_without_waiting():
+    """测试凑满 max_batch_size 时立即发送，其余请求等待时间窗口"""
+    calls = []
+
+    async def batch_fn(items):
+        calls.append(len(items))
+        return items
+
+    batcher = MicroBatcher("test", batch_fn, window_ms=20, max_batch_size=3)
+
+    async def main():
+        return await asyncio.gather(*[batcher.submit(i) for i in range(5)])
+
+    assert asyncio.run(main()) == [0, 1, 2, 3, 4]
+    assert calls == [3, 2]
+    assert batcher.get_stats()["size_flushes"] == 1
+
+
+def test_batch_failure_reaches_every_caller():
+    """测试批量调用失败时所有调用方收到异常"""
+    async def batch_fn(items):
+        raise RuntimeError("配额用尽")
+
+    batcher = MicroBatcher("test", batch_fn, window_ms=1, max_batch_size=10)
+
+    async def main():
+        return await asyncio.gather(*[batcher.submit(i) for i in range(3)], return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert batcher.get_stats()["failures"] == 1
+
+
+def _client():
+    cache = ResponseCache(max_entries=16, redis_enabled=False, enabled=True)
+    return LLMClient(api_key="test", cache=cache)
+
+
+def test_concurrent_intent_classifications_use_one_prompt(monkeypatch):
+    """测试并发的意图分类合并为一次多条 JSON 分类调用，结果写入单条分类的缓存"""
+    monkeypatch.setattr(settings, "LLM_MICROBATCH_ENABLED", True)
+    client = _client()
+    prompts = []
+
+    async def fake_generate_text(prompt, system_prompt=None, temperature=0.7, cache_kind="text", **kwargs):
+        prompts.append(prompt)
+        if system_prompt == client.INTENT_BATCH_SYSTEM_PROMPT:
+            return "```json\n" + json.dumps({"intents": ["order", "rag", "chat"]}) + "\n```"
+        return "chat"
+
+    client.agenerate_text = fake_generate_text
+    queries = ["我的快递到哪了", "怎么退货", "你是谁"]
+
+    async def main():
+        return await asyncio.gather(*[client.aclassify_intent(query) for query in queries])
+
+    assert asyncio.run(main()) == ["order", "rag", "chat"]
+    assert len(prompts) == 1 and '1. "我的快递到哪了"' in prompts[0]
+
+    # 之后的单条分类直接命中缓存
+    assert asyncio.run(client.aclassify_intent("怎么退货")) == "rag"
+    assert len(prompts) == 1
+
+
+def test_unparseable_batch_falls_back_to_single_classification():
+    """测试批量分类结果无法解析时逐条分类"""
+    client = _client()
+    prompts = []
+
+    async def fake_generate_text(prompt, system_prompt=None, temperature=0.7, cache_kind="text", **kwargs):
+        prompts.append(prompt)
+        if system_prompt == client.INTENT_BATCH_SYSTEM_PROMPT:
+            return "order, rag"
+        return "rag" if "退货" in prompt else "order"
+
+    client.agenerate_text = fake_generate_text
+    assert asyncio.run(client._aclassify_intent_batch(["ORD 到哪了", "怎么退货"])) == ["order", "rag"]
+    assert len(prompts) == 3
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,98 @@
+"""
+嵌入向量存储迁移测试
+"""
+import pytest  # type: ignore
+import migrate_embeddings
+from app.config import settings
+from app.rag.rag_service import rag_service
+from migrate_embeddings import plan_migration, reproject_sql
+
+
+class FakeResult:
+    def scalar(self):
+        return 0
+
+
+class FakeConn:
+    def __init__(self, log):
+        self.log = log
+
+    def execute(self, statement, params=None):
+        self.log.append(str(statement))
+        return FakeResult()
+
+    def execution_options(self, **kwargs):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeResources:
+    def __init__(self, log):
+        self.log = log
+        self.engine = self
+
+    def begin(self):
+        return FakeConn(self.log)
+
+    def connect(self):
+        return FakeConn(self.log)
+
+    def reload(self):
+        self.log.append("reload")
+
+
+class FakeAnnIndex:
+    table_name = "data_llama_index_vectors"
+    index_name = "data_llama_index_vectors_embedding_idx"
+
+    def column_info(self, conn):
+        return ("vector", 3072)
+
+    def ensure_index(self):
+        return {"action": "created"}
+
+
+def test_plan_migration():
+    """测试迁移方式选择"""
+    assert plan_migration(None, ("halfvec", 768)) == "none"
+    assert plan_migration(("vector", 3072), ("vector", 3072)) == "none"
+    assert plan_migration(("vector", 3072), ("halfvec", 768)) == "reproject"
+    assert plan_migration(("vector", 3072), ("halfvec", 3072)) == "reproject"
+    # 截断不可逆，升维必须重新导入
+    with pytest.raises(ValueError):
+        plan_migration(("vector", 768), ("vector", 1536))
+    assert plan_migration(("vector", 768), ("vector", 1536), reembed=True) == "reembed"
+
+
+def test_reproject_sql():
+    """测试库内转换语句（降维时截断并重新归一化）"""
+    sql = reproject_sql("data_llama_index_vectors", 3072, "halfvec", 768)
+    assert "TYPE halfvec(768)" in sql
+    assert "USING l2_normalize(subvector(embedding, 1, 768))::halfvec(768)" in sql
+
+    sql = reproject_sql("data_llama_index_vectors", 3072, "halfvec", 3072)
+    assert "USING embedding::halfvec(3072)" in sql
+
+
+
+def test_reproject_marks_knowledge_base_changed(monkeypatch):
+    """测试原地降维后递增知识库版本号并按新维度重新导出本地快照"""
+    log = []
+    monkeypatch.setattr(settings, "RAG_EMBED_DIM", 768)
+    monkeypatch.setattr(settings, "RAG_USE_HALFVEC", False)
+    monkeypatch.setattr(migrate_embeddings, "get_rag_resources", lambda: FakeResources(log))
+    monkeypatch.setattr(migrate_embeddings, "get_ann_index_manager", FakeAnnIndex)
+    monkeypatch.setattr(rag_service.kb_versions, "bump", lambda conn: log.append("bump") or 9)
+    monkeypatch.setattr(rag_service, "mark_knowledge_base_changed", lambda version=None: log.append(("changed", version)))
+
+    assert migrate_embeddings.migrate_embeddings() == "reproject"
+    assert log.index("bump") < log.index("reload") < log.index(("changed", 9))
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
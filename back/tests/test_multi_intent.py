@@ -0,0 +1,83 @@
+"""
+多意图并行分支测试
+"""
+import asyncio
+import time
+import pytest  # type: ignore
+from app.agent import graph as graph_module
+from app.agent.graph import build_initial_state, format_result, merge_errors, route_after_router
+from app.agent.intent_classifier import TieredIntentClassifier
+
+
+class FakeRouter:
+    async def process(self, state):
+        return {**state, "intent": "order", "intents": ["order", "rag"], "intent_tier": "rules"}
+
+
+class FakeOrder:
+    async def process(self, state, config=None):
+        await asyncio.sleep(0.2)
+        return {**state, "order": {"order_id": "ORD-2024-001", "status": "shipped"}, "order_id": "ORD-2024-001"}
+
+
+class FakeRAG:
+    async def process(self, state):
+        await asyncio.sleep(0.2)
+        return {**state, "documents": [{"text": "七天无理由退货"}], "kb_version": 1, "error": "词法检索失败"}
+
+
+class FakeLLM:
+    calls = 0
+
+    async def process(self, state, config=None):
+        FakeLLM.calls += 1
+        response = f"{state['order']['status']} / {state['documents'][0]['text']}"
+        return {**state, "response": response}
+
+
+def test_detect_intents_splits_clauses():
+    """测试按分句检测订单和知识库两个意图"""
+    classifier = TieredIntentClassifier(enabled=True)
+    assert classifier.detect_intents("ORD-2024-001 什么时候到，另外怎么退货？", "order") == ["order", "rag"]
+    assert classifier.detect_intents("怎么退货", "rag") == ["rag"]
+    assert classifier.detect_intents("你好，谢谢", "chat") == ["chat"]
+
+
+def test_route_and_error_reducer():
+    """测试同时包含 order 和 rag 时并行路由，error 字段合并"""
+    assert route_after_router({"intent": "order", "intents": ["order", "rag"]}) == ["order", "rag"]
+    assert route_after_router({"intent": "rag", "intents": ["rag"]}) == "rag"
+    assert merge_errors("A", "B") == "A；B"
+    assert merge_errors("A；B", "B") == "A；B"
+    assert merge_errors("A", "") == ""
+
+
+def test_order_and_rag_run_in_parallel_into_one_llm_call(monkeypatch):
+    """测试 order 和 rag 分支并行执行，合并后只调用一次 llm"""
+    monkeypatch.setattr(graph_module, "RouterAgent", FakeRouter)
+    monkeypatch.setattr(graph_module, "OrderAgent", FakeOrder)
+    monkeypatch.setattr(graph_module, "RAGAgent", FakeRAG)
+    monkeypatch.setattr(graph_module, "LLMAgent", FakeLLM)
+
+    async def no_checkpoint():
+        return None
+
+    monkeypatch.setattr(graph_module, "create_checkpoint", no_checkpoint)
+
+    async def run():
+        app = await graph_module.create_agent_graph(speculative=False)
+        start = time.perf_counter()
+        result = await app.ainvoke(build_initial_state("ORD-2024-001 什么时候到，另外怎么退货？"))
+        return result, time.perf_counter() - start
+
+    result, elapsed = asyncio.run(run())
+    assert FakeLLM.calls == 1
+    assert result["response"] == "shipped / 七天无理由退货"
+    assert format_result(result)["intents"] == ["order", "rag"]
+    assert result["error"] == "词法检索失败"
+    # 两个分支各 0.2 秒，并行执行时总耗时接近较慢的分支
+    assert elapsed < 0.35
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,42 @@
+"""
+订单回答模板测试
+"""
+import pytest  # type: ignore
+from app.agent.order_templates import OrderAnswerRenderer
+
+
+def test_render_order_with_email_prompt():
+    """测试订单回答包含状态描述、格式化字段和邮件确认提示"""
+    order = {
+        "order_id": "ORD-2024-001",
+        "status": "Shipped",
+        "product": "无线耳机",
+        "amount": 199,
+        "customer_name": None,
+        "created_at": "2024-05-01T10:30:15",
+    }
+    answer = OrderAnswerRenderer().render(order, email_prompt=True, email_address="a@example.com")
+    assert answer.startswith("您的订单 ORD-2024-001 当前状态：已发货，正在配送途中。")
+    assert "金额：¥199.00" in answer
+    assert "下单时间：2024-05-01 10:30" in answer
+    assert "收件人" not in answer
+    assert "a@example.com" in answer and "确认之前我们不会发送" in answer
+
+
+def test_render_unknown_status_and_custom_labels():
+    """测试未知状态原样展示，状态描述可替换"""
+    renderer = OrderAnswerRenderer(status_text={"pending": "排队中"})
+    assert renderer.describe_status("on_hold") == "on_hold"
+    assert renderer.describe_status("PENDING") == "排队中"
+    assert "邮箱" not in renderer.render({"order_id": "X1", "status": "pending"})
+
+
+def test_render_error_messages():
+    """测试订单不存在、缺少订单号和其他错误的回答"""
+    assert "ORD-404" in OrderAnswerRenderer.render_error("未找到订单 ORD-404", "ORD-404")
+    assert "请提供您的订单号" in OrderAnswerRenderer.render_error("未能识别订单ID，请提供订单号")
+    assert "稍后再试" in OrderAnswerRenderer.render_error("数据库连接失败")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
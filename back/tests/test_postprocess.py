@@ -0,0 +1,62 @@
+"""
+检索结果后处理测试（去重、MMR、合并相邻分块）
+"""
+import numpy as np
+import pytest  # type: ignore
+from app.rag.postprocess import merge_adjacent, mmr_select, postprocess_documents
+
+
+def _doc(node_id, text, chunk_index=None, source="faq.md", score=0.5):
+    metadata = {"source_file": source}
+    if chunk_index is not None:
+        metadata["chunk_index"] = chunk_index
+    return {"node_id": node_id, "text": text, "score": score, "metadata": metadata}
+
+
+def test_dedupe_drops_identical_text_and_near_duplicate_vectors():
+    """测试文本相同或嵌入几乎相同的分块只保留排名靠前的一个"""
+    documents = [_doc("a", "退货政策"), _doc("b", "退货政策 "), _doc("c", "退货说明"), _doc("d", "配送说明")]
+    vectors = {"a": [1.0, 0.0], "b": [0.0, 1.0], "c": [0.99, 0.01], "d": [0.0, 1.0]}
+    results = postprocess_documents([1.0, 0.0], documents, vectors, top_k=4, merge=False)
+    assert [doc["node_id"] for doc in results] == ["a", "d"]
+
+
+def test_mmr_prefers_diverse_documents():
+    """测试 MMR 跳过与已选分块高度相似的候选"""
+    documents = [_doc("a", "x"), _doc("b", "y"), _doc("c", "z")]
+    vectors = {
+        "a": np.array([1.0, 0.0], dtype=np.float32),
+        "b": np.array([0.9, 0.436], dtype=np.float32),
+        "c": np.array([0.6, -0.8], dtype=np.float32),
+    }
+    query = np.array([1.0, 0.0], dtype=np.float32)
+    assert [doc["node_id"] for doc in mmr_select(query, documents, vectors, 2, lambda_mult=0.3)] == ["a", "c"]
+    # λ = 1 时只看相关性
+    assert [doc["node_id"] for doc in mmr_select(query, documents, vectors, 2, lambda_mult=1.0)] == ["a", "b"]
+
+
+def test_mmr_without_vectors_keeps_rank_order():
+    """测试缺少嵌入时按原排名选择"""
+    documents = [_doc("a", "x"), _doc("b", "y"), _doc("c", "z")]
+    assert [doc["node_id"] for doc in mmr_select(None, documents, {}, 2)] == ["a", "b"]
+
+
+def test_merge_adjacent_strips_overlap():
+    """测试同一文件相邻分块合并，并去掉切分时的重叠文本"""
+    documents = [
+        _doc("b", "退货需要在签收后七天内申请。运费由买家承担。", chunk_index=1, score=0.9),
+        _doc("x", "配送说明", chunk_index=0, source="ship.md", score=0.8),
+        _doc("a", "商品支持无理由退货。退货需要在签收后七天内申请。", chunk_index=0, score=0.7),
+        _doc("d", "退款原路返回。", chunk_index=3, score=0.6),
+    ]
+    results = merge_adjacent(documents)
+    assert [doc["node_id"] for doc in results] == ["b", "x", "d"]
+    merged = results[0]
+    assert merged["text"] == "商品支持无理由退货。退货需要在签收后七天内申请。运费由买家承担。"
+    assert merged["merged_node_ids"] == ["a", "b"]
+    assert merged["score"] == 0.9
+    assert merged["metadata"]["chunk_index"] == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
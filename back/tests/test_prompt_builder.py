@@ -0,0 +1,58 @@
+"""
+回答提示 token 预算测试
+"""
+import pytest  # type: ignore
+from app.clients.prompt_builder import PromptBuilder, estimate_tokens, format_order, truncate_to_tokens
+
+
+def test_estimate_tokens_counts_cjk_per_char():
+    """测试中文按字、其余字符按 4 个字符 1 个 token 估算"""
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("退货流程") == 4
+    assert estimate_tokens("refund policy") == 4
+    assert estimate_tokens("退货 policy") == 2 + 2
+
+
+def test_truncate_at_sentence_boundary():
+    """测试按句截断，第一句就放不下时按字符截断"""
+    content = "第一句话。第二句话。第三句话。"
+    assert truncate_to_tokens(content, 100) == (content, False)
+    assert truncate_to_tokens(content, 12) == ("第一句话。第二句话。……", True)
+    text, truncated = truncate_to_tokens("一二三四五六七八九十", 6)
+    assert truncated and text == "一二三四五……"
+
+
+def test_build_prioritizes_order_and_high_score_documents():
+    """测试订单信息优先，检索结果按分数从高到低放入，超出预算的分块被截断或丢弃"""
+    builder = PromptBuilder(token_budget=120, min_chunk_tokens=10)
+    context = {
+        "order": {"order_id": "ORD001", "status": "已发货", "updated_at": None},
+        "documents": [
+            {"text": "低分内容。" * 30, "score": 0.2},
+            {"text": "高分内容：七天无理由退货。", "score": 0.9},
+        ],
+    }
+    prompt, report = builder.build("我的订单到哪了", context)
+    assert "order_id: ORD001" in prompt and "updated_at" not in prompt
+    assert prompt.index("高分内容") < prompt.index("低分内容")
+    assert report["documents_used"] == 2 and report["documents_truncated"] == 1
+    assert report["total_tokens"] <= 120
+    assert set(report["sections"]) == {"question", "instructions", "order", "documents"}
+    assert builder.get_stats()["truncated_builds"] == 1
+
+
+def test_build_without_context_keeps_question():
+    """测试没有上下文时提示只包含问题和指令"""
+    prompt, report = PromptBuilder(token_budget=100).build("你好", None, True, "a@example.com")
+    assert prompt.startswith("你好\n\n重要指令")
+    assert "a@example.com" in prompt
+    assert report["documents_used"] == 0
+
+
+def test_format_order_falls_back_to_str():
+    """测试非字典订单信息的格式化"""
+    assert format_order("ORD001") == "ORD001"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -1,8 +1,10 @@
 """
 查询接口测试
 """
+import asyncio
 import pytest  # type: ignore
 from fastapi.testclient import TestClient
+from app.agent import graph as graph_module
 from app.main import app
 
 client = TestClient(app)
@@ -72,6 +74,87 @@ def test_query_with_rag_intent():
         assert "data" in data
 
 
+class FakeRouter:
+    async def process(self, state):
+        return {**state, "intent": "rag", "intents": ["rag"], "intent_tier": "rules"}
+
+
+class FakeRAG:
+    async def process(self, state):
+        return {**state, "documents": [{"text": "七天无理由退货", "metadata": {}}]}
+
+
+class FakeCachedRAG:
+    async def process(self, state):
+        return {
+            **state,
+            "documents": [{"text": "七天无理由退货", "metadata": {}}],
+            "response": "支持七天无理由退货",
+            "semantic_cache_hit": True
+        }
+
+
+class FakeStreamingClient:
+    def __init__(self, pieces):
+        self.pieces = pieces
+        self.calls = 0
+
+    async def agenerate_response_stream(self, **kwargs):
+        self.calls += 1
+
+        async def chunks():
+            for piece in self.pieces:
+                yield piece
+
+        return chunks()
+
+
+def _collect_stream(monkeypatch, rag_agent, llm_client):
+    """用模拟的路由、检索和 LLM 客户端构建工作流，收集 stream_query 的全部事件"""
+    monkeypatch.setattr(graph_module, "RouterAgent", FakeRouter)
+    monkeypatch.setattr(graph_module, "RAGAgent", rag_agent)
+    monkeypatch.setattr("app.agent.llm_agent.get_llm_client", lambda: llm_client)
+
+    async def no_checkpoint():
+        return None
+
+    monkeypatch.setattr(graph_module, "create_checkpoint", no_checkpoint)
+
+    async def run():
+        app = await graph_module.create_agent_graph(speculative=False)
+
+        async def get_graph():
+            return app
+
+        monkeypatch.setattr(graph_module, "get_agent_graph", get_graph)
+        return [event async for event in graph_module.stream_query("怎么退货", budget_ms=0)]
+
+    return asyncio.run(run())
+
+
+def test_stream_query_pushes_llm_tokens_before_done(monkeypatch):
+    """测试 LLMAgent 的回答片段经 custom 流逐个推送，事件顺序为 intent → documents → token → done"""
+    llm_client = FakeStreamingClient(["七天", "无理由", "退货"])
+    events = _collect_stream(monkeypatch, FakeRAG, llm_client)
+
+    assert [event["event"] for event in events] == ["intent", "documents", "token", "token", "token", "done"]
+    assert [event["data"] for event in events if event["event"] == "token"] == ["七天", "无理由", "退货"]
+    assert events[0]["data"]["intent"] == "rag"
+    assert events[-1]["data"]["response"] == "七天无理由退货"
+    assert llm_client.calls == 1
+
+
+def test_stream_query_sends_cached_answer_as_one_token(monkeypatch):
+    """测试语义缓存命中时不经过 LLM 节点，整段答案作为一个片段推送"""
+    llm_client = FakeStreamingClient(["不应调用"])
+    events = _collect_stream(monkeypatch, FakeCachedRAG, llm_client)
+
+    assert [event["event"] for event in events] == ["intent", "documents", "token", "done"]
+    assert events[2]["data"] == "支持七天无理由退货"
+    assert events[-1]["data"]["response"] == "支持七天无理由退货"
+    assert llm_client.calls == 0
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
 
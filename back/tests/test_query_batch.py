@@ -0,0 +1,84 @@
+"""
+批量查询测试
+"""
+import asyncio
+import json
+import pytest  # type: ignore
+from fastapi.testclient import TestClient
+from app.agent import graph as graph_module
+from app.main import app
+from app.router import query_router
+
+client = TestClient(app)
+
+
+class FakeSession:
+    opened = 0
+    closed = 0
+
+    def __init__(self):
+        FakeSession.opened += 1
+
+    def close(self):
+        FakeSession.closed += 1
+
+
+def test_process_queries_dedupes_and_bounds_concurrency(monkeypatch):
+    """测试相同查询只执行一次、并发受限，结果按完成顺序产出"""
+    calls = []
+    running = {"now": 0, "max": 0}
+    warmed = []
+
+    async def fake_process_query(query, db_session=None, thread_id="default", budget_ms=None):
+        calls.append(query)
+        running["now"] += 1
+        running["max"] = max(running["max"], running["now"])
+        await asyncio.sleep(0.1 if "慢" in query else 0.01)
+        running["now"] -= 1
+        return {"response": f"回答：{query}", "intent": "rag"}
+
+    async def fake_warm(queries):
+        warmed.extend(queries)
+        return len(queries)
+
+    monkeypatch.setattr(graph_module, "process_query", fake_process_query)
+    monkeypatch.setattr(graph_module.rag_service, "awarm_query_embeddings", fake_warm)
+
+    queries = ["慢问题：怎么退货", "退货政策", " 退货政策 ", "查询订单 ORD-2024-001", "运费怎么算"]
+
+    async def collect():
+        return [item async for item in graph_module.process_queries(queries, session_factory=FakeSession, concurrency=2)]
+
+    items = asyncio.run(collect())
+    assert sorted(item["index"] for item in items) == [0, 1, 2, 3, 4]
+    assert len(calls) == 4 and running["max"] <= 2
+    assert items[-1]["index"] == 0
+    assert {item["response"] for item in items if item["index"] in (1, 2)} == {"回答：退货政策"}
+    assert "查询订单 ORD-2024-001" not in warmed and "运费怎么算" in warmed
+    assert FakeSession.opened == FakeSession.closed == 4
+
+
+def test_batch_endpoint_streams_ndjson(monkeypatch):
+    """测试批量查询接口逐行返回 NDJSON"""
+    async def fake_process_queries(queries, session_factory=None, concurrency=None, budget_ms=None):
+        for index in reversed(range(len(queries))):
+            yield {"index": index, "query": queries[index], "response": "好的", "concurrency": concurrency}
+
+    monkeypatch.setattr(query_router, "process_queries", fake_process_queries)
+    response = client.post("/query/batch", json={"queries": ["你好", "怎么退货"], "concurrency": 1000})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["index"] for line in lines] == [1, 0]
+    assert lines[0]["concurrency"] == query_router.settings.QUERY_BATCH_CONCURRENCY
+
+
+def test_batch_endpoint_rejects_empty_and_oversized(monkeypatch):
+    """测试空批量和超出上限的批量被拒绝"""
+    assert client.post("/query/batch", json={"queries": []}).status_code == 400
+    monkeypatch.setattr(query_router.settings, "QUERY_BATCH_MAX_SIZE", 2)
+    assert client.post("/query/batch", json={"queries": ["a", "b", "c"]}).status_code == 400
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,51 @@
+"""
+RAG 资源管理测试
+"""
+import pytest  # type: ignore
+from app.rag.resources import RAGResourceManager, RAGResources
+
+
+class FakeManager(RAGResourceManager):
+    """用计数代替真实向量存储的资源管理器"""
+
+    def __init__(self):
+        super().__init__()
+        self.builds = 0
+        self.fail = False
+
+    def _build(self) -> RAGResources:
+        if self.fail:
+            raise RuntimeError("database unavailable")
+        self.builds += 1
+        self._generation += 1
+        return RAGResources(vector_store=object(), index=object(), generation=self._generation)
+
+
+def test_resources_are_built_once_and_swapped_on_reload():
+    """测试资源只构建一次，重新加载时整体替换"""
+    manager = FakeManager()
+
+    first = manager.get()
+    assert manager.get() is first
+    assert manager.builds == 1
+
+    second = manager.reload()
+    assert second is not first
+    assert manager.get() is second
+    assert second.generation == first.generation + 1
+    # 旧的一代资源保持不变，正在使用它的检索不受影响
+    assert first.generation == 1
+
+
+def test_failed_reload_keeps_previous_resources():
+    """测试重新加载失败时继续使用旧资源"""
+    manager = FakeManager()
+    current = manager.get()
+    manager.fail = True
+
+    assert manager.reload() is current
+    assert manager.get_stats()["generation"] == current.generation
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,111 @@
+"""
+LLM 响应缓存测试
+"""
+import asyncio
+import time
+import pytest  # type: ignore
+from app.clients.llm_client import LLMClient
+from app.clients.response_cache import ResponseCache
+
+
+def _cache(**kwargs) -> ResponseCache:
+    options = {
+        "max_entries": 2,
+        "ttls": {"text": 60, "json": 60, "intent": 60},
+        "redis_enabled": False,
+        "enabled": True,
+    }
+    options.update(kwargs)
+    return ResponseCache(**options)
+
+
+def test_key_depends_on_all_generation_parameters():
+    """测试缓存键包含模型、提示、温度和最大 token 数"""
+    base = ResponseCache.make_key("text", "m", "sys", "怎么退货", 0.7, None)
+    
+    assert base == ResponseCache.make_key("text", "m", "sys", "怎么退货", 0.7, None)
+    assert base != ResponseCache.make_key("text", "m2", "sys", "怎么退货", 0.7, None)
+    assert base != ResponseCache.make_key("text", "m", "sys2", "怎么退货", 0.7, None)
+    assert base != ResponseCache.make_key("text", "m", "sys", "怎么退款", 0.7, None)
+    assert base != ResponseCache.make_key("text", "m", "sys", "怎么退货", 0.3, None)
+    assert base != ResponseCache.make_key("text", "m", "sys", "怎么退货", 0.7, 100)
+    assert base != ResponseCache.make_key("json", "m", "sys", "怎么退货", 0.7, None)
+
+
+def test_lru_eviction_and_ttl():
+    """测试 LRU 淘汰和 TTL 过期"""
+    cache = _cache()
+    cache.set("text", "text:a", "A")
+    cache.set("text", "text:b", "B")
+    assert cache.get("text", "text:a") == "A"  # a 变为最近使用
+    cache.set("text", "text:c", "C")  # 淘汰 b
+    
+    assert cache.get("text", "text:b") is None
+    assert cache.get("text", "text:c") == "C"
+    assert cache.get_stats()["evictions"] == 1
+    
+    expiring = _cache(ttls={"text": 1, "json": 1, "intent": 1})
+    expiring.set("text", "text:x", "X")
+    expiring._entries["text:x"] = (time.time() - 1, "X")
+    assert expiring.get("text", "text:x") is None
+    assert expiring.get_stats()["expirations"] == 1
+
+
+def test_invalidate_only_knowledge_dependent_kinds():
+    """测试知识库失效只清除依赖检索内容的条目"""
+    cache = _cache(max_entries=10)
+    cache.set("text", "text:a", "A")
+    cache.set("json", "json:b", "{}")
+    cache.set("intent", "intent:c", "rag")
+    
+    assert cache.invalidate() == 2
+    assert cache.get("text", "text:a") is None
+    assert cache.get("intent", "intent:c") == "rag"
+
+
+def test_local_invalidation_skips_redis():
+    """测试只清除进程内缓存时不访问 Redis"""
+    cache = _cache(max_entries=10, redis_enabled=True)
+    cache._get_redis = lambda: pytest.fail("不应访问 Redis")
+    cache._memory_set("text:a", "A", 60)
+    
+    assert cache.invalidate(shared=False) == 1
+    assert cache.get_stats()["size"] == 0
+
+
+def test_llm_client_reuses_cached_response():
+    """测试相同请求第二次直接命中缓存，不再调用 Gemini"""
+    calls = []
+    
+    class FakeModels:
+        async def generate_content(self, model, contents, config):
+            calls.append(contents)
+            
+            class Response:
+                text = "7 天内可无理由退货"
+            return Response()
+    
+    class FakeClient:
+        class aio:
+            models = FakeModels()
+    
+    cache = _cache()
+    client = LLMClient(api_key="test", cache=cache)
+    client.client = FakeClient()
+    
+    first = asyncio.run(client.agenerate_text("怎么退货"))
+    second = asyncio.run(client.agenerate_text("怎么退货"))
+    
+    assert first == second == "7 天内可无理由退货"
+    assert len(calls) == 1
+    stats = cache.get_stats()
+    assert stats["memory_hits"] == 1
+    assert stats["misses"] == 1
+    
+    # 不缓存的调用类型每次都请求
+    asyncio.run(client.agenerate_text("怎么退货", cache_kind=None))
+    assert len(calls) == 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
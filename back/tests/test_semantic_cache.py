@@ -0,0 +1,98 @@
+"""
+语义答案缓存测试
+"""
+import asyncio
+import pytest  # type: ignore
+from app.agent.graph import route_after_rag
+from app.rag.semantic_cache import SemanticCache
+
+# 模拟嵌入：同义问题映射到相近的向量
+VECTORS = {
+    "多久发货": [1.0, 0.0, 0.0],
+    "什么时候发货": [0.98, 0.2, 0.0],
+    "怎么退货": [0.0, 1.0, 0.0],
+    "运费多少": [0.0, 0.0, 1.0],
+}
+
+
+def _cache(**kwargs) -> SemanticCache:
+    calls = []
+
+    async def embed(text):
+        calls.append(text)
+        return VECTORS[text]
+
+    options = {"threshold": 0.9, "max_entries": 2, "ttl": 60, "enabled": True, "embed_fn": embed}
+    options.update(kwargs)
+    cache = SemanticCache(**options)
+    cache.embed_calls = calls
+    return cache
+
+
+def test_paraphrase_hits_and_unrelated_misses():
+    """测试同义改写命中、无关问题未命中"""
+    async def run():
+        cache = _cache()
+        assert await cache.alookup("多久发货", kb_version=0) is None
+        await cache.astore("多久发货", "下单后 48 小时内发货", kb_version=0, documents=[{"text": "发货说明"}])
+
+        hit = await cache.alookup("什么时候发货", kb_version=0)
+        miss = await cache.alookup("怎么退货", kb_version=0)
+        return cache, hit, miss
+
+    cache, hit, miss = asyncio.run(run())
+
+    assert hit["response"] == "下单后 48 小时内发货"
+    assert hit["matched_query"] == "多久发货"
+    assert hit["similarity"] > 0.9
+    assert hit["documents"] == [{"text": "发货说明"}]
+    assert miss is None
+    # store 复用了 lookup 时的向量，没有重复嵌入
+    assert cache.embed_calls.count("多久发货") == 1
+    stats = cache.get_stats()
+    assert stats["hits"] == 1 and stats["misses"] == 2
+
+
+def test_knowledge_base_version_change_invalidates():
+    """测试知识库版本变化后旧答案不再命中"""
+    async def run():
+        cache = _cache()
+        await cache.astore("多久发货", "旧答案", kb_version=0)
+        return await cache.alookup("什么时候发货", kb_version=1), cache
+
+    hit, cache = asyncio.run(run())
+
+    assert hit is None
+    assert cache.get_stats()["stale_skips"] == 1
+
+
+def test_bounded_size_evicts_least_recently_used():
+    """测试容量有界，写满后淘汰最久未访问的条目"""
+    async def run():
+        cache = _cache()
+        await cache.astore("多久发货", "A", kb_version=0)
+        await cache.astore("怎么退货", "B", kb_version=0)
+        await cache.alookup("多久发货", kb_version=0)  # 发货条目变为最近访问
+        await cache.astore("运费多少", "C", kb_version=0)
+        return (
+            cache,
+            await cache.alookup("多久发货", kb_version=0),
+            await cache.alookup("怎么退货", kb_version=0),
+        )
+
+    cache, kept, evicted = asyncio.run(run())
+
+    assert cache.get_stats()["size"] == 2
+    assert cache.get_stats()["evictions"] == 1
+    assert kept["response"] == "A"
+    assert evicted is None
+
+
+def test_route_after_rag_skips_llm_on_cache_hit():
+    """测试语义缓存命中时工作流跳过 LLM 节点"""
+    assert route_after_rag({"semantic_cache_hit": True, "response": "答案"}) == "end"
+    assert route_after_rag({"semantic_cache_hit": False, "response": ""}) == "llm"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
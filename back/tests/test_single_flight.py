@@ -0,0 +1,85 @@
+"""
+查询合并（single-flight）测试
+"""
+import asyncio
+import pytest  # type: ignore
+from app.agent.single_flight import SingleFlight, coalesce_key
+from app.config import settings
+
+
+def test_concurrent_identical_queries_execute_once():
+    """测试相同查询同时到达时只执行一次"""
+    single_flight = SingleFlight()
+    calls = []
+
+    async def run():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"response": "七天无理由退货"}
+
+    async def main():
+        return await asyncio.gather(*[single_flight.do("1:退货政策", run) for _ in range(5)])
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(result == {"response": "七天无理由退货"} for result, _ in results)
+    assert [shared for _, shared in results].count(False) == 1
+
+    stats = single_flight.get_stats()
+    assert stats["executions"] == 1 and stats["coalesced"] == 4
+    assert stats["coalescing_ratio"] == pytest.approx(0.8)
+    assert stats["inflight"] == 0
+
+
+def test_leader_cancellation_does_not_affect_followers():
+    """测试发起请求被取消时等待方仍能拿到结果"""
+    single_flight = SingleFlight()
+
+    async def run():
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    async def main():
+        leader = asyncio.ensure_future(single_flight.do("k", run))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(single_flight.do("k", run))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(main()) == ("ok", True)
+
+
+def test_sequential_queries_are_not_coalesced():
+    """测试执行结束后的相同查询重新执行"""
+    single_flight = SingleFlight()
+    calls = []
+
+    async def run():
+        calls.append(1)
+        return len(calls)
+
+    async def main():
+        first = await single_flight.do("k", run)
+        await asyncio.sleep(0)
+        return first, await single_flight.do("k", run)
+
+    assert asyncio.run(main()) == ((1, False), (2, False))
+
+
+def test_coalesce_key_excludes_user_specific_queries(monkeypatch):
+    """测试订单查询、指定线程和关闭开关时不合并"""
+    monkeypatch.setattr(settings, "QUERY_COALESCING_ENABLED", True)
+    key = coalesce_key("退货政策是什么？", "default", 3)
+    assert key is not None and key.startswith("3:")
+    assert coalesce_key("退货政策是什么", "default", 3) == key
+    assert coalesce_key("退货政策是什么", "default", 4) != key
+    assert coalesce_key("查询订单 ORD-2024-001", "default", 3) is None
+    assert coalesce_key("退货政策是什么", "user-42", 3) is None
+
+    monkeypatch.setattr(settings, "QUERY_COALESCING_ENABLED", False)
+    assert coalesce_key("退货政策是什么", "default", 3) is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,86 @@
+"""
+推测检索测试
+"""
+import asyncio
+import time
+import pytest  # type: ignore
+from app.agent.intent_classifier import TieredIntentClassifier
+from app.agent.rag_agent import RAGAgent
+from app.agent.router_agent import RouterAgent
+from app.agent.speculation import SpeculationStats, SpeculativeRouter
+
+
+class FakeRouter:
+    def __init__(self, intent, delay=0.0):
+        self.intent = intent
+        self.delay = delay
+
+    async def process(self, state):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return {**state, "intent": self.intent, "intent_tier": "llm" if self.delay else "rules"}
+
+
+class FakeRAG:
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.calls = 0
+
+    async def process(self, state):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return {**state, "documents": [{"text": "退货政策"}], "kb_version": 3}
+
+
+class UndecidedClassifier:
+    """本地快速分类无法确定意图（需要 LLM 分类）"""
+
+    def classify_fast(self, text, record=True):
+        return None
+
+
+def test_rag_intent_reuses_overlapped_retrieval():
+    """测试意图为 rag 时复用与分类重叠执行的检索结果"""
+    stats = SpeculationStats()
+    rag = FakeRAG()
+    router = SpeculativeRouter(FakeRouter("rag", delay=0.05), rag, stats, UndecidedClassifier())
+    result = asyncio.run(router.process({"input": "退货政策是什么"}))
+    assert result["rag_prefetched"] and result["documents"] == [{"text": "退货政策"}]
+    assert result["kb_version"] == 3 and rag.calls == 1
+    assert stats.get_stats()["used"] == 1 and stats.get_stats()["avg_saved_ms"] > 20
+    # rag 节点直接复用推测结果
+    assert asyncio.run(RAGAgent().process(result)) is result
+
+
+def test_other_intents_discard_or_cancel_retrieval():
+    """测试意图不是 rag 时取消检索：快速通道分类时检索尚未开始，LLM 分类时记录浪费的时间"""
+    stats = SpeculationStats()
+    rag = FakeRAG()
+    result = asyncio.run(SpeculativeRouter(FakeRouter("order"), rag, stats, UndecidedClassifier()).process({"input": "订单 ORD-2024-001"}))
+    assert "rag_prefetched" not in result and rag.calls == 0
+    asyncio.run(SpeculativeRouter(FakeRouter("chat", delay=0.02), rag, stats, UndecidedClassifier()).process({"input": "你好呀"}))
+    snapshot = stats.get_stats()
+    assert (snapshot["cancelled_before_start"], snapshot["discarded"]) == (1, 1)
+    assert snapshot["avg_wasted_ms"] > 10
+
+
+
+def test_locally_classified_queries_skip_retrieval_with_deadline():
+    """测试设置了延迟预算时，本地分类确定不含 rag 的查询不会启动推测检索"""
+    classifier = TieredIntentClassifier(threshold=0.75, training_data="", enabled=True)
+    router_agent = RouterAgent()
+    router_agent.classifier = classifier
+    stats = SpeculationStats()
+    rag = FakeRAG()
+    router = SpeculativeRouter(router_agent, rag, stats, classifier)
+
+    for text in ("你好", "订单 ORD-2024-001"):
+        result = asyncio.run(router.process({"input": text, "deadline": time.monotonic() + 8}))
+        assert "rag_prefetched" not in result
+    snapshot = stats.get_stats()
+    assert rag.calls == 0
+    assert (snapshot["skipped"], snapshot["discarded"], snapshot["cancelled_before_start"]) == (2, 0, 0)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])